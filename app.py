@@ -1,69 +1,39 @@
 import os
 import io
 import csv
-from typing import Any, Dict, Tuple, List
+import hashlib
+import json
+import time
+from datetime import date
+from typing import Any, Dict, Tuple, List, Optional
 
 import requests
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 import dotenv
-try:
-	import psycopg2
-	import psycopg2.extras
-except ImportError:
-	psycopg2 = None
+
+import metrics
+from autobot_db import get_campaign_stats_bulk
+from campaign_events import EventBroker, attach_to_store, format_sse, kpis_event
+from campaign_fields import LEAN_FIELDS, parse_fields, project_payload
+from campaign_records import campaign_timestamp, parse_timestamp
+from campaign_rollups import COMPARISONS, GRANULARITIES, MAX_PERIODS, MetricRollups, attach_rollups, date_to_day, day_number, periods_between
+from campaign_search import CampaignIndex, attach_index
+from campaign_store import CampaignStore
+from compression import init_compression
+from dash_mount import DashMount
+from media_upload import COMMAND as MEDIA_UPLOAD_COMMAND, MediaUpload, UploadError
+from request_profile import ProfileStore, init_profiling, is_admin, phase
+from flowbiz_fetch import call_accounts, fetch_all_accounts, merge_account_results, origin_label
+from flowbiz_webhooks import WebhookError, WebhookQueue, parse_events, verify_request
+from shared_snapshot import SharedSnapshot
+from subscriber_interactions import InteractionBatch, limiter_for, ndjson
+
 try:
 	import openpyxl
 except ImportError:
 	openpyxl = None
 
 
-def _get_db_campaign_stats_by_flowbiz_id(flowbiz_campaign_id: str) -> Dict[str, int]:
-	"""Busca Qtd Acessos e Qtd Leads usando o id_campanha_flowbiz."""
-	if not psycopg2:
-		return {"QtdAcessos": 0, "QtdLeads": 0}
-	
-	try:
-		conn = psycopg2.connect(
-			dbname=os.getenv('DB_NAME'),
-			user=os.getenv('DB_USER'),
-			password=os.getenv('DB_PASSWORD'),
-			host=os.getenv('DB_HOST'),
-			port=os.getenv('DB_PORT')
-		)
-		cur = conn.cursor()
-		
-		# Contar acessos
-		cur.execute(
-			"""
-			SELECT COUNT(*)
-			FROM autobot.campanha_acessos ca
-			JOIN autobot.campanhas c ON c.id = ca.campanha_id
-			WHERE c.id_campanha_flowbiz = %s
-			""",
-			(flowbiz_campaign_id,)
-		)
-		qtd_acessos = cur.fetchone()[0]
-		
-		# Contar leads (formularios)
-		cur.execute(
-			"""
-			SELECT COUNT(*)
-			FROM autobot.formulario f
-			JOIN autobot.campanhas c ON c.id = f.campanha_id
-			WHERE c.id_campanha_flowbiz = %s
-			""",
-			(flowbiz_campaign_id,)
-		)
-		qtd_leads = cur.fetchone()[0]
-		
-		cur.close()
-		conn.close()
-		
-		return {"QtdAcessos": qtd_acessos, "QtdLeads": qtd_leads}
-	except Exception as e:
-		print(f"Erro ao buscar stats da campanha {flowbiz_campaign_id}: {e}")
-		return {"QtdAcessos": 0, "QtdLeads": 0}
-
 def create_app() -> Flask:
 	dotenv.load_dotenv()
 	app = Flask(__name__)
@@ -82,6 +52,10 @@ def create_app() -> Flask:
 	app.config["FLOWBIZ_TIMEOUT_SECONDS"] = float(
 		os.getenv("FLOWBIZ_TIMEOUT_SECONDS", "20")
 	)
+	# Orçamento de latência (segundos) da listagem multi-conta; 0 desativa e espera todas as contas
+	app.config["FLOWBIZ_LIST_BUDGET_SECONDS"] = float(
+		os.getenv("FLOWBIZ_LIST_BUDGET_SECONDS", "5")
+	)
 
 	# Coletar todas as chaves da forma FLOWBIZ_API_KEY_* (várias contas)
 	api_keys = {k: v for k, v in os.environ.items() if k.startswith("FLOWBIZ_API_KEY_") and v}
@@ -89,6 +63,93 @@ def create_app() -> Flask:
 	api_keys = {k: v.strip().strip('"') for k, v in api_keys.items() if v and v.strip()}
 	app.config["FLOWBIZ_API_KEYS"] = api_keys
 
+	# Snapshot compartilhado do catálogo (KPIs do painel): renovado no máximo a cada TTL
+	app.config["CAMPAIGN_SNAPSHOT_TTL_SECONDS"] = float(
+		os.getenv("CAMPAIGN_SNAPSHOT_TTL_SECONDS", "60")
+	)
+	app.config["CAMPAIGN_SNAPSHOT_RECORDS"] = int(
+		os.getenv("CAMPAIGN_SNAPSHOT_RECORDS", "500")
+	)
+
+	def _fetch_catalog():
+		return fetch_all_accounts(
+			app.config["FLOWBIZ_ENDPOINT"],
+			app.config["FLOWBIZ_API_KEYS"],
+			app.config["CAMPAIGN_SNAPSHOT_RECORDS"],
+			app.config["FLOWBIZ_TIMEOUT_SECONDS"],
+			budget=app.config["FLOWBIZ_LIST_BUDGET_SECONDS"],
+			logger=app.logger,
+			fields=LEAN_FIELDS,
+		)
+
+	def _enrich_catalog(campaigns: List[Dict[str, Any]]) -> None:
+		# Leads e acessos do banco em duas consultas agrupadas (em vez de 2 por campanha)
+		stats = get_campaign_stats_bulk(c.get("CampaignID") for c in campaigns)
+		if stats is None:
+			# Banco fora do ar ou lento: contagens desconhecidas (None), não zero
+			for c in campaigns:
+				c["QtdLeads"] = None
+				c["QtdAcessos"] = None
+			return
+		for c in campaigns:
+			found = stats.get(str(c.get("CampaignID", "")), {})
+			c["QtdLeads"] = found.get("QtdLeads", 0)
+			c["QtdAcessos"] = found.get("QtdAcessos", 0)
+
+	# Vários workers: um só renova e grava o arquivo; os demais leem (mmap)
+	app.config["CAMPAIGN_SHARED_SNAPSHOT"] = os.getenv("CAMPAIGN_SHARED_SNAPSHOT", "").strip()
+	# Listagem servida pelo snapshot (snapshot) ou buscada a cada requisição (live)
+	app.config["CAMPAIGN_LIST_SOURCE"] = os.getenv("CAMPAIGN_LIST_SOURCE", "snapshot").strip().lower()
+	shared = None
+	if app.config["CAMPAIGN_SHARED_SNAPSHOT"]:
+		shared = SharedSnapshot(app.config["CAMPAIGN_SHARED_SNAPSHOT"])
+	app.extensions["campaign_store"] = CampaignStore(
+		_fetch_catalog,
+		enrich=_enrich_catalog,
+		ttl=app.config["CAMPAIGN_SNAPSHOT_TTL_SECONDS"],
+		logger=app.logger,
+		shared=shared,
+	)
+
+	# Canal SSE: conexões por worker limitadas e heartbeat para manter proxies abertos
+	app.config["SSE_MAX_CONNECTIONS"] = int(os.getenv("SSE_MAX_CONNECTIONS", "50"))
+	app.config["SSE_HEARTBEAT_SECONDS"] = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+	app.extensions["campaign_events"] = EventBroker(max_connections=app.config["SSE_MAX_CONNECTIONS"])
+	attach_to_store(app.extensions["campaign_events"], app.extensions["campaign_store"])
+	# Índice de busca (nome, assunto, origem), atualizado a cada nova versão do snapshot
+	app.extensions["campaign_search"] = CampaignIndex()
+	attach_index(app.extensions["campaign_search"], app.extensions["campaign_store"], logger=app.logger)
+	# Totais por (dia, origem) para tendências e gráficos agregados do painel
+	app.extensions["campaign_rollups"] = MetricRollups()
+	attach_rollups(app.extensions["campaign_rollups"], app.extensions["campaign_store"], logger=app.logger)
+
+	# Interações em lote: chamadas simultâneas por conta, intervalo mínimo e tamanho máximo da lista
+	app.config["SUBSCRIBER_BATCH_CONCURRENCY"] = int(os.getenv("SUBSCRIBER_BATCH_CONCURRENCY", "4"))
+	app.config["SUBSCRIBER_BATCH_MIN_INTERVAL_MS"] = float(os.getenv("SUBSCRIBER_BATCH_MIN_INTERVAL_MS", "0"))
+	app.config["SUBSCRIBER_BATCH_MAX_ITEMS"] = int(os.getenv("SUBSCRIBER_BATCH_MAX_ITEMS", "50000"))
+
+	# Upload de mídia multipart: tamanho máximo do arquivo e modo de envio (stream ou spool)
+	app.config["MEDIA_UPLOAD_MAX_BYTES"] = int(os.getenv("MEDIA_UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+	app.config["MEDIA_UPLOAD_MODE"] = os.getenv("MEDIA_UPLOAD_MODE", "stream").strip().lower()
+
+	# Webhooks do Flowbiz: segredo (vazio = desativado), fila limitada e intervalo entre lotes
+	app.config["FLOWBIZ_WEBHOOK_SECRET"] = os.getenv("FLOWBIZ_WEBHOOK_SECRET", "").strip()
+	app.config["WEBHOOK_MAX_BYTES"] = int(os.getenv("WEBHOOK_MAX_BYTES", str(1024 * 1024)))
+	app.extensions["flowbiz_webhooks"] = WebhookQueue(
+		app.extensions["campaign_store"],
+		max_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000")),
+		flush_seconds=float(os.getenv("WEBHOOK_FLUSH_SECONDS", "1")),
+		logger=app.logger,
+	)
+
+	# Perfil por requisição (admin): token, perfis guardados, intervalo de amostragem da pilha
+	app.config["PROFILE_TOKEN"] = os.getenv("PROFILE_TOKEN", "").strip()
+	app.config["PROFILE_SAMPLE_MS"] = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+	app.extensions["request_profiles"] = ProfileStore(
+		keep=int(os.getenv("PROFILE_KEEP", "50")),
+		directory=os.getenv("PROFILE_DIR", "").strip() or None,
+	)
+
 	# Map our internal endpoints to Flowbiz API methods.
 	route_map = {
 		"subscribers/get": "Subscribers.Get",
@@ -141,8 +202,27 @@ def create_app() -> Flask:
 		"tag/unassign-from-campaigns": "Tag.UnassignFromCampaigns",
 	}
 
-	def build_payload(method: str, data: Dict[str, Any]) -> Dict[str, Any]:
-		api_key = app.config["FLOWBIZ_API_KEY_Voxcall"].strip()
+	# Comandos só de leitura: podem ir para várias contas de uma vez (account=all)
+	fanout_commands = {
+		m for m in route_map.values()
+		if m.rsplit(".", 1)[-1].startswith(("Get", "Browse", "Retrieve")) or m == "Subscriber.Interactions"
+	}
+
+	def resolve_accounts(target: str) -> Dict[str, str]:
+		"""{variável da conta: chave} para `Voxcall`, `FLOWBIZ_API_KEY_Voxcall`, `A,B` ou `all`."""
+		api_keys = app.config["FLOWBIZ_API_KEYS"]
+		if target.strip().lower() == "all":
+			return dict(api_keys)
+		selected = {}
+		for name in (n.strip() for n in target.split(",") if n.strip()):
+			account = f"FLOWBIZ_API_KEY_{origin_label(name)}"
+			if account not in api_keys:
+				raise ValueError(f"Unknown account: {name}")
+			selected[account] = api_keys[account]
+		return selected
+
+	def build_payload(method: str, data: Dict[str, Any], api_key: Optional[str] = None) -> Dict[str, Any]:
+		api_key = (api_key if api_key is not None else app.config["FLOWBIZ_API_KEY_Voxcall"]).strip()
 		if not api_key:
 			raise ValueError("FLOWBIZ_API_KEY_Voxcall is not configured")
 
@@ -152,9 +232,9 @@ def create_app() -> Flask:
 		payload.update(data)
 		return payload
 
-	def call_flowbiz(method: str, data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+	def call_flowbiz(method: str, data: Dict[str, Any], api_key: Optional[str] = None, account: str = "Voxcall") -> Tuple[Dict[str, Any], int]:
 		try:
-			payload = build_payload(method, data)
+			payload = build_payload(method, data, api_key)
 		except ValueError as exc:
 			return {"error": str(exc)}, 500
 
@@ -164,8 +244,10 @@ def create_app() -> Flask:
 		timeout = app.config["FLOWBIZ_TIMEOUT_SECONDS"]
 
 		try:
-			response = requests.post(endpoint, data=payload, timeout=timeout)
+			with metrics.timer(metrics.FLOWBIZ_REQUEST_SECONDS, command=method, account=account):
+				response = requests.post(endpoint, data=payload, timeout=timeout)
 		except requests.RequestException as exc:
+			metrics.FLOWBIZ_ERRORS.inc(command=method, account=account)
 			return {"error": "Flowbiz request failed", "detail": str(exc)}, 502
 
 		try:
@@ -173,13 +255,46 @@ def create_app() -> Flask:
 		except ValueError:
 			return {"raw": response.text}, response.status_code
 
+	# Antes dos ganchos de métricas e compressão, para o perfil fechar por último
+	init_profiling(app)
+
+	@app.before_request
+	def _metrics_start() -> None:
+		# Liga a coleta neste worker se outro já foi raspado
+		if metrics.sync():
+			g.metrics_started = time.perf_counter()
+
+	@app.after_request
+	def _metrics_observe(response):
+		started = g.pop("metrics_started", None)
+		if started is not None:
+			metrics.HTTP_REQUEST_SECONDS.observe(
+				time.perf_counter() - started,
+				endpoint=request.endpoint or "unknown",
+				method=request.method,
+				status=response.status_code,
+			)
+		return response
+
+	# gzip/brotli para respostas JSON grandes (depois das métricas de latência)
+	init_compression(app)
+
 	@app.get("/health")
 	def health() -> Tuple[Dict[str, Any], int]:
 		return {"status": "ok"}, 200
 
+	@app.get("/metrics")
+	def metrics_endpoint() -> Response:
+		# O primeiro scrape liga a coleta; antes disso os instrumentos não custam nada
+		metrics.enable()
+		return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 	@app.get("/api")
 	def list_routes() -> Tuple[Dict[str, Any], int]:
-		return {"routes": sorted(route_map.keys())}, 200
+		return {
+			"routes": sorted(route_map.keys()),
+			"accounts": sorted(origin_label(a) for a in app.config["FLOWBIZ_API_KEYS"]),
+		}, 200
 
 	@app.post("/api/<path:route_key>")
 	def proxy(route_key: str) -> Tuple[Dict[str, Any], int]:
@@ -191,9 +306,136 @@ def create_app() -> Flask:
 		if not isinstance(data, dict):
 			return {"error": "Invalid JSON body, expected object"}, 400
 
-		payload, status = call_flowbiz(method, data)
-		return jsonify(payload), status
+		# Campanhas: projeção enxuta por padrão (fields=all devolve o objeto completo)
+		fields = None
+		if route_key in ("campaign/get", "campaigns/get"):
+			fields = parse_fields(data.pop("fields", None) or request.args.get("fields"))
+
+		# Conta alvo: sem `account`, a padrão (Voxcall); `all` ou `A,B` só para leituras
+		target = str(data.pop("account", None) or request.args.get("account") or "").strip()
+		if not target:
+			payload, status = call_flowbiz(method, data)
+			payload = project_payload(payload, fields)
+		else:
+			try:
+				accounts = resolve_accounts(target)
+			except ValueError as exc:
+				return {"error": str(exc), "accounts": sorted(origin_label(a) for a in app.config["FLOWBIZ_API_KEYS"])}, 400
+			if not accounts:
+				return {"error": "No Flowbiz accounts configured"}, 500
+			if len(accounts) == 1 and target.lower() != "all":
+				account, api_key = next(iter(accounts.items()))
+				payload, status = call_flowbiz(method, data, api_key, origin_label(account))
+				payload = project_payload(payload, fields)
+			elif method not in fanout_commands:
+				return {"error": f"{method} is not a read command and cannot target several accounts"}, 400
+			else:
+				def call(account: str, api_key: str) -> Tuple[Dict[str, Any], int]:
+					result, code = call_flowbiz(method, dict(data), api_key, origin_label(account))
+					return project_payload(result, fields), code
+
+				with phase("fanout", method):
+					payload, ok = merge_account_results(call_accounts(call, accounts))
+				status = 200 if ok else 502
+		with metrics.timer(metrics.JSON_ENCODE_SECONDS, endpoint="proxy"):
+			response = jsonify(payload)
+		return response, status
+
 
+	@app.post("/api/media/upload")
+	def media_upload() -> Tuple[Dict[str, Any], int]:
+		"""`Media.Upload` a partir de um multipart (campo de arquivo + MediaName/MediaType opcionais).
+
+		O arquivo é codificado e repassado ao Flowbiz aos pedaços, sem ficar inteiro em
+		memória; a resposta do Flowbiz volta com `Upload` (bytes, segundos e MB/s).
+		Corpos JSON (MediaData já em base64) seguem pelo proxy genérico. Corpo do cliente
+		malformado ou incompleto (inclusive conexão caída no meio) é 400; 502 fica para
+		falhas da chamada ao Flowbiz.
+		"""
+		if request.mimetype != "multipart/form-data":
+			return proxy("media/upload")
+		max_bytes = app.config["MEDIA_UPLOAD_MAX_BYTES"]
+		# Cabeçalhos do multipart cabem na folga; acima disso nem começar a ler
+		if request.content_length and request.content_length > max_bytes + 64 * 1024:
+			return {"error": f"File exceeds {max_bytes} bytes"}, 413
+		try:
+			upload = MediaUpload(request.stream, request.content_type, max_bytes)
+			upload.read_until_file()
+		except UploadError as exc:
+			return {"error": str(exc)}, exc.status
+		except ValueError as exc:
+			return {"error": "Malformed multipart body", "detail": str(exc)}, 400
+
+		account = origin_label(request.args.get("account") or upload.fields.get("account") or "Voxcall")
+		api_key = app.config["FLOWBIZ_API_KEYS"].get(f"FLOWBIZ_API_KEY_{account}")
+		if not api_key:
+			return {"error": "Unknown account", "account": account}, 404
+		params = {
+			"APIKey": api_key,
+			app.config["FLOWBIZ_METHOD_PARAM"]: MEDIA_UPLOAD_COMMAND,
+			"ResponseFormat": app.config["FLOWBIZ_RESPONSE_FORMAT"],
+		}
+		endpoint = app.config["FLOWBIZ_ENDPOINT"]
+		if app.config["FLOWBIZ_APPEND_METHOD_PATH"]:
+			endpoint = endpoint.rstrip("/") + f"/{MEDIA_UPLOAD_COMMAND}"
+		headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+		started = time.perf_counter()
+		try:
+			with metrics.timer(metrics.FLOWBIZ_REQUEST_SECONDS, command=MEDIA_UPLOAD_COMMAND, account=account):
+				if app.config["MEDIA_UPLOAD_MODE"] == "spool":
+					with upload.spooled_body(params) as body:
+						response = requests.post(endpoint, data=body, headers=headers,
+												 timeout=app.config["FLOWBIZ_TIMEOUT_SECONDS"])
+				else:
+					response = requests.post(endpoint, data=upload.body(params), headers=headers,
+											 timeout=app.config["FLOWBIZ_TIMEOUT_SECONDS"])
+		except UploadError as exc:
+			return {"error": str(exc)}, exc.status
+		except (requests.RequestException, ValueError) as exc:
+			# Erro no gerador do corpo (lado do cliente) pode chegar embrulhado pelo requests
+			if upload.error is not None:
+				return {"error": str(upload.error)}, upload.error.status
+			metrics.FLOWBIZ_ERRORS.inc(command=MEDIA_UPLOAD_COMMAND, account=account)
+			return {"error": "Flowbiz request failed", "detail": str(exc)}, 502
+
+		try:
+			payload = response.json()
+		except ValueError:
+			payload = {"raw": response.text}
+		if not isinstance(payload, dict):
+			payload = {"response": payload}
+		payload["Upload"] = upload.stats(time.perf_counter() - started)
+		return payload, response.status_code
+
+	def _list_from_snapshot(data: Dict[str, Any]) -> Dict[str, Any]:
+		"""Página da listagem a partir do snapshot (já ordenado e com leads/acessos do banco)."""
+		with phase("snapshot"):
+			snap = app.extensions["campaign_store"].snapshot()
+		table = snap.table
+		per_page = int(str(data.get("RecordsPerRequest", "10")))
+		start = int(str(data.get("RecordsFrom", "0")))
+		with phase("sort"):
+			order = table.order_by_time()
+			status_filter = str(data.get("CampaignStatus", "")).strip()
+			if status_filter and status_filter.lower() != "all":
+				statuses = table.column("status")
+				order = [i for i in order if statuses[i] == status_filter]
+		with phase("page"):
+			campaigns = [table.record(i).to_dict() for i in order[start:start + per_page]]
+		# Idade dos dados agora: a da busca mais o tempo desde que o snapshot foi montado
+		snap_age = max(0, int(time.time() - snap.built_at))
+		accounts = [
+			dict(a, DataAgeSeconds=a["DataAgeSeconds"] + snap_age) if a.get("DataAgeSeconds") is not None else a
+			for a in snap.accounts
+		]
+		return {
+			"TotalCampaigns": len(order),
+			"Campaigns": campaigns,
+			"Partial": snap.partial,
+			"Accounts": accounts,
+			"Version": snap.version,
+		}
 
 	def _manage_campaigns(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
 		action = str(data.pop("action", "")).strip().lower().replace("_", "-")
@@ -328,8 +570,21 @@ def create_app() -> Flask:
 				"error": "Invalid action",
 				"allowed": sorted(actions_map.keys()),
 			}, 400
+		# Listagem padrão (sem projeção explícita): servida pelo snapshot compartilhado,
+		# sem buscar Flowbiz nem Postgres por requisição
+		if action == "list" and not data.get("fields") and app.config["CAMPAIGN_LIST_SOURCE"] == "snapshot":
+			payload = _list_from_snapshot(data)
+			with metrics.timer(metrics.JSON_ENCODE_SECONDS, endpoint="campaigns_manage"):
+				response = jsonify(payload)
+			return response, 200
+		deadline = None
 		# Apply defaults for list action
 		if action == "list":
+			# Projeção aplicada por conta, antes do cache de último resultado bom e da união
+			fields = parse_fields(data.pop("fields", None))
+			budget = app.config["FLOWBIZ_LIST_BUDGET_SECONDS"]
+			# O orçamento cobre a busca no Flowbiz (até 80% dele) e as contagens do banco depois dela
+			deadline = time.monotonic() + budget if budget and budget > 0 else None
 			data.setdefault("RecordsPerRequest", "10")
 			data.setdefault("RecordsFrom", "0")
 			# Ordenar por data de envio por padrão (mais recentes primeiro)
@@ -340,73 +595,38 @@ def create_app() -> Flask:
 			per_page = int(str(data.get("RecordsPerRequest", "10")))
 			start = int(str(data.get("RecordsFrom", "0")))
 			api_keys = app.config.get("FLOWBIZ_API_KEYS", {})
-			merged = []
-			endpoint = app.config["FLOWBIZ_ENDPOINT"]
-			timeout = app.config["FLOWBIZ_TIMEOUT_SECONDS"]
-			for name, key in api_keys.items():
-				try:
-					# Escolher quantos registros requisitar por conta.
-					# Antes: max(per_page * 3, per_page) — às vezes omitia envios recentes.
-					# Agora: buscar mais (multiplicador 10), com limites para evitar cargas excessivas.
-					local_records = min(max(per_page * 10, 100), 500)
-					local_payload = {
-						"APIKey": key,
-						"Command": "Campaigns.Get",
-						"RecordsPerRequest": str(local_records),
-						"ResponseFormat": "JSON"
-					}
-					# aplicar filtro de status se presente
-					if "CampaignStatus" in data:
-						local_payload["CampaignStatus"] = data["CampaignStatus"]
-					res = requests.post(endpoint, data=local_payload, timeout=timeout)
-					app.logger.debug(f"Account {name} response status: {res.status_code} (requested {local_records})")
-					d = res.json()
-					campaigns = d.get("Campaigns") if isinstance(d, dict) else None
-					app.logger.debug(f"Account {name} returned campaigns count: {len(campaigns) if campaigns else 0}")
-					if campaigns:
-						for c in campaigns:
-							# Keep raw origin key and add a display-friendly Origin field
-							c["_origin_api"] = name
-							try:
-								c["Origin"] = name.replace('FLOWBIZ_API_KEY_', '')
-							except Exception:
-								c["Origin"] = name
-							merged.append(c) 
-				except Exception as e:
-					app.logger.exception(f"Error fetching campaigns for {name}: {e}")
-			# ordenar por data de envio (SendProcessFinishedOn / SendDate / CreateDateTime)
-			import datetime as _dt
-			def _parse_dt(c):
-				s = c.get("SendProcessFinishedOn") or c.get("SendDate") or c.get("CreateDateTime")
-				if not s:
-					return _dt.datetime.min
-				s_str = str(s).strip()
-				# Normalizar separadores e formatos comuns (ex.: "10/02/2026 - 09:32")
-				s_clean = s_str.replace(' - ', ' ').replace('/', '-').replace('.', '-')
-				# Tentar múltiplos formatos: ISO/ano-mês-dia e dia-mês-ano
-				formats = (
-					"%Y-%m-%d %H:%M:%S",
-					"%Y-%m-%dT%H:%M:%S",
-					"%Y-%m-%d",
-					"%d-%m-%Y %H:%M:%S",
-					"%d-%m-%Y %H:%M",
-					"%d-%m-%Y",
+			# Escolher quantos registros requisitar por conta.
+			# Antes: max(per_page * 3, per_page) — às vezes omitia envios recentes.
+			# Agora: buscar mais (multiplicador 10), com limites para evitar cargas excessivas.
+			local_records = min(max(per_page * 10, 100), 500)
+			extra = {}
+			# aplicar filtro de status se presente
+			if "CampaignStatus" in data:
+				extra["CampaignStatus"] = data["CampaignStatus"]
+			# Contas consultadas em paralelo; o que não responder dentro do orçamento
+			# entra com o último resultado bom (Status "stale") ou fica de fora.
+			# Contas buscadas em threads: o perfil mostra o tempo total da busca
+			with phase("fetch", "Campaigns.Get"):
+				merged, accounts_status, partial = fetch_all_accounts(
+					app.config["FLOWBIZ_ENDPOINT"],
+					api_keys,
+					local_records,
+					app.config["FLOWBIZ_TIMEOUT_SECONDS"],
+					budget=budget * 0.8 if deadline is not None else budget,
+					extra=extra,
+					logger=app.logger,
+					fields=fields,
 				)
-				for fmt in formats:
-					try:
-						return _dt.datetime.strptime(s_clean, fmt)
-					except Exception:
-						continue
-				# Tentativa final com ISO no texto original
-				try:
-					return _dt.datetime.fromisoformat(s_str.replace(' ', 'T'))
-				except Exception:
-						pass
-			# Se nada funcionar, retornar a data mínima para tratar como mais antiga
-				return _dt.datetime.min
-			merged_sorted = sorted(merged, key=_parse_dt, reverse=True)
+			# ordenar por data de envio (SendProcessFinishedOn / SendDate / CreateDateTime)
+			with phase("sort"):
+				merged_sorted = sorted(merged, key=campaign_timestamp, reverse=True)
 			total = len(merged_sorted)
-			payload = {"TotalCampaigns": total, "Campaigns": merged_sorted[start:start+per_page]}
+			payload = {
+				"TotalCampaigns": total,
+				"Campaigns": merged_sorted[start:start+per_page],
+				"Partial": partial,
+				"Accounts": accounts_status,
+			}
 			status = 200
 		else:
 			payload, status = call_flowbiz(method, data)
@@ -418,27 +638,31 @@ def create_app() -> Flask:
 				endpoint = app.config["FLOWBIZ_ENDPOINT"]
 				timeout = app.config["FLOWBIZ_TIMEOUT_SECONDS"]
 				default_api_key = app.config.get("FLOWBIZ_API_KEY_Voxcall", "").strip()
-				
-				for campaign in payload.get("Campaigns", []):
+
+				# Leads e acessos da página numa consulta agrupada, com o que resta do
+				# orçamento; None (desconhecido) para a página toda se o banco não respondeu
+				page = payload.get("Campaigns", [])
+				remaining_ms = None if deadline is None else int((deadline - time.monotonic()) * 1000)
+				if remaining_ms is not None and remaining_ms <= 0:
+					page_stats = None
+				else:
+					page_stats = get_campaign_stats_bulk((c.get("CampaignID") for c in page), timeout_ms=remaining_ms)
+
+				for campaign in page:
 					# Assegurar que exista campo legível de origem
 					origin_key = campaign.get("_origin_api")
 					if not campaign.get("Origin"):
-						try:
-							campaign["Origin"] = origin_key.replace('FLOWBIZ_API_KEY_', '') if origin_key else '-'
-						except Exception:
-							campaign["Origin"] = origin_key or '-'
-					
-					# Inicializar campos de contagem
-					campaign["QtdLeads"] = 0
-					campaign["QtdAcessos"] = 0
-					
-					# Buscar stats direto pelo id_campanha_flowbiz
-					campaign_flowbiz_id = str(campaign.get("CampaignID", ""))
-					if campaign_flowbiz_id:
-						stats = _get_db_campaign_stats_by_flowbiz_id(campaign_flowbiz_id)
-						campaign["QtdLeads"] = stats.get("QtdLeads", 0)
-						campaign["QtdAcessos"] = stats.get("QtdAcessos", 0)
-					
+						campaign["Origin"] = origin_label(origin_key)
+
+					# Contagens pelo id_campanha_flowbiz
+					if page_stats is None:
+						campaign["QtdLeads"] = None
+						campaign["QtdAcessos"] = None
+					else:
+						found = page_stats.get(str(campaign.get("CampaignID", "")).strip(), {})
+						campaign["QtdLeads"] = found.get("QtdLeads", 0)
+						campaign["QtdAcessos"] = found.get("QtdAcessos", 0)
+
 					# Usar métricas já presentes na listagem quando disponíveis
 					try:
 						existing_sent = int(campaign.get("TotalSent", 0) or 0)
@@ -481,8 +705,277 @@ def create_app() -> Flask:
 			except Exception:
 				# Se houver erro geral, apenas retornar sem as estadísticas
 				pass
-		
-			return jsonify(payload), status
+
+		with metrics.timer(metrics.JSON_ENCODE_SECONDS, endpoint="campaigns_manage"):
+			response = jsonify(payload)
+		return response, status
+
+	@app.get("/api/campaigns/search")
+	def search_campaigns() -> Tuple[Dict[str, Any], int]:
+		"""Busca por nome, assunto e origem: ?q=atualiz&status=Sent&origin=Voxcall&from=2026-01-01&to=2026-01-31."""
+		args = request.args
+		try:
+			limit = max(1, min(int(args.get("limit", "20")), 200))
+			offset = max(0, int(args.get("offset", "0")))
+		except ValueError:
+			return {"error": "limit/offset must be integers"}, 400
+		date_from = parse_timestamp(args.get("from")) if args.get("from") else None
+		date_to = parse_timestamp(args.get("to")) if args.get("to") else None
+		if date_from != date_from or date_to != date_to:
+			return {"error": "Invalid date (expected YYYY-MM-DD)"}, 400
+		if date_to is not None and len(args.get("to", "").strip()) == 10:
+			date_to += 86399  # data sem hora: incluir o dia inteiro
+		# Garante que o índice reflita o snapshot atual (primeira carga ou arquivo compartilhado novo)
+		app.extensions["campaign_store"].snapshot()
+		result = app.extensions["campaign_search"].search(
+			args.get("q", ""),
+			status=args.get("status") or None,
+			origin=args.get("origin") or None,
+			date_from=date_from,
+			date_to=date_to,
+			limit=limit,
+			offset=offset,
+		)
+		return result, 200
+
+	@app.get("/api/campaigns/trends")
+	def campaign_trends():
+		"""Séries e comparação de períodos: ?from=2026-03-01&to=2026-03-31&origin=Voxcall&granularity=week&compare=year."""
+		args = request.args
+		granularity = args.get("granularity", "day").strip().lower()
+		compare = args.get("compare", "previous").strip().lower()
+		if granularity not in GRANULARITIES:
+			return {"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}, 400
+		if compare not in COMPARISONS:
+			return {"error": f"compare must be one of {', '.join(COMPARISONS)}"}, 400
+		first = day_number(parse_timestamp(args.get("from"))) if args.get("from") else None
+		last = day_number(parse_timestamp(args.get("to"))) if args.get("to") else None
+		if (args.get("from") and first is None) or (args.get("to") and last is None):
+			return {"error": "Invalid date (expected YYYY-MM-DD)"}, 400
+		# Padrão: os 30 dias até hoje
+		if last is None:
+			last = date_to_day(date.today()) if first is None else first + 29
+		if first is None:
+			first = last - 29
+		if first > last:
+			return {"error": "from must not be after to"}, 400
+		if periods_between(first, last, granularity) > MAX_PERIODS:
+			return {"error": f"Too many periods (max {MAX_PERIODS}); use a coarser granularity"}, 400
+		# Garante que os totais reflitam o snapshot atual
+		app.extensions["campaign_store"].snapshot()
+		body = app.extensions["campaign_rollups"].trends(
+			first, last, origin=args.get("origin") or None, granularity=granularity, compare=compare,
+		)
+		with metrics.timer(metrics.JSON_ENCODE_SECONDS, endpoint="campaign_trends"):
+			response = jsonify(body)
+		response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+		response.headers["Cache-Control"] = "no-cache"
+		return response.make_conditional(request)
+
+	@app.post("/api/subscriber/interactions/batch")
+	def subscriber_interactions_batch() -> Response:
+		"""`Subscriber.Interactions` de vários contatos, em NDJSON à medida que as respostas chegam.
+
+		Corpo: {"subscribers": [IDs, e-mails ou objetos]} ou {"ListID": "123"}, mais
+		"account" (padrão Voxcall), "concurrency" e "resume" (token de um checkpoint).
+		"""
+		data = request.get_json(silent=True) or {}
+		if not isinstance(data, dict):
+			return jsonify({"error": "Invalid JSON body, expected object"}), 400
+		subscribers = data.get("subscribers")
+		list_id = data.get("ListID") or data.get("list_id")
+		if (subscribers is None) == (not list_id):
+			return jsonify({"error": "Provide either 'subscribers' or 'ListID'"}), 400
+		if subscribers is not None:
+			if not isinstance(subscribers, list):
+				return jsonify({"error": "'subscribers' must be a list"}), 400
+			if len(subscribers) > app.config["SUBSCRIBER_BATCH_MAX_ITEMS"]:
+				return jsonify({"error": f"Too many subscribers (max {app.config['SUBSCRIBER_BATCH_MAX_ITEMS']}); use ListID"}), 413
+		account = origin_label(str(data.get("account") or "Voxcall"))
+		api_key = app.config["FLOWBIZ_API_KEYS"].get(f"FLOWBIZ_API_KEY_{account}")
+		if not api_key:
+			return jsonify({"error": "Unknown account", "account": account}), 404
+		max_concurrency = app.config["SUBSCRIBER_BATCH_CONCURRENCY"]
+		try:
+			concurrency = max(1, min(int(data.get("concurrency") or max_concurrency), max_concurrency))
+		except (TypeError, ValueError):
+			return jsonify({"error": "concurrency must be an integer"}), 400
+
+		endpoint = app.config["FLOWBIZ_ENDPOINT"]
+		if app.config["FLOWBIZ_APPEND_METHOD_PATH"]:
+			endpoint = endpoint.rstrip("/") + "/Subscriber.Interactions"
+		# O limite por conta é comum a todos os lotes do worker; `concurrency` só reduz o deste
+		limiter = limiter_for(account, max_concurrency, app.config["SUBSCRIBER_BATCH_MIN_INTERVAL_MS"] / 1000.0)
+		batch = InteractionBatch(
+			endpoint, account, api_key, app.config["FLOWBIZ_TIMEOUT_SECONDS"], limiter,
+			subscribers=subscribers, list_id=list_id, concurrency=concurrency, logger=app.logger,
+		)
+		if data.get("resume"):
+			try:
+				batch.cursor = batch.cursor_from_token(str(data["resume"]))
+			except ValueError as exc:
+				return jsonify({"error": str(exc)}), 400
+		return Response(
+			ndjson(batch.stream()),
+			mimetype="application/x-ndjson",
+			headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+		)
+
+	@app.post("/api/webhooks/flowbiz")
+	def flowbiz_webhook() -> Tuple[Dict[str, Any], int]:
+		"""Eventos do Flowbiz (sent/open/click) aplicados aos contadores do snapshot em lotes.
+
+		Autenticação: `?token=<FLOWBIZ_WEBHOOK_SECRET>` ou cabeçalho `X-Flowbiz-Signature:
+		sha256=<HMAC do corpo>`. A conta vem do evento (`Origin`) ou de `?account=`.
+		"""
+		secret = app.config["FLOWBIZ_WEBHOOK_SECRET"]
+		if not secret:
+			return {"error": "Webhook receiver disabled"}, 404
+		if request.content_length and request.content_length > app.config["WEBHOOK_MAX_BYTES"]:
+			return {"error": "Payload too large"}, 413
+		body = request.get_data(cache=True)
+		try:
+			verify_request(secret, body, request.headers, request.args.get("token"))
+		except WebhookError as exc:
+			return {"error": str(exc)}, exc.status
+		if request.mimetype in ("application/x-www-form-urlencoded", "multipart/form-data"):
+			payload = request.form.to_dict()
+		else:
+			try:
+				payload = json.loads(body or b"null")
+			except ValueError:
+				return {"error": "Invalid JSON body"}, 400
+		account = request.args.get("account")
+		events, rejected = parse_events(payload, origin_label(account) if account else None)
+		if not events:
+			return {"accepted": 0, "rejected": rejected}, 400 if rejected else 200
+		queue = app.extensions["flowbiz_webhooks"]
+		if not queue.offer(events):
+			return {"error": "Webhook queue full", "queued": len(queue)}, 503, {"Retry-After": "5"}
+		return {"accepted": len(events), "rejected": rejected, "queued": len(queue)}, 202
+
+	@app.get("/api/webhooks/flowbiz/status")
+	def flowbiz_webhook_status() -> Tuple[Dict[str, Any], int]:
+		return app.extensions["flowbiz_webhooks"].status(), 200
+
+	@app.get("/api/profiles")
+	def list_profiles() -> Tuple[Dict[str, Any], int]:
+		"""Perfis recentes (resumo). Exige `PROFILE_TOKEN` como nas requisições perfiladas."""
+		if not app.config["PROFILE_TOKEN"]:
+			return {"error": "Profiling disabled"}, 404
+		if not is_admin(app):
+			return {"error": "Invalid profile token"}, 403
+		return {"Profiles": app.extensions["request_profiles"].recent()}, 200
+
+	@app.get("/api/profiles/enable")
+	def enable_profiling() -> Response:
+		"""Grava o cookie que perfila as próximas requisições do navegador (inclusive o Dash).
+
+		`?stack=1` liga também as amostras de pilha; `?off=1` remove os cookies.
+		"""
+		if not app.config["PROFILE_TOKEN"]:
+			return jsonify({"error": "Profiling disabled"}), 404
+		if not is_admin(app):
+			return jsonify({"error": "Invalid profile token"}), 403
+		off = request.args.get("off") == "1"
+		response = jsonify({"profiling": not off, "stack": request.args.get("stack") == "1" and not off})
+		if off:
+			response.delete_cookie("_profile")
+			response.delete_cookie("_profile_stack")
+			return response
+		cookie = {"max_age": 3600, "httponly": True, "samesite": "Strict", "secure": request.is_secure}
+		response.set_cookie("_profile", app.config["PROFILE_TOKEN"], **cookie)
+		if request.args.get("stack") == "1":
+			response.set_cookie("_profile_stack", "1", **cookie)
+		else:
+			response.delete_cookie("_profile_stack")
+		return response
+
+	@app.get("/api/profiles/<profile_id>")
+	def download_profile(profile_id: str):
+		"""Perfil completo em JSON ou, com `?format=folded`, as pilhas amostradas (flamegraph)."""
+		if not app.config["PROFILE_TOKEN"]:
+			return {"error": "Profiling disabled"}, 404
+		if not is_admin(app):
+			return {"error": "Invalid profile token"}, 403
+		record = app.extensions["request_profiles"].get(profile_id)
+		if record is None:
+			return {"error": "Profile not found"}, 404
+		disposition = {"Content-Disposition": f"attachment; filename=profile-{profile_id}"}
+		if request.args.get("format") == "folded":
+			disposition["Content-Disposition"] += ".folded"
+			return Response(record.get("Folded", ""), mimetype="text/plain", headers=disposition)
+		body = {k: v for k, v in record.items() if k != "Folded"}
+		if request.args.get("download") == "1":
+			disposition["Content-Disposition"] += ".json"
+			return Response(
+				json.dumps(body, ensure_ascii=False, indent=1),
+				mimetype="application/json",
+				headers=disposition,
+			)
+		return body, 200
+
+	@app.get("/api/events")
+	def campaign_events() -> Response:
+		"""Stream SSE com diffs de campanhas (`campaigns`) e totais (`kpis`).
+
+		Reconexões com Last-Event-ID recebem os eventos perdidos; se o histórico já
+		não cobre a lacuna, chega um `reset` e o cliente deve recarregar os dados.
+		"""
+		broker = app.extensions["campaign_events"]
+		store = app.extensions["campaign_store"]
+		if not broker.try_acquire():
+			return Response(
+				'{"error": "Too many event stream connections"}',
+				status=503,
+				mimetype="application/json",
+				headers={"Retry-After": "30"},
+			)
+		heartbeat = app.config["SSE_HEARTBEAT_SECONDS"]
+		raw_last_id = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+		try:
+			resume_from = int(raw_last_id) if raw_last_id else None
+		except ValueError:
+			resume_from = None
+
+		def stream():
+			try:
+				yield "retry: 5000\n\n"
+				last_id = broker.last_id
+				if resume_from is None:
+					# Primeira conexão: estado atual como linha de base
+					snap = store.current
+					if snap is not None:
+						yield format_sse(last_id, "kpis", kpis_event(snap))
+				else:
+					missed = broker.events_after(resume_from)
+					if missed is None:
+						yield format_sse(last_id, "reset", {"reason": "history-gap"})
+					else:
+						for event_id, event, data in missed:
+							yield format_sse(event_id, event, data)
+							last_id = event_id
+				while True:
+					# Quem está conectado mantém o snapshot renovado (uma renovação por vez)
+					store.snapshot()
+					events = broker.wait(last_id, heartbeat)
+					if events is None:
+						last_id = broker.last_id
+						yield format_sse(last_id, "reset", {"reason": "history-gap"})
+					elif events:
+						for event_id, event, data in events:
+							yield format_sse(event_id, event, data)
+							last_id = event_id
+					else:
+						yield ": heartbeat\n\n"
+			finally:
+				broker.release()
+
+		return Response(
+			stream(),
+			mimetype="text/event-stream",
+			headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+		)
 
 	# Listas e contatos removidos: _manage_lists, _manage_contacts, rotas e helper de importação foram excluídos conforme solicitado.
 	# (Mantendo apenas funcionalidades relacionadas a campanhas)
@@ -565,32 +1058,54 @@ def create_app() -> Flask:
 		from flask import send_from_directory
 		return send_from_directory(os.path.join(os.path.dirname(__file__), "static"), filename)
 
-	# Inicializar Dash (opcional). Se o módulo não existir ou houver erro, apenas logar e continuar.
-	try:
-		from dashboard_app import init_dash
-		init_dash(app)
-	except Exception as e:
-		app.logger.warning(f"Dash não inicializado: {e}")
-		msg = str(e)
-		# Rota fallback amigável para informar que o Dash não está disponível
-		@app.route("/dash")
-		def _dash_redirect():
-			from flask import redirect
-			# Redireciona para a versão com barra
-			return redirect("/dash/")
-
-		@app.route("/dash/")
-		def _dash_unavailable():
-			return (
-				"<h3>Dash não inicializado</h3>"
-				f"<p>Motivo: {msg}</p>"
-				"<p>Instale as dependências: <code>pip install dash plotly dash-bootstrap-components pandas</code></p>"
-				"<p>Após, reinicie a aplicação e abra <a href='/dash/'>/dash/</a>.</p>"
-			), 200
-
-		@app.route('/dash/status')
-		def _dash_status():
-			return {"status": "dash-unavailable", "reason": msg}, 200
+	# KPIs do painel servidos a partir do snapshot mantido (sem ir ao Flowbiz por requisição).
+	# Suporta ETag/If-None-Match: abas abertas recebem 304 enquanto nada mudou.
+	# Fica no app principal para que o polling não force a montagem do Dash.
+	@app.route("/dash/metrics")
+	def _dash_metrics():
+		try:
+			snap = app.extensions["campaign_store"].snapshot()
+			body = dict(kpis_event(snap), status="ok")
+			response = jsonify(body)
+			response.set_etag(hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest())
+			# no-cache: o navegador guarda a resposta mas revalida sempre com If-None-Match
+			response.headers["Cache-Control"] = "no-cache"
+			return response.make_conditional(request)
+		except Exception as exc:
+			app.logger.exception("Erro em /dash/metrics: %s", exc)
+			return jsonify({"count": 0, "error": str(exc), "status": "exception"}), 500
+
+	# Dash (opcional) montado sob /dash: "lazy" (no primeiro acesso), "eager" (já aqui,
+	# útil com gunicorn --preload) ou "off". Se o módulo não existir ou houver erro,
+	# apenas logar e continuar — as rotas abaixo informam o motivo.
+	app.config["DASH_MOUNT"] = os.getenv("DASH_MOUNT", "lazy").strip().lower()
+	dash_mount = DashMount(app, mode=app.config["DASH_MOUNT"])
+	app.extensions["dash_mount"] = dash_mount
+
+	# Rota fallback amigável para informar que o Dash não está disponível
+	@app.route("/dash")
+	def _dash_redirect():
+		from flask import redirect
+		# Redireciona para a versão com barra
+		return redirect("/dash/")
+
+	@app.route("/dash/")
+	def _dash_unavailable():
+		return (
+			"<h3>Dash não inicializado</h3>"
+			f"<p>Motivo: {dash_mount.error}</p>"
+			"<p>Instale as dependências: <code>pip install dash plotly dash-bootstrap-components pandas</code></p>"
+			"<p>Após, reinicie a aplicação e abra <a href='/dash/'>/dash/</a>.</p>"
+		), 200
+
+	@app.route('/dash/status')
+	def _dash_status():
+		body = {"status": dash_mount.status, "mode": dash_mount.mode}
+		if dash_mount.error:
+			body["reason"] = dash_mount.error
+		if dash_mount.load_seconds is not None:
+			body["load_ms"] = round(dash_mount.load_seconds * 1000, 1)
+		return body, 200
 
 	return app
 
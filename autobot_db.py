@@ -0,0 +1,341 @@
+"""Consultas de estatísticas das campanhas no PostgreSQL (schema `autobot`).
+
+As conexões vêm de um pool pequeno por processo (`DB_POOL_MAX`); com
+`DB_REPLICA_DSN`, as leituras vão para a réplica (e para o primário se a réplica
+não aceitar conexão). Cada consulta é preparada no servidor uma vez por conexão
+(`PREPARE`) e depois só executada (`EXECUTE`), e roda com `statement_timeout`
+próprio (`SET LOCAL`, na mesma ida ao banco).
+
+Banco fora do ar, lento ou sem `psycopg2` não viram zero: as funções devolvem
+None ("desconhecido") para que a interface mostre dado ausente em vez de um zero
+falso. Depois de uma falha de conexão, o banco fica `DB_RETRY_SECONDS` sem novas
+tentativas (falha imediata), para não prender workers esperando o timeout de
+conexão a cada requisição.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import metrics
+
+try:
+    import psycopg2
+    import psycopg2.errorcodes
+    import psycopg2.extensions
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+_PARAM_RE = re.compile(r"\$(\d+)")
+logger = logging.getLogger(__name__)
+
+
+class _Query:
+    __slots__ = ("name", "sql", "types", "timeout_env", "timeout_default")
+
+    def __init__(self, name: str, sql: str, types: Optional[Sequence[str]], timeout_env: str, timeout_default: int):
+        self.name = name
+        self.sql = sql.strip()
+        self.types = types
+        self.timeout_env = timeout_env
+        self.timeout_default = timeout_default
+
+    @property
+    def timeout_ms(self) -> int:
+        return int(os.getenv(self.timeout_env, str(self.timeout_default)))
+
+    def prepare_sql(self) -> str:
+        types = f" ({', '.join(self.types)})" if self.types else ""
+        return f"PREPARE {self.name}{types} AS {self.sql}"
+
+    def execute_sql(self, count: int) -> str:
+        return f"EXECUTE {self.name} ({', '.join(f'%(p{i})s' for i in range(1, count + 1))})"
+
+    def plain_sql(self) -> str:
+        return _PARAM_RE.sub(lambda m: f"%(p{m.group(1)})s", self.sql)
+
+
+# Sem tipo declarado, o Postgres infere o do parâmetro pela coluna comparada (nas
+# consultas em lote, um array do tipo dela). A coluna fica sem cast no WHERE para
+# o índice de id_campanha_flowbiz valer; o `::text` do SELECT só dá as chaves
+QUERIES = {q.name: q for q in (
+    _Query("campaign_stats", """
+        SELECT
+            (SELECT COUNT(*)
+             FROM autobot.campanha_acessos ca
+             JOIN autobot.campanhas c ON c.id = ca.campanha_id
+             WHERE c.id_campanha_flowbiz = $1),
+            (SELECT COUNT(*)
+             FROM autobot.formulario f
+             JOIN autobot.campanhas c ON c.id = f.campanha_id
+             WHERE c.id_campanha_flowbiz = $1)
+        """, None, "DB_STATEMENT_TIMEOUT_MS", 2000),
+    _Query("campanha_acessos_bulk", """
+        SELECT c.id_campanha_flowbiz::text, COUNT(*)
+        FROM autobot.campanha_acessos ca
+        JOIN autobot.campanhas c ON c.id = ca.campanha_id
+        WHERE c.id_campanha_flowbiz = ANY($1)
+        GROUP BY 1
+        """, None, "DB_BULK_TIMEOUT_MS", 15000),
+    _Query("formulario_bulk", """
+        SELECT c.id_campanha_flowbiz::text, COUNT(*)
+        FROM autobot.formulario f
+        JOIN autobot.campanhas c ON c.id = f.campanha_id
+        WHERE c.id_campanha_flowbiz = ANY($1)
+        GROUP BY 1
+        """, None, "DB_BULK_TIMEOUT_MS", 15000),
+)}
+
+
+class DatabaseUnavailable(Exception):
+    """Sem conexão (banco fora, pool esgotado ou em espera após falha)."""
+
+
+if psycopg2 is not None:
+    class _Connection(psycopg2.extensions.connection):
+        """Conexão que lembra quais consultas já foram preparadas nela."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared = set()
+
+    class _LazyPool(psycopg2.pool.ThreadedConnectionPool):
+        """Guarda até `maxconn` conexões ociosas, mas só as abre quando pedidas.
+
+        O `putconn` do psycopg2 fecha a conexão devolvida se já há `minconn`
+        ociosas; com `minconn=0` nenhuma seria reaproveitada (nem os PREPARE
+        feitos nela). `minconn` só sobe depois do construtor, que abriria todas.
+        """
+
+        def __init__(self, maxconn: int, **kwargs):
+            super().__init__(0, maxconn, **kwargs)
+            self.minconn = self.maxconn
+            self.connects = 0
+
+        def _connect(self, key=None):
+            conn = super()._connect(key)
+            self.connects += 1
+            return conn
+
+
+class _Pool:
+    """Pool de um servidor (primário ou réplica) com espera após falha de conexão.
+
+    Com todas as conexões em uso, `getconn` espera uma ser devolvida (até `wait`
+    segundos) em vez de falhar na hora.
+    """
+
+    def __init__(self, label: str, connect_kwargs: Dict[str, Any], maxconn: int, retry_seconds: float):
+        self.label = label
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self.retry_seconds = retry_seconds
+        self.down_until = 0.0
+        self.last_error: Optional[str] = None
+        self._pool = _LazyPool(maxconn, connection_factory=_Connection, **connect_kwargs)
+
+    def getconn(self, wait: float):
+        if time.monotonic() < self.down_until:
+            raise DatabaseUnavailable(f"{self.label}: em espera após falha ({self.last_error})")
+        if not self._slots.acquire(timeout=max(0.0, wait)):
+            raise DatabaseUnavailable(f"{self.label}: todas as conexões em uso")
+        try:
+            return self._pool.getconn()
+        except psycopg2.OperationalError as exc:
+            self._slots.release()
+            self.last_error = str(exc).strip()
+            self.down_until = time.monotonic() + self.retry_seconds
+            raise DatabaseUnavailable(f"{self.label}: {self.last_error}")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close: bool = False) -> None:
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        self._pool.closeall()
+
+    def status(self) -> Dict[str, Any]:
+        return {"connects": self._pool.connects, "idle": len(self._pool._pool), "in_use": len(self._pool._used)}
+
+
+class StatsDatabase:
+    """Leituras do schema `autobot` com pool, prepared statements, réplica e timeouts."""
+
+    def __init__(self, primary: Dict[str, Any], replica_dsn: Optional[str] = None, maxconn: int = 5,
+                 connect_timeout: int = 3, retry_seconds: float = 10.0, prepared: bool = True):
+        self.prepared = prepared
+        # PREPARE enviados, por consulta (uma vez por conexão quando o pool reaproveita)
+        self.prepares: Dict[str, int] = {}
+        common = {"connect_timeout": connect_timeout, "application_name": "acompanhamento-disparos"}
+        self.primary = _Pool("primary", dict(primary, **common), maxconn, retry_seconds)
+        self.replica = _Pool("replica", dict(common, dsn=replica_dsn), maxconn, retry_seconds) if replica_dsn else None
+
+    def _pools(self) -> List[_Pool]:
+        return [self.replica, self.primary] if self.replica is not None else [self.primary]
+
+    def _run(self, conn, query: _Query, params: Dict[str, Any], timeout_ms: int) -> List[Tuple]:
+        """`SET LOCAL statement_timeout` + (`PREPARE` na primeira vez) + `EXECUTE`, numa ida só."""
+        for attempt in range(2):
+            sql = f"SET LOCAL statement_timeout = {int(timeout_ms)}; "
+            fresh = False
+            if self.prepared:
+                if query.name not in conn.prepared:
+                    sql += query.prepare_sql() + "; "
+                    fresh = True
+                sql += query.execute_sql(len(params))
+            else:
+                sql += query.plain_sql()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    rows = cur.fetchall()
+                # Fim da transação de leitura; o timeout volta ao padrão da sessão
+                conn.rollback()
+                if fresh:
+                    conn.prepared.add(query.name)
+                    self.prepares[query.name] = self.prepares.get(query.name, 0) + 1
+                return rows
+            except psycopg2.Error as exc:
+                conn.rollback()
+                # A conexão perdeu (DISCARD ALL de um pooler) ou já tem o statement
+                if attempt == 0 and exc.pgcode == psycopg2.errorcodes.INVALID_SQL_STATEMENT_NAME:
+                    conn.prepared.discard(query.name)
+                    continue
+                if attempt == 0 and exc.pgcode == psycopg2.errorcodes.DUPLICATE_PREPARED_STATEMENT:
+                    conn.prepared.add(query.name)
+                    continue
+                raise
+        raise RuntimeError("unreachable")
+
+    def query(self, name: str, *args: Any, timeout_ms: Optional[int] = None) -> List[Tuple]:
+        """Linhas da consulta `name`; levanta `DatabaseUnavailable` ou o erro do banco.
+
+        `timeout_ms` encurta o limite da consulta (ex.: o que resta do orçamento da requisição).
+        """
+        query = QUERIES[name]
+        limit = query.timeout_ms if timeout_ms is None else max(1, min(int(timeout_ms), query.timeout_ms))
+        params = {f"p{i}": value for i, value in enumerate(args, start=1)}
+        unavailable: Optional[DatabaseUnavailable] = None
+        for pool in self._pools():
+            try:
+                # A espera por uma conexão livre conta no limite da consulta
+                conn = pool.getconn(limit / 1000.0)
+            except DatabaseUnavailable as exc:
+                # Réplica sem conexão: tentar o primário
+                unavailable = exc
+                continue
+            broken = False
+            try:
+                with metrics.timer(metrics.DB_QUERY_SECONDS, query=name):
+                    return self._run(conn, query, params, limit)
+            except psycopg2.Error as exc:
+                broken = bool(conn.closed) or isinstance(exc, psycopg2.OperationalError) and \
+                    exc.pgcode != psycopg2.errorcodes.QUERY_CANCELED
+                raise
+            finally:
+                pool.putconn(conn, close=broken)
+        raise unavailable or DatabaseUnavailable("sem servidores configurados")
+
+    def close(self) -> None:
+        for pool in self._pools():
+            pool.close()
+
+    def status(self) -> Dict[str, Any]:
+        """Conexões abertas/ociosas por servidor e PREPARE enviados por consulta."""
+        pools = {pool.label: pool.status() for pool in self._pools()}
+        return {"pools": pools, "prepares": dict(self.prepares), "prepared_statements": self.prepared}
+
+
+_database: Optional[StatsDatabase] = None
+_database_pid: Optional[int] = None
+_database_lock = threading.Lock()
+
+
+def get_database() -> Optional[StatsDatabase]:
+    """Instância do processo (recriada depois de um fork); None sem `psycopg2`."""
+    global _database, _database_pid
+    if psycopg2 is None:
+        return None
+    pid = os.getpid()
+    if _database is not None and _database_pid == pid:
+        return _database
+    with _database_lock:
+        if _database is None or _database_pid != pid:
+            # Conexões herdadas do processo pai não são usadas (nem fechadas) no filho
+            _database = StatsDatabase(
+                {
+                    "dbname": os.getenv('DB_NAME'),
+                    "user": os.getenv('DB_USER'),
+                    "password": os.getenv('DB_PASSWORD'),
+                    "host": os.getenv('DB_HOST'),
+                    "port": os.getenv('DB_PORT'),
+                },
+                replica_dsn=os.getenv("DB_REPLICA_DSN", "").strip() or None,
+                maxconn=int(os.getenv("DB_POOL_MAX", "5")),
+                connect_timeout=int(os.getenv("DB_CONNECT_TIMEOUT", "3")),
+                retry_seconds=float(os.getenv("DB_RETRY_SECONDS", "10")),
+                prepared=os.getenv("DB_PREPARED", "1").strip().lower() not in {"0", "false", "no"},
+            )
+            _database_pid = pid
+    return _database
+
+
+def _failed(query: str, exc: Exception, context: str) -> None:
+    if psycopg2 is not None and getattr(exc, "pgcode", None) == psycopg2.errorcodes.QUERY_CANCELED:
+        metrics.DB_TIMEOUTS.inc(query=query)
+    metrics.DB_ERRORS.inc(query=query)
+    logger.warning("Erro ao buscar stats %s: %s", context, exc)
+
+
+def get_campaign_stats_by_flowbiz_id(flowbiz_campaign_id: str,
+                                     timeout_ms: Optional[int] = None) -> Dict[str, Optional[int]]:
+    """Qtd Acessos e Qtd Leads pelo id_campanha_flowbiz; None em cada um se o banco não respondeu."""
+    db = get_database()
+    if db is None:
+        return {"QtdAcessos": None, "QtdLeads": None}
+    try:
+        qtd_acessos, qtd_leads = db.query("campaign_stats", str(flowbiz_campaign_id), timeout_ms=timeout_ms)[0]
+        return {"QtdAcessos": qtd_acessos, "QtdLeads": qtd_leads}
+    except Exception as e:
+        _failed("campaign_stats", e, f"da campanha {flowbiz_campaign_id}")
+        return {"QtdAcessos": None, "QtdLeads": None}
+
+
+def get_campaign_stats_bulk(flowbiz_campaign_ids: Iterable[Any],
+                            timeout_ms: Optional[int] = None) -> Optional[Dict[str, Dict[str, int]]]:
+    """Qtd Acessos e Qtd Leads de várias campanhas em duas consultas agrupadas.
+
+    Retorna {id_campanha_flowbiz: {"QtdAcessos": n, "QtdLeads": n}} apenas para as
+    campanhas com algum registro; as ausentes devem ser tratadas como zero. None
+    quando o banco não respondeu (as contagens são desconhecidas, não zero).
+    `timeout_ms` é o tempo das duas consultas juntas; se acabar antes da segunda, None.
+    """
+    # Ids numéricos, como a coluna; os demais não têm registro no banco
+    ids = sorted({int(i) for i in (str(i).strip() for i in flowbiz_campaign_ids if i) if i.isdigit()})
+    if not ids:
+        return {}
+    db = get_database()
+    if db is None:
+        return None
+
+    started = time.monotonic()
+    stats: Dict[str, Dict[str, int]] = {}
+    for name, field in (("campanha_acessos_bulk", "QtdAcessos"), ("formulario_bulk", "QtdLeads")):
+        remaining = None if timeout_ms is None else timeout_ms - int((time.monotonic() - started) * 1000)
+        if remaining is not None and remaining <= 0:
+            return None
+        try:
+            rows = db.query(name, ids, timeout_ms=remaining)
+        except Exception as e:
+            _failed(name, e, f"em lote ({len(ids)} campanhas)")
+            return None
+        for flowbiz_id, qtd in rows:
+            stats.setdefault(flowbiz_id, {"QtdAcessos": 0, "QtdLeads": 0})[field] = qtd
+    return stats
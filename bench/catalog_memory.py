@@ -0,0 +1,112 @@
+"""Memória do catálogo em memória: dicts do Flowbiz x `CampaignTable`.
+
+Gera N campanhas sintéticas (a partir de `campaign_details.json`, com a projeção
+enxuta de `campaign_fields`, como o app guarda) e mede, cada forma num processo
+Python novo, o RSS acrescentado pelo catálogo e o tempo para montar o DataFrame
+do painel.
+
+Uso:
+    python bench/catalog_memory.py --campaigns 200000 --accounts 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import gc, json, os, random, sys, time
+sys.path.insert(0, os.path.join(sys.argv[1], "bench"))
+sys.path.insert(0, sys.argv[1])
+mode, n, accounts = sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+
+import pandas as pd
+from campaign_fields import LEAN_FIELDS, project
+from campaign_records import CampaignTable
+from flowbiz_simulator import load_json_any
+
+def rss_kb():
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+template = load_json_any(os.path.join(sys.argv[1], "campaign_details.json"))
+template = template.get("Campaign", template)
+rng = random.Random(7)
+statuses = ("Sent", "Draft", "Sending", "Paused")
+
+def synthetic(i):
+    origin = f"Conta{i % accounts:02d}"
+    c = project(dict(template), LEAN_FIELDS)
+    # Valores vindos do JSON do Flowbiz: tudo texto, strings novas por campanha
+    c.update({
+        "CampaignID": str(500000 + i),
+        "CampaignName": f"Campanha {i} - " + "".join(rng.choice("abcdefgh") for _ in range(12)),
+        "CampaignStatus": "".join(rng.choice(statuses)),
+        "Origin": "".join(origin), "_origin_api": "FLOWBIZ_API_KEY_" + origin,
+        "TotalSent": str(rng.randint(0, 50000)), "TotalOpens": str(rng.randint(0, 9000)),
+        "UniqueClicks": str(rng.randint(0, 900)), "TotalClicks": str(rng.randint(0, 1200)),
+        "SendProcessFinishedOn": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 10:{i % 60:02d}:00",
+        "QtdLeads": rng.randint(0, 50), "QtdAcessos": rng.randint(0, 200),
+    })
+    return c
+
+gc.collect()
+before = rss_kb()
+started = time.perf_counter()
+if mode == "dicts":
+    catalog = [synthetic(i) for i in range(n)]
+else:
+    # Como no snapshot: os dicts são descartados à medida que viram colunas
+    catalog = CampaignTable.from_campaigns(synthetic(i) for i in range(n))
+build_s = time.perf_counter() - started
+gc.collect()
+after = rss_kb()
+
+started = time.perf_counter()
+if mode == "dicts":
+    df = pd.DataFrame([dict(c) for c in catalog])
+else:
+    df = catalog.to_dataframe()
+df_s = time.perf_counter() - started
+print(json.dumps({"mode": mode, "rss_kb": after - before, "build_s": build_s, "df_s": df_s,
+                  "df_kb": int(df.memory_usage(deep=True).sum() / 1024)}))
+"""
+
+
+def measure(mode: str, campaigns: int, accounts: int) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, ROOT, mode, str(campaigns), str(accounts)],
+        cwd=ROOT, capture_output=True, text=True, check=False,
+    )
+    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if out.returncode != 0 or not lines:
+        return {"mode": mode, "error": (out.stderr.strip().splitlines() or ["?"])[-1]}
+    return json.loads(lines[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--campaigns", type=int, default=200000)
+    parser.add_argument("--accounts", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.campaigns} campanhas em {args.accounts} contas\n")
+    header = f"{'forma':<8} {'RSS MB':>9} {'B/campanha':>11} {'montagem s':>11} {'DataFrame s':>12} {'DataFrame MB':>13}"
+    print(header)
+    print("-" * len(header))
+    for mode in ("dicts", "table"):
+        r = measure(mode, args.campaigns, args.accounts)
+        if "error" in r:
+            print(f"{mode:<8} erro: {r['error']}")
+            continue
+        print(f"{mode:<8} {r['rss_kb'] / 1024:>9.1f} {r['rss_kb'] * 1024 / args.campaigns:>11.0f} "
+              f"{r['build_s']:>11.2f} {r['df_s']:>12.2f} {r['df_kb'] / 1024:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
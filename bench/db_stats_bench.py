@@ -0,0 +1,87 @@
+"""Consultas de leads/acessos (`autobot_db`) contra um PostgreSQL real.
+
+Usa as mesmas variáveis `DB_*` do app. Faz `--queries` chamadas seguidas da
+consulta de uma campanha e da consulta agrupada, com prepared statements e sem
+(`DB_PREPARED=0`), e reporta latência (p50/p95). Também confere o pool: depois
+da primeira chamada, as seguintes devem reaproveitar a mesma conexão (uma só
+aberta) e não mandar `PREPARE` de novo; se não, sai com código 1.
+
+Uso:
+    DB_HOST=localhost DB_NAME=autobot DB_USER=... python bench/db_stats_bench.py \\
+        --queries 500 --ids 600001,600002,600003
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import autobot_db  # noqa: E402
+from load_bench import percentile  # noqa: E402
+
+
+def run(db: "autobot_db.StatsDatabase", ids: List[str], queries: int) -> Dict[str, List[float]]:
+    latencies: Dict[str, List[float]] = {"campaign_stats": [], "bulk": []}
+    # As consultas em lote comparam com a coluna numérica sem cast
+    typed_ids = [int(i) for i in ids]
+    for n in range(queries):
+        started = time.perf_counter()
+        db.query("campaign_stats", ids[n % len(ids)])
+        latencies["campaign_stats"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        db.query("campanha_acessos_bulk", typed_ids)
+        db.query("formulario_bulk", typed_ids)
+        latencies["bulk"].append(time.perf_counter() - started)
+    return latencies
+
+
+def check_reuse(db: "autobot_db.StatsDatabase") -> List[str]:
+    """Problemas de reaproveitamento (lista vazia se o pool guardou a conexão e os PREPARE)."""
+    status = db.status()
+    problems = []
+    primary = status["pools"]["primary"]
+    if primary["connects"] != 1 or primary["idle"] != 1:
+        problems.append(f"pool abriu {primary['connects']} conexões ({primary['idle']} ociosas); esperado 1")
+    if db.prepared:
+        for name, count in status["prepares"].items():
+            if count != 1:
+                problems.append(f"{name}: {count} PREPARE; esperado 1")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200, help="chamadas de cada consulta por modo")
+    parser.add_argument("--ids", default="1", help="id_campanha_flowbiz separados por vírgula")
+    args = parser.parse_args()
+    ids = [i.strip() for i in args.ids.split(",") if i.strip()]
+    if autobot_db.psycopg2 is None:
+        sys.exit("psycopg2 não instalado")
+
+    failed = False
+    for prepared in (True, False):
+        os.environ["DB_PREPARED"] = "1" if prepared else "0"
+        # Instância nova por modo (a do processo é criada uma vez)
+        autobot_db._database = None
+        db = autobot_db.get_database()
+        # Só a consulta do primário (a réplica, se houver, ficaria com as conexões)
+        db.replica = None
+        latencies = run(db, ids, args.queries)
+        mode = "prepared" if prepared else "sql"
+        for name, values in latencies.items():
+            print(f"{mode:<9} {name:<15} p50 {percentile(values, 50) * 1000:.2f}ms  "
+                  f"p95 {percentile(values, 95) * 1000:.2f}ms")
+        problems = check_reuse(db)
+        for problem in problems:
+            print(f"{mode:<9} ERRO: {problem}")
+        failed = failed or bool(problems)
+        db.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Simulador local da API Flowbiz para testes de carga sem tocar em mbiz.mailclick.me.
+
+Fala o mesmo protocolo de formulário (`APIKey`, `Command`, `ResponseFormat`) e
+responde aos comandos do `route_map` de `app.py`. Os dados vêm de um gerador
+sintético (N contas x M campanhas) usando `campaign_details.json` como molde do
+objeto de campanha (incluindo o bloco `Email` completo), e podem ser
+complementados com fixtures JSON/JSONL de respostas reais (`--fixture`).
+
+Latência, erros e timeouts são injetáveis globalmente ou por conta; com
+`--max-concurrent`, chamadas simultâneas acima do limite de uma conta recebem 429
+com `Retry-After`, como um limite de taxa.
+
+Uso:
+    python bench/flowbiz_simulator.py --accounts 5 --campaigns 300 --latency-ms 120 --port 8900
+    # imprime as variáveis FLOWBIZ_* para apontar o app para o simulador
+"""
+import argparse
+import copy
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from flask import Flask, jsonify, request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TEMPLATE = os.path.join(ROOT, "campaign_details.json")
+
+NAME_WORDS = ["ATUALIZAÇÃO", "Promoção", "Campanha", "Oferta", "VELOX", "Vivo", "Black Friday",
+              "Renovação", "Boas-vindas", "Reativação", "Newsletter", "Convite", "Lembrete"]
+STATUSES = ["Sent", "Sent", "Sent", "Draft", "Scheduled", "Sending"]
+
+
+def load_json_any(path: str) -> Any:
+    """Lê JSON em UTF-8 ou UTF-16 (o campaign_details.json foi exportado em UTF-16)."""
+    with open(path, "rb") as fh:
+        raw = fh.read()
+    for encoding in ("utf-8-sig", "utf-16"):
+        try:
+            return json.loads(raw.decode(encoding))
+        except (UnicodeDecodeError, ValueError):
+            continue
+    raise ValueError(f"Não foi possível ler {path} como JSON")
+
+
+def load_fixture_campaigns(path: str) -> List[Dict[str, Any]]:
+    """Extrai objetos de campanha de um JSON (ou JSONL) de respostas Flowbiz."""
+    docs: List[Any] = []
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if line:
+                    try:
+                        docs.append(json.loads(line))
+                    except ValueError:
+                        continue
+    else:
+        docs.append(load_json_any(path))
+
+    campaigns = []
+    for doc in docs:
+        if not isinstance(doc, dict):
+            continue
+        if isinstance(doc.get("Campaign"), dict):
+            campaigns.append(doc["Campaign"])
+        for c in doc.get("Campaigns") or []:
+            if isinstance(c, dict):
+                campaigns.append(c)
+    return campaigns
+
+
+class SimulatedFlowbiz:
+    """Estado do simulador: contas, campanhas e parâmetros de falha."""
+
+    def __init__(self, accounts: int = 3, campaigns: int = 200, template_path: str = DEFAULT_TEMPLATE,
+                 fixtures: Optional[List[str]] = None, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, timeout_seconds: float = 60.0,
+                 seed: int = 42, max_concurrent: int = 0):
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        # Chamadas simultâneas por conta antes de responder 429 (0 = sem limite)
+        self.max_concurrent = max_concurrent
+        self.in_flight: Dict[str, int] = {}
+        self.rate_limited = 0
+        # Sobrescritas por conta: {nome: {"latency_ms": .., "error_rate": .., "timeout_rate": ..}}
+        self.account_overrides: Dict[str, Dict[str, float]] = {}
+
+        template = {}
+        if template_path and os.path.exists(template_path):
+            template = load_json_any(template_path).get("Campaign", {})
+        self.template = template
+
+        self.accounts: Dict[str, str] = {}  # api_key -> nome da conta
+        self.campaigns: Dict[str, List[Dict[str, Any]]] = {}
+        fixture_campaigns: List[Dict[str, Any]] = []
+        for path in fixtures or []:
+            fixture_campaigns.extend(load_fixture_campaigns(path))
+
+        next_id = 600000
+        for i in range(1, accounts + 1):
+            # A primeira conta se chama Voxcall: é a chave usada pelo proxy genérico
+            name = "Voxcall" if i == 1 else f"Sim{i:02d}"
+            key = f"sim-key-{i:02d}"
+            self.accounts[key] = name
+            items = []
+            # Fixtures entram na primeira conta, com os dados como vieram
+            if i == 1:
+                items.extend(copy.deepcopy(fixture_campaigns))
+            for _ in range(campaigns):
+                next_id += 1
+                items.append(self._generate(next_id))
+            self.campaigns[name] = items
+
+    def _generate(self, campaign_id: int) -> Dict[str, Any]:
+        rng = self.rng
+        # Cópia rasa: os textos grandes do bloco Email (HTML, CSS) são compartilhados
+        # entre campanhas, mas serializados por inteiro como na API real
+        c = dict(self.template)
+        c["Email"] = dict(self.template.get("Email") or {})
+        status = rng.choice(STATUSES)
+        created = datetime(2025, 1, 1) + timedelta(minutes=rng.randint(0, 60 * 24 * 400))
+        sent = rng.randint(500, 50000) if status in ("Sent", "Sending") else 0
+        opens = int(sent * rng.uniform(0.05, 0.45))
+        unique_clicks = int(opens * rng.uniform(0.02, 0.25))
+        name = f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {campaign_id}"
+        finished = created + timedelta(hours=rng.randint(1, 72))
+        c.update({
+            "CampaignID": str(campaign_id),
+            "CampaignName": name,
+            "CampaignStatus": status,
+            "CreateDateTime": created.strftime("%Y-%m-%d %H:%M:%S"),
+            "SendDate": finished.strftime("%Y-%m-%d") if sent else "0000-00-00",
+            "SendProcessFinishedOn": finished.strftime("%Y-%m-%d %H:%M:%S") if sent else "0000-00-00 00:00:00",
+            "TotalSent": str(sent),
+            "TotalRecipients": str(sent),
+            "TotalOpens": str(opens),
+            "UniqueOpens": str(opens),
+            "TotalClicks": str(int(unique_clicks * 1.4)),
+            "UniqueClicks": str(unique_clicks),
+        })
+        email = c.setdefault("Email", {})
+        if isinstance(email, dict):
+            email["EmailID"] = str(campaign_id)
+            email["EmailName"] = f"Campaign email: {campaign_id}"
+            email["Subject"] = f"{name} — confira as novidades"
+        return c
+
+    # ------------------------------------------------------------------ falhas
+    def _param(self, account: Optional[str], name: str) -> float:
+        override = self.account_overrides.get(account or "", {})
+        return override.get(name, getattr(self, name))
+
+    def inject(self, account: Optional[str]) -> Optional[str]:
+        """Aplica latência e sorteia falhas; retorna 'error', 'timeout' ou None."""
+        latency = self._param(account, "latency_ms")
+        with self.rng_lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            roll = self.rng.random()
+        delay = max(0.0, latency + jitter) / 1000.0
+        if delay:
+            time.sleep(delay)
+        timeout_rate = self._param(account, "timeout_rate")
+        if roll < timeout_rate:
+            time.sleep(self.timeout_seconds)
+            return "timeout"
+        if roll < timeout_rate + self._param(account, "error_rate"):
+            return "error"
+        return None
+
+    # --------------------------------------------------------------- comandos
+    def handle(self, form: Dict[str, str]):
+        api_key = form.get("APIKey", "")
+        command = form.get("Command", "")
+        account = self.accounts.get(api_key)
+        if self.max_concurrent and account is not None:
+            with self.rng_lock:
+                if self.in_flight.get(account, 0) >= self.max_concurrent:
+                    self.rate_limited += 1
+                    return {"Success": False, "ErrorCode": 429, "ErrorText": "Too many requests"}, 429
+                self.in_flight[account] = self.in_flight.get(account, 0) + 1
+        try:
+            fault = self.inject(account)
+            if fault == "error":
+                return {"Success": False, "ErrorCode": 99, "ErrorText": "Simulated failure"}, 500
+            if account is None:
+                return {"Success": False, "ErrorCode": 1, "ErrorText": "Invalid API key"}, 200
+            handler = getattr(self, "cmd_" + command.replace(".", "_"), None)
+            if handler is None:
+                return {"Success": True, "ErrorCode": 0, "Command": command}, 200
+            return handler(account, form), 200
+        finally:
+            if self.max_concurrent and account is not None:
+                with self.rng_lock:
+                    self.in_flight[account] -= 1
+
+    def cmd_Campaigns_Get(self, account: str, form: Dict[str, str]) -> Dict[str, Any]:
+        items = self.campaigns.get(account, [])
+        status = form.get("CampaignStatus")
+        if status and status.lower() != "all":
+            items = [c for c in items if c.get("CampaignStatus") == status]
+        items = sorted(items, key=lambda c: c.get("SendProcessFinishedOn", ""), reverse=True)
+        start = int(form.get("RecordsFrom", 0) or 0)
+        per_page = int(form.get("RecordsPerRequest", 25) or 25)
+        return {"Success": True, "ErrorCode": 0, "TotalCampaigns": len(items),
+                "Campaigns": items[start:start + per_page]}
+
+    def cmd_Campaign_Get(self, account: str, form: Dict[str, str]) -> Dict[str, Any]:
+        wanted = str(form.get("CampaignID", ""))
+        for c in self.campaigns.get(account, []):
+            if c.get("CampaignID") == wanted:
+                return {"Success": True, "ErrorCode": 0, "Campaign": c}
+        return {"Success": False, "ErrorCode": 2, "ErrorText": "Campaign not found"}
+
+    def cmd_Lists_Get(self, account: str, form: Dict[str, str]) -> Dict[str, Any]:
+        lists = [{"ListID": str(1000 + i), "Name": f"Lista {account} {i}", "SubscriberCount": str(100 * i)}
+                 for i in range(1, 6)]
+        return {"Success": True, "ErrorCode": 0, "TotalListCount": len(lists), "Lists": lists}
+
+    def cmd_Tags_Get(self, account: str, form: Dict[str, str]) -> Dict[str, Any]:
+        tags = [{"TagID": str(i), "Tag": f"tag-{account.lower()}-{i}"} for i in range(1, 4)]
+        return {"Success": True, "ErrorCode": 0, "Tags": tags}
+
+    def cmd_Segment_Get(self, account: str, form: Dict[str, str]) -> Dict[str, Any]:
+        segments = [{"SegmentID": str(2000 + i), "SegmentName": f"Segmento {i}"} for i in range(1, 4)]
+        return {"Success": True, "ErrorCode": 0, "Segments": segments}
+
+    def cmd_Subscribers_Get(self, account: str, form: Dict[str, str]) -> Dict[str, Any]:
+        start = int(form.get("RecordsFrom", 0) or 0)
+        per_page = int(form.get("RecordsPerRequest", 25) or 25)
+        total = 1000
+        subscribers = [{"SubscriberID": str(i), "EmailAddress": f"contato{i}@exemplo.com.br"}
+                       for i in range(start + 1, min(total, start + per_page) + 1)]
+        return {"Success": True, "ErrorCode": 0, "TotalSubscribers": total, "Subscribers": subscribers}
+
+    def cmd_Subscriber_Interactions(self, account: str, form: Dict[str, str]) -> Dict[str, Any]:
+        sid = form.get("SubscriberID") or form.get("EmailAddress") or ""
+        with self.rng_lock:
+            opens = self.rng.randint(0, 20)
+            clicks = self.rng.randint(0, opens)
+        return {"Success": True, "ErrorCode": 0, "Subscriber": sid,
+                "Interactions": {"Opens": opens, "Clicks": clicks}}
+
+    def cmd_Media_Upload(self, account: str, form: Dict[str, str]) -> Dict[str, Any]:
+        size = len(form.get("MediaData", "")) * 3 // 4
+        return {"Success": True, "ErrorCode": 0, "MediaID": str(abs(hash(form.get("MediaName", ""))) % 10 ** 6),
+                "ReceivedBytes": size}
+
+
+def create_simulator_app(sim: SimulatedFlowbiz) -> Flask:
+    app = Flask("flowbiz_simulator")
+
+    @app.post("/api.php")
+    @app.post("/api.php/<path:method>")
+    def api(method: str = ""):
+        form = request.form.to_dict()
+        if method and "Command" not in form:
+            form["Command"] = method
+        payload, status = sim.handle(form)
+        response = jsonify(payload)
+        if status == 429:
+            response.headers["Retry-After"] = "1"
+        return response, status
+
+    @app.get("/health")
+    def health():
+        return {"status": "ok", "accounts": len(sim.accounts),
+                "campaigns": sum(len(v) for v in sim.campaigns.values())}, 200
+
+    return app
+
+
+def env_for(sim: SimulatedFlowbiz, host: str, port: int) -> Dict[str, str]:
+    """Variáveis de ambiente que apontam o app para o simulador."""
+    env = {"FLOWBIZ_ENDPOINT": f"http://{host}:{port}/api.php"}
+    for key, name in sim.accounts.items():
+        env[f"FLOWBIZ_API_KEY_{name}"] = key
+    return env
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--accounts", type=int, default=3)
+    parser.add_argument("--campaigns", type=int, default=200, help="campanhas por conta")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE)
+    parser.add_argument("--fixture", action="append", default=[],
+                        help="JSON/JSONL com respostas Flowbiz (Campaign/Campaigns); pode repetir")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=60.0)
+    parser.add_argument("--slow-account", action="append", default=[],
+                        help="NOME=LATENCIA_MS para uma conta específica (ex.: Sim02=3000)")
+    parser.add_argument("--max-concurrent", type=int, default=0,
+                        help="chamadas simultâneas por conta antes de responder 429 (0 = sem limite)")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser
+
+
+def simulator_from_args(args) -> SimulatedFlowbiz:
+    sim = SimulatedFlowbiz(
+        accounts=args.accounts, campaigns=args.campaigns, template_path=args.template,
+        fixtures=args.fixture, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, timeout_rate=args.timeout_rate,
+        timeout_seconds=args.timeout_seconds, seed=args.seed, max_concurrent=args.max_concurrent,
+    )
+    for spec in args.slow_account:
+        name, _, ms = spec.partition("=")
+        sim.account_overrides.setdefault(name, {})["latency_ms"] = float(ms or 0)
+    return sim
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    sim = simulator_from_args(args)
+    for k, v in env_for(sim, args.host, args.port).items():
+        print(f"export {k}={v}")
+    create_simulator_app(sim).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
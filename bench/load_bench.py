@@ -0,0 +1,193 @@
+"""Benchmark de carga ponta a ponta contra o simulador Flowbiz local.
+
+Sobe o simulador (`flowbiz_simulator.py`) e o app Flask em threads locais,
+dispara requisições concorrentes e reporta p50/p95/p99, throughput e erros para:
+
+- list:  GET /api/campaigns/manage?action=list
+- proxy: POST /api/campaigns/get
+- dash:  POST /dash/_dash-update-component (callback update_metrics)
+- kpis:  GET /dash/metrics
+
+Uso:
+    python bench/load_bench.py --accounts 5 --campaigns 300 --latency-ms 80 \\
+        --requests 200 --concurrency 16 --scenario list --scenario dash
+
+Sem --with-db, o banco aponta para uma porta fechada (falha rápida, leads/acessos
+ficam desconhecidos) para que a medição isole o caminho Flowbiz + app.
+"""
+import contextlib
+import io
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import requests
+from werkzeug.serving import make_server
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from flowbiz_simulator import build_arg_parser, create_simulator_app, env_for, simulator_from_args  # noqa: E402
+
+DASH_UPDATE_METRICS = {
+    "output": "..bar-emails-sent.figure...pie-opens-clicks.figure...time-opens.figure"
+              "...trend-daily.figure...table-campaigns.data...dash-status.children..",
+    "outputs": [
+        {"id": "bar-emails-sent", "property": "figure"},
+        {"id": "pie-opens-clicks", "property": "figure"},
+        {"id": "time-opens", "property": "figure"},
+        {"id": "trend-daily", "property": "figure"},
+        {"id": "table-campaigns", "property": "data"},
+        {"id": "dash-status", "property": "children"},
+    ],
+    "inputs": [
+        {"id": "url", "property": "pathname", "value": "/dash/"},
+        {"id": "apply-filters", "property": "n_clicks", "value": None},
+    ],
+    "changedPropIds": ["url.pathname"],
+    "state": [
+        {"id": "origin-filter", "property": "value", "value": None},
+        {"id": "campaign-filter", "property": "value", "value": None},
+        {"id": "date-range", "property": "start_date", "value": None},
+        {"id": "date-range", "property": "end_date", "value": None},
+    ],
+}
+
+
+def start_server(app, host: str = "127.0.0.1") -> Tuple[object, int]:
+    server = make_server(host, 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_port
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[idx]
+
+
+def run_scenario(name: str, call: Callable[[requests.Session], requests.Response],
+                 total: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    sizes: List[int] = []
+    wire: List[int] = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(_):
+        nonlocal errors
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            res = call(session)
+            ok = res.status_code < 400
+            size = len(res.content)
+            # requests descomprime sozinho; Content-Length é o que trafegou
+            sent = int(res.headers.get("Content-Length") or size)
+        except requests.RequestException:
+            ok, size, sent = False, 0, 0
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            sizes.append(size)
+            wire.append(sent)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+    return {
+        "scenario": name,
+        "requests": total,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "rps": total / wall if wall else 0.0,
+        "avg_kb": (statistics.fmean(sizes) / 1024) if sizes else 0.0,
+        "wire_kb": (statistics.fmean(wire) / 1024) if wire else 0.0,
+    }
+
+
+def main() -> None:
+    parser = build_arg_parser()
+    parser.description = __doc__.splitlines()[0]
+    parser.set_defaults(port=0)
+    parser.add_argument("--requests", type=int, default=100, help="requisições por cenário")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenario", action="append", choices=["list", "proxy", "dash", "kpis"],
+                        help="cenários a rodar (padrão: todos)")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--with-db", action="store_true", help="usar o banco configurado no .env")
+    parser.add_argument("--fields", default="", help="projeção para list/proxy (ex.: all para o objeto completo; na listagem força a busca ao vivo)")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    sim = simulator_from_args(args)
+    sim_server, sim_port = start_server(create_simulator_app(sim), args.host)
+
+    for key in [k for k in os.environ if k.startswith("FLOWBIZ_API_KEY_")]:
+        del os.environ[key]
+    os.environ.update(env_for(sim, args.host, sim_port))
+    if not args.with_db:
+        os.environ.update(DB_HOST="127.0.0.1", DB_PORT="9", DB_NAME="bench")
+
+    from app import create_app
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+    app.logger.setLevel("ERROR")
+    app_server, app_port = start_server(app, args.host)
+    base = f"http://{args.host}:{app_port}"
+    first_id = next(iter(sim.campaigns.values()))[0]["CampaignID"] if sim.campaigns else "0"
+
+    scenarios = {
+        "list": lambda s: s.get(f"{base}/api/campaigns/manage?action=list&RecordsPerRequest=10&RecordsFrom=0"
+                                + (f"&fields={args.fields}" if args.fields else ""), timeout=60),
+        "proxy": lambda s: s.post(f"{base}/api/campaigns/get", json={"RecordsPerRequest": "50", "fields": args.fields},
+                                  timeout=60),
+        "dash": lambda s: s.post(f"{base}/dash/_dash-update-component", json=DASH_UPDATE_METRICS, timeout=120),
+        "kpis": lambda s: s.get(f"{base}/dash/metrics", timeout=60),
+    }
+    selected = args.scenario or list(scenarios)
+
+    print(f"Simulador: {args.accounts} contas x {args.campaigns} campanhas, latência {args.latency_ms}ms "
+          f"(±{args.jitter_ms}), erros {args.error_rate:.0%}, timeouts {args.timeout_rate:.0%}")
+    print(f"Carga: {args.requests} req/cenário, concorrência {args.concurrency} (exemplo CampaignID {first_id})\n")
+    header = f"{'cenário':<8} {'req':>5} {'erros':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'média':>9} {'req/s':>8} {'KB/resp':>9} {'KB fio':>8}"
+    print(header)
+    print("-" * len(header))
+    # Erros de banco do app vão para stdout; não misturar com o relatório
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = []
+        for name in selected:
+            session = requests.Session()
+            for _ in range(args.warmup):
+                try:
+                    scenarios[name](session)
+                except requests.RequestException:
+                    pass
+            results.append(run_scenario(name, scenarios[name], args.requests, args.concurrency))
+    for r in results:
+        print(f"{r['scenario']:<8} {r['requests']:>5} {r['errors']:>5} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['mean_ms']:>9.1f} {r['rps']:>8.1f} {r['avg_kb']:>9.1f} {r['wire_kb']:>8.1f}")
+
+    app_server.shutdown()
+    sim_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Perfil de inicialização: tempo de importação e memória por grupo de módulos.
+
+Cada grupo é medido num processo Python novo (importações frias), reportando o
+tempo de importação e o RSS antes/depois. Os grupos `app-*` medem `import app`
+(que chama `create_app()`) em cada modo de montagem do Dash.
+
+Uso:
+    python bench/startup_profile.py            # todos os grupos
+    python bench/startup_profile.py --importtime dash   # + top 15 de -X importtime
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GROUPS = {
+    "core": ["flask", "requests", "dotenv"],
+    "db": ["psycopg2", "psycopg2.extras"],
+    "dash": ["pandas", "plotly.express", "dash", "dash_bootstrap_components"],
+    "app-lazy": ["app"],
+    "app-eager": ["app"],
+    "app-off": ["app"],
+}
+
+PROBE = r"""
+import json, os, sys, time, importlib
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+before = rss_kb()
+started = time.perf_counter()
+for name in sys.argv[1:]:
+    importlib.import_module(name)
+elapsed = time.perf_counter() - started
+after = rss_kb()
+heavy = [m for m in ("pandas", "plotly", "dash", "dash_bootstrap_components") if m in sys.modules]
+print(json.dumps({"import_ms": elapsed * 1000, "rss_before_kb": before, "rss_after_kb": after,
+                  "modules": len(sys.modules), "heavy_loaded": heavy}))
+"""
+
+
+def measure(group: str, modules, env_extra=None) -> dict:
+    env = dict(os.environ)
+    env.update(env_extra or {})
+    env.setdefault("METRICS_ENABLED", "auto")
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, *modules],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=False,
+    )
+    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if out.returncode != 0 or not lines:
+        return {"group": group, "error": (out.stderr.strip().splitlines() or ["?"])[-1]}
+    result = json.loads(lines[-1])
+    result["group"] = group
+    return result
+
+
+def importtime(modules, top: int = 15) -> None:
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        cwd=ROOT, capture_output=True, text=True, check=False,
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    print(f"\nTop {top} importações (cumulativo) para {', '.join(modules)}:")
+    for cumulative_us, self_us, name in rows[:top]:
+        print(f"  {cumulative_us / 1000:>9.1f} ms  (próprio {self_us / 1000:>7.1f} ms)  {name.strip()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("groups", nargs="*", metavar="grupo", help=f"um de {', '.join(GROUPS)} (padrão: todos)")
+    parser.add_argument("--importtime", action="store_true", help="mostrar as importações mais caras")
+    args = parser.parse_args()
+    unknown = [g for g in args.groups if g not in GROUPS]
+    if unknown:
+        parser.error(f"grupo desconhecido: {', '.join(unknown)}")
+
+    header = f"{'grupo':<10} {'import ms':>10} {'RSS antes MB':>13} {'RSS depois MB':>14} {'Δ MB':>8} {'módulos':>8}  pesados"
+    print(header)
+    print("-" * len(header))
+    for group in args.groups or list(GROUPS):
+        env_extra = {}
+        if group.startswith("app-"):
+            # Sem contas: create_app() não dispara nenhuma chamada de rede
+            env_extra = {"DASH_MOUNT": group.split("-", 1)[1], "FLOWBIZ_API_KEY_Voxcall": ""}
+        r = measure(group, GROUPS[group], env_extra)
+        if "error" in r:
+            print(f"{group:<10} erro: {r['error']}")
+            continue
+        before, after = r["rss_before_kb"] / 1024, r["rss_after_kb"] / 1024
+        print(f"{group:<10} {r['import_ms']:>10.1f} {before:>13.1f} {after:>14.1f} {after - before:>8.1f} "
+              f"{r['modules']:>8}  {','.join(r['heavy_loaded']) or '-'}")
+        if args.importtime:
+            importtime(GROUPS[group])
+
+
+if __name__ == "__main__":
+    main()
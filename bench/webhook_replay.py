@@ -0,0 +1,208 @@
+"""Replay de webhooks do Flowbiz contra o app, com o simulador como origem do catálogo.
+
+Sobe o simulador (`flowbiz_simulator.py`) e o app Flask em threads locais, gera
+eventos sent/open/click para campanhas do catálogo (ou lê um arquivo JSONL com um
+evento por linha) e os envia assinados (HMAC-SHA256) para `/api/webhooks/flowbiz`
+em lotes. Reporta latência de aceite (p50/p95/p99), eventos/s, recusas por fila
+cheia (503), o tempo até a fila esvaziar e confere se os KPIs do snapshot subiram
+exatamente o que foi enviado (repetidos descontados).
+
+Uso:
+    python bench/webhook_replay.py --accounts 3 --campaigns 300 --events 50000 \\
+        --batch 200 --concurrency 8 --duplicates 0.05
+"""
+import contextlib
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+from flowbiz_simulator import build_arg_parser, create_simulator_app, env_for, simulator_from_args  # noqa: E402
+from load_bench import percentile, start_server  # noqa: E402
+
+SECRET = "bench-webhook-secret"
+EVENT_MIX = (("sent", 0.5), ("open", 0.35), ("click", 0.15))
+
+
+def generate_events(keys: List[str], total: int, duplicates: float, seed: int) -> List[Dict[str, Any]]:
+    """Eventos sintéticos; uma fração `duplicates` repete um `EventID` já gerado."""
+    rnd = random.Random(seed)
+    kinds = [kind for kind, _ in EVENT_MIX]
+    weights = [w for _, w in EVENT_MIX]
+    events: List[Dict[str, Any]] = []
+    for n in range(total):
+        if events and rnd.random() < duplicates:
+            events.append(dict(rnd.choice(events)))
+            continue
+        origin, campaign_id = rnd.choice(keys).split(":", 1)
+        events.append({
+            "Event": rnd.choices(kinds, weights)[0],
+            "Origin": origin,
+            "CampaignID": campaign_id,
+            "SubscriberID": str(rnd.randrange(1, 5000)),
+            "EventID": f"bench-{seed}-{n}",
+        })
+    return events
+
+
+def expected_totals(events: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Quanto `sent`/`opens` devem subir (um por `EventID` distinto)."""
+    seen = set()
+    totals = {"sent": 0, "opens": 0}
+    for event in events:
+        if event["EventID"] in seen:
+            continue
+        seen.add(event["EventID"])
+        if event["Event"] == "sent":
+            totals["sent"] += 1
+        elif event["Event"] == "open":
+            totals["opens"] += 1
+    return totals
+
+
+def post_batches(url: str, batches: List[List[Dict[str, Any]]], concurrency: int,
+                 rate: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    counts = {"accepted": 0, "rejected": 0, "full": 0, "errors": 0}
+    lock = threading.Lock()
+    local = threading.local()
+    started = time.perf_counter()
+
+    def one(item):
+        idx, batch = item
+        if rate:
+            # Ritmo fixo de lotes por segundo (somados todos os clientes)
+            delay = started + idx / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = json.dumps({"events": batch}).encode("utf-8")
+        while True:
+            ts = str(int(time.time()))
+            signature = hmac.new(SECRET.encode("utf-8"), ts.encode("ascii") + b"." + body, hashlib.sha256).hexdigest()
+            sent_at = time.perf_counter()
+            try:
+                res = session.post(url, data=body, timeout=60, headers={
+                    "Content-Type": "application/json",
+                    "X-Flowbiz-Timestamp": ts,
+                    "X-Flowbiz-Signature": f"sha256={signature}",
+                })
+            except requests.RequestException:
+                with lock:
+                    counts["errors"] += 1
+                return
+            elapsed = time.perf_counter() - sent_at
+            with lock:
+                latencies.append(elapsed)
+                if res.status_code == 503:
+                    counts["full"] += 1
+                elif res.status_code >= 400:
+                    counts["errors"] += 1
+                else:
+                    counts["accepted"] += res.json().get("accepted", 0)
+                    counts["rejected"] += res.json().get("rejected", 0)
+            if res.status_code != 503:
+                return
+            # Fila cheia: o Flowbiz tentaria de novo; aqui com espera curta
+            time.sleep(0.2)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, enumerate(batches)))
+    wall = time.perf_counter() - started
+    return dict(counts, wall=wall, latencies=latencies)
+
+
+def main() -> None:
+    parser = build_arg_parser()
+    parser.description = __doc__.splitlines()[0]
+    parser.set_defaults(port=0)
+    parser.add_argument("--events", type=int, default=20000, help="eventos sintéticos a enviar")
+    parser.add_argument("--file", help="JSONL com um evento por linha (em vez dos sintéticos)")
+    parser.add_argument("--batch", type=int, default=100, help="eventos por requisição")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=0.0, help="lotes por segundo (0 = sem limite)")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="fração de eventos repetidos")
+    parser.add_argument("--queue-size", type=int, default=10000, help="WEBHOOK_QUEUE_SIZE do app")
+    parser.add_argument("--flush-seconds", type=float, default=0.5, help="WEBHOOK_FLUSH_SECONDS do app")
+    args = parser.parse_args()
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    sim = simulator_from_args(args)
+    sim_server, sim_port = start_server(create_simulator_app(sim), args.host)
+
+    for key in [k for k in os.environ if k.startswith("FLOWBIZ_API_KEY_")]:
+        del os.environ[key]
+    os.environ.update(env_for(sim, args.host, sim_port))
+    os.environ.update(DB_HOST="127.0.0.1", DB_PORT="9", DB_NAME="bench", FLOWBIZ_WEBHOOK_SECRET=SECRET,
+                      WEBHOOK_QUEUE_SIZE=str(args.queue_size), WEBHOOK_FLUSH_SECONDS=str(args.flush_seconds))
+
+    from app import create_app
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+        app.logger.setLevel("ERROR")
+        store = app.extensions["campaign_store"]
+        before = store.snapshot()
+    app_server, app_port = start_server(app, args.host)
+    base = f"http://{args.host}:{app_port}"
+
+    if args.file:
+        with open(args.file, encoding="utf-8") as fh:
+            events = [json.loads(line) for line in fh if line.strip()]
+    else:
+        events = generate_events(before.table.keys(), args.events, args.duplicates, args.seed)
+    batches = [events[i:i + args.batch] for i in range(0, len(events), args.batch)]
+
+    print(f"Simulador: {args.accounts} contas x {args.campaigns} campanhas (snapshot v{before.version})")
+    print(f"Envio: {len(events)} eventos em {len(batches)} lotes de até {args.batch}, concorrência "
+          f"{args.concurrency}, ritmo {args.rate or 'livre'} lotes/s, fila {args.queue_size}\n")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = post_batches(f"{base}/api/webhooks/flowbiz", batches, args.concurrency, args.rate)
+        queue = app.extensions["flowbiz_webhooks"]
+        drain_started = time.perf_counter()
+        while len(queue):
+            time.sleep(0.05)
+        # O último lote já saiu da fila mas pode estar sendo aplicado
+        time.sleep(args.flush_seconds + 0.2)
+        drained = time.perf_counter() - drain_started
+        after = store.snapshot()
+
+    lat = result["latencies"]
+    print(f"aceitos {result['accepted']}  recusados {result['rejected']}  503 {result['full']}  "
+          f"erros {result['errors']}")
+    print(f"aceite p50 {percentile(lat, 50) * 1000:.1f}ms  p95 {percentile(lat, 95) * 1000:.1f}ms  "
+          f"p99 {percentile(lat, 99) * 1000:.1f}ms")
+    print(f"vazão {result['accepted'] / result['wall']:.0f} eventos/s ({result['wall']:.2f}s), "
+          f"fila vazia {drained:.2f}s depois do último envio")
+    status = queue.status()
+    print(f"lotes aplicados {status['batches']}, repetidos descartados {status['duplicate']}, "
+          f"versões {before.version} -> {after.version}")
+    if not args.file:
+        expected = expected_totals(events)
+        for name in ("sent", "opens"):
+            got = after.kpis[name] - before.kpis[name]
+            mark = "ok" if got == expected[name] else "DIVERGENTE"
+            print(f"{name:<6} +{got} (esperado +{expected[name]}) {mark}")
+
+    app_server.shutdown()
+    sim_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Canal de eventos (Server-Sent Events) para campanhas e KPIs.
+
+O `EventBroker` guarda um histórico curto de eventos numerados; cada conexão SSE
+acompanha o último id entregue e, ao reconectar com `Last-Event-ID`, recebe o que
+perdeu (ou um evento `reset` quando o histórico já não cobre a lacuna). O número
+de conexões simultâneas por worker é limitado para não prender todas as threads.
+"""
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from campaign_records import CampaignRecord
+from campaign_store import CampaignSnapshot
+
+# Campos enviados ao navegador para cada campanha alterada (o suficiente para a tabela)
+EVENT_FIELDS = (
+    "CampaignID", "CampaignName", "CampaignStatus", "Origin", "SendProcessFinishedOn", "SendDate",
+    "CreateDateTime", "TotalSent", "EmailsSent", "TotalOpens", "UniqueClicks", "TotalClicks",
+    "QtdLeads", "QtdAcessos",
+)
+
+
+class EventBroker:
+    def __init__(self, max_connections: int = 50, history: int = 500):
+        self.max_connections = max_connections
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._history: deque = deque(maxlen=history)
+        self._last_id = 0
+        self._cond = threading.Condition()
+        self._connections = 0
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    @property
+    def connections(self) -> int:
+        return self._connections
+
+    def try_acquire(self) -> bool:
+        """Reserva uma vaga de conexão; False se o limite do worker foi atingido."""
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._cond:
+            self._connections += 1
+        return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._connections -= 1
+        self._slots.release()
+
+    def publish(self, event: str, data: Dict[str, Any]) -> int:
+        with self._cond:
+            self._last_id += 1
+            self._history.append((self._last_id, event, data))
+            self._cond.notify_all()
+            return self._last_id
+
+    def events_after(self, last_id: int) -> Optional[List[Tuple[int, str, Dict[str, Any]]]]:
+        """Eventos com id > `last_id`; None se parte deles já saiu do histórico."""
+        with self._cond:
+            return self._events_after(last_id)
+
+    def _events_after(self, last_id: int):
+        if last_id >= self._last_id:
+            return []
+        if not self._history or self._history[0][0] > last_id + 1:
+            return None
+        return [ev for ev in self._history if ev[0] > last_id]
+
+    def wait(self, last_id: int, timeout: float) -> Optional[List[Tuple[int, str, Dict[str, Any]]]]:
+        """Bloqueia até haver eventos depois de `last_id` ou até `timeout` (heartbeat)."""
+        with self._cond:
+            if last_id >= self._last_id:
+                self._cond.wait(timeout)
+            return self._events_after(last_id)
+
+
+def format_sse(event_id: Optional[int], event: str, data: Dict[str, Any]) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+    return "\n".join(lines) + "\n\n"
+
+
+# Colunas do `CampaignTable` que, se mudarem, geram evento para a campanha
+_SIGNATURE_COLUMNS = ("name", "status", "sent", "opens", "clicks", "total_clicks", "leads", "accesses",
+                      "finished_at", "send_date", "created_at")
+
+
+def _lean(record: CampaignRecord) -> Dict[str, Any]:
+    full = record.to_dict()
+    item = {f: full[f] for f in EVENT_FIELDS}
+    item["Key"] = record.key
+    return item
+
+
+def _signatures(snap: Optional[CampaignSnapshot]) -> Dict[str, Tuple[int, Tuple]]:
+    if snap is None:
+        return {}
+    # NaN != NaN: datas ausentes entram como texto para a comparação ser estável
+    return {key: (i, tuple(str(v) for v in row))
+            for i, (key, row) in enumerate(zip(snap.table.keys(), snap.table.rows(_SIGNATURE_COLUMNS)))}
+
+
+def snapshot_diff(old: Optional[CampaignSnapshot], new: CampaignSnapshot) -> Dict[str, Any]:
+    """Campanhas novas, alteradas e removidas entre dois snapshots."""
+    if old is not None and new.changed_keys is not None and new.parent_version == old.version:
+        # Versão derivada de `old` só por somas de contadores: as linhas já são conhecidas
+        rows = (new.table.index_of(k) for k in new.changed_keys)
+        changed = [_lean(new.table.record(i)) for i in rows if i is not None]
+        return {"version": new.version, "added": [], "changed": changed, "removed": []}
+    before = _signatures(old)
+    added, changed = [], []
+    seen = set()
+    for key, (i, signature) in _signatures(new).items():
+        seen.add(key)
+        prev = before.get(key)
+        if prev is None:
+            added.append(_lean(new.table.record(i)))
+        elif prev[1] != signature:
+            changed.append(_lean(new.table.record(i)))
+    removed = [k for k in before if k not in seen]
+    return {"version": new.version, "added": added, "changed": changed, "removed": removed}
+
+
+def attach_to_store(broker: EventBroker, store) -> None:
+    """Publica `campaigns` (diff) e `kpis` a cada nova versão do snapshot."""
+    def on_snapshot(old: Optional[CampaignSnapshot], new: CampaignSnapshot) -> None:
+        if old is not None:
+            diff = snapshot_diff(old, new)
+            if diff["added"] or diff["changed"] or diff["removed"]:
+                broker.publish("campaigns", diff)
+        if old is None or old.kpis != new.kpis:
+            broker.publish("kpis", kpis_event(new))
+
+    store.add_listener(on_snapshot)
+
+
+def kpis_event(snap: CampaignSnapshot) -> Dict[str, Any]:
+    return {
+        "version": snap.version,
+        "count": snap.kpis["count"],
+        "kpis": snap.kpis,
+        "partial": snap.partial,
+        "accounts": [{"Origin": a.get("Origin"), "Status": a.get("Status")} for a in snap.accounts],
+        "updated_at": datetime.fromtimestamp(snap.changed_at).isoformat(timespec="seconds"),
+    }
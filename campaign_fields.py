@@ -0,0 +1,76 @@
+"""Projeção de campos das campanhas Flowbiz.
+
+Os objetos de campanha trazem o bloco `Email` completo (HTML, CSS do editor,
+FetchURL, anexos...), dezenas de KB por campanha, enquanto as telas usam cerca
+de dez colunas. `project()` reduz cada campanha aos campos pedidos logo após a
+busca — antes de cache, união entre contas e serialização JSON.
+
+Campos aninhados usam ponto (`Email.Subject`). `fields=all` (ou `*`) desliga a
+projeção.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+# Projeção padrão: o que a listagem, o painel e a busca usam
+LEAN_FIELDS = (
+    "CampaignID", "CampaignName", "CampaignStatus", "CreateDateTime", "SendDate",
+    "SendProcessFinishedOn", "ScheduleType", "TotalRecipients", "TotalSent", "TotalOpens",
+    "UniqueOpens", "TotalClicks", "UniqueClicks", "TotalHardBounces", "TotalSoftBounces",
+    "TotalUnsubscriptions", "ClickStatistics", "OpenStatistics", "RecipientLists",
+    "Origin", "_origin_api", "Email.Subject", "Email.FromName", "Email.FromEmail",
+)
+
+
+def parse_fields(raw: Any, default: Optional[Sequence[str]] = LEAN_FIELDS) -> Optional[List[str]]:
+    """Converte o parâmetro `fields` (texto separado por vírgulas ou lista) numa projeção.
+
+    Retorna None quando nenhuma projeção deve ser aplicada (`all`/`*`).
+    """
+    if raw is None or raw == "" or raw == []:
+        return list(default) if default is not None else None
+    if isinstance(raw, str):
+        items = [f.strip() for f in raw.split(",")]
+    elif isinstance(raw, (list, tuple)):
+        items = [str(f).strip() for f in raw]
+    else:
+        return list(default) if default is not None else None
+    items = [f for f in items if f]
+    if not items or any(f.lower() in {"all", "*"} for f in items):
+        return None
+    # Campos de origem são sempre mantidos: a interface e a união entre contas dependem deles
+    for required in ("CampaignID", "Origin", "_origin_api"):
+        if required not in items:
+            items.append(required)
+    return items
+
+
+def project(campaign: Dict[str, Any], fields: Optional[Sequence[str]]) -> Dict[str, Any]:
+    """Nova campanha só com `fields` (ou a própria campanha se `fields` for None)."""
+    if fields is None or not isinstance(campaign, dict):
+        return campaign
+    out: Dict[str, Any] = {}
+    for field in fields:
+        if "." not in field:
+            if field in campaign:
+                out[field] = campaign[field]
+            continue
+        head, _, rest = field.partition(".")
+        nested = campaign.get(head)
+        if not isinstance(nested, dict):
+            continue
+        value = project(nested, [rest])
+        if value:
+            target = out.setdefault(head, {})
+            if isinstance(target, dict):
+                target.update(value)
+    return out
+
+
+def project_payload(payload: Any, fields: Optional[Sequence[str]]) -> Any:
+    """Aplica a projeção a respostas `Campaign.Get` (`Campaign`) e `Campaigns.Get` (`Campaigns`)."""
+    if fields is None or not isinstance(payload, dict):
+        return payload
+    if isinstance(payload.get("Campaign"), dict):
+        payload["Campaign"] = project(payload["Campaign"], fields)
+    if isinstance(payload.get("Campaigns"), list):
+        payload["Campaigns"] = [project(c, fields) for c in payload["Campaigns"]]
+    return payload
@@ -0,0 +1,460 @@
+"""Registros compactos de campanha para o catálogo em memória.
+
+O Flowbiz devolve cada campanha como um dict com dezenas de chaves em que todo
+número vem como texto (`"515429"`). Para o catálogo de várias contas isso pesa:
+cada campanha vira um dict próprio, com strings repetidas de origem e status.
+
+`CampaignRecord` é a forma normalizada de uma campanha (com `__slots__`): IDs e
+métricas inteiros, datas já convertidas e origem/status internados.
+`CampaignTable` guarda muitas campanhas em colunas (`array` para inteiros e
+datas, códigos para origem e status) e gera o DataFrame do painel direto das
+colunas, sem copiar linha a linha.
+
+Datas ficam como segundos desde 1970 do horário "de parede" informado pelo
+Flowbiz (sem fuso); ausentes ou `0000-00-00` viram NaN.
+"""
+import math
+import sys
+from array import array
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_EPOCH = datetime(1970, 1, 1)
+_NAN = float("nan")
+
+# Formatos aceitos além do ISO (ex.: "10/02/2026 - 09:32"), depois de normalizar separadores
+_LOOSE_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%d-%m-%Y %H:%M:%S",
+    "%d-%m-%Y %H:%M",
+    "%d-%m-%Y",
+)
+
+DATE_FIELDS = ("SendProcessFinishedOn", "SendDate", "CreateDateTime")
+
+# Leads/acessos que o banco não informou (fora do ar ou lento); na API e nos eventos, None
+UNKNOWN = -1
+
+
+def to_int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return 0
+
+
+def parse_timestamp(value: Any) -> float:
+    """Converte as datas do Flowbiz em segundos desde 1970 (NaN se vazia ou inválida)."""
+    if not value:
+        return _NAN
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        s = str(value).strip()
+        if not s or s.startswith("0000"):
+            return _NAN
+        try:
+            dt = datetime.fromisoformat(s)
+        except ValueError:
+            dt = None
+            s_clean = s.replace(" - ", " ").replace("/", "-").replace(".", "-")
+            for fmt in _LOOSE_FORMATS:
+                try:
+                    dt = datetime.strptime(s_clean, fmt)
+                    break
+                except ValueError:
+                    continue
+            if dt is None:
+                return _NAN
+    return (dt.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+
+def format_timestamp(ts: float) -> Optional[str]:
+    if ts != ts:  # NaN
+        return None
+    return (_EPOCH + timedelta(seconds=ts)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def campaign_timestamp(campaign: Dict[str, Any]) -> float:
+    """Data representativa (término do envio > data de envio > criação); -inf se não houver."""
+    for field in DATE_FIELDS:
+        ts = parse_timestamp(campaign.get(field))
+        if ts == ts:
+            return ts
+    return -math.inf
+
+
+def _sum_statistics(stats: Any) -> int:
+    """Soma `Unique` (ou `Total`) de blocos ClickStatistics/OpenStatistics."""
+    total = 0
+    items = stats.values() if isinstance(stats, dict) else stats if isinstance(stats, list) else ()
+    for v in items:
+        if isinstance(v, dict):
+            total += to_int(v.get("Unique", v.get("Total", v.get("Clicks", 0))))
+        elif not isinstance(v, list):
+            total += to_int(v)
+    return total
+
+
+def _db_count(value: Any) -> int:
+    # QtdLeads/QtdAcessos = None: o banco não respondeu (diferente de zero ou ausente)
+    return UNKNOWN if value is None else to_int(value)
+
+
+def _intern(value: Any, default: str = "") -> str:
+    return sys.intern(str(value)) if value else default
+
+
+class CampaignRecord:
+    """Uma campanha normalizada."""
+
+    __slots__ = (
+        "campaign_id", "name", "subject", "origin", "origin_api", "status",
+        "sent", "opens", "clicks", "total_clicks", "leads", "accesses",
+        "finished_at", "send_date", "created_at",
+    )
+
+    def __init__(self, campaign_id: int, name: str, subject: str, origin: str, origin_api: str, status: str,
+                 sent: int, opens: int, clicks: int, total_clicks: int, leads: int, accesses: int,
+                 finished_at: float, send_date: float, created_at: float):
+        self.campaign_id = campaign_id
+        self.name = name
+        self.subject = subject
+        self.origin = origin
+        self.origin_api = origin_api
+        self.status = status
+        self.sent = sent
+        self.opens = opens
+        self.clicks = clicks
+        self.total_clicks = total_clicks
+        self.leads = leads
+        self.accesses = accesses
+        self.finished_at = finished_at
+        self.send_date = send_date
+        self.created_at = created_at
+
+    @classmethod
+    def from_campaign(cls, c: Dict[str, Any]) -> "CampaignRecord":
+        """Normaliza um dict do Flowbiz (já com Origin e, se houver, QtdLeads/QtdAcessos)."""
+        if c.get("UniqueClicks") is not None:
+            clicks = to_int(c.get("UniqueClicks"))
+        else:
+            stats = c.get("ClickStatistics") or c.get("ClickStats") or c.get("Clicks")
+            clicks = _sum_statistics(stats) if stats else to_int(c.get("TotalClicks"))
+        total_clicks = to_int(c.get("TotalClicks")) if c.get("TotalClicks") is not None else clicks
+        if c.get("TotalOpens"):
+            opens = to_int(c.get("TotalOpens"))
+        else:
+            opens = _sum_statistics(c.get("OpenStatistics") or c.get("OpenStats") or c.get("Opens"))
+        email = c.get("Email")
+        subject = c.get("Subject") or (email.get("Subject") if isinstance(email, dict) else None) or ""
+        return cls(
+            campaign_id=to_int(c.get("CampaignID")),
+            name=str(c.get("CampaignName") or ""),
+            subject=str(subject),
+            origin=_intern(c.get("Origin"), "-"),
+            origin_api=_intern(c.get("_origin_api")),
+            status=_intern(c.get("CampaignStatus")),
+            sent=to_int(c.get("TotalSent") or c.get("EmailsSent")),
+            opens=opens,
+            clicks=clicks,
+            total_clicks=total_clicks,
+            leads=_db_count(c.get("QtdLeads", 0)),
+            accesses=_db_count(c.get("QtdAcessos", 0)),
+            finished_at=parse_timestamp(c.get("SendProcessFinishedOn")),
+            send_date=parse_timestamp(c.get("SendDate")),
+            created_at=parse_timestamp(c.get("CreateDateTime")),
+        )
+
+    @property
+    def key(self) -> str:
+        """Mesma chave de `campaign_store.campaign_key`: origem + CampaignID."""
+        return f"{self.origin}:{self.campaign_id}"
+
+    @property
+    def sort_time(self) -> float:
+        for ts in (self.finished_at, self.send_date, self.created_at):
+            if ts == ts:
+                return ts
+        return -math.inf
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forma usada pela API e pelos eventos (nomes de campo do Flowbiz)."""
+        return {
+            # Texto, como vem do Flowbiz (a listagem ao vivo devolve o mesmo formato)
+            "CampaignID": str(self.campaign_id),
+            "CampaignName": self.name,
+            "CampaignStatus": self.status,
+            "Origin": self.origin,
+            "_origin_api": self.origin_api,
+            "Subject": self.subject,
+            "SendProcessFinishedOn": format_timestamp(self.finished_at),
+            "SendDate": format_timestamp(self.send_date),
+            "CreateDateTime": format_timestamp(self.created_at),
+            "TotalSent": self.sent,
+            "EmailsSent": self.sent,
+            "TotalOpens": self.opens,
+            "UniqueClicks": self.clicks,
+            "TotalClicks": self.total_clicks,
+            "QtdLeads": None if self.leads == UNKNOWN else self.leads,
+            "QtdAcessos": None if self.accesses == UNKNOWN else self.accesses,
+        }
+
+
+class _Categories:
+    """Valores repetidos (origem, status) guardados uma vez; cada linha guarda só o código."""
+
+    __slots__ = ("values", "_index")
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        idx = self._index.get(value)
+        if idx is None:
+            idx = self._index[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+
+_INT_COLUMNS = ("campaign_id", "sent", "opens", "clicks", "total_clicks", "leads", "accesses")
+# Contagens do banco, que podem ser `UNKNOWN`
+_DB_COLUMNS = ("leads", "accesses")
+_TIME_COLUMNS = ("finished_at", "send_date", "created_at")
+_CATEGORY_COLUMNS = ("origin", "origin_api", "status")
+
+# Nomes das colunas no DataFrame (os mesmos que o painel já usava)
+_FRAME_NAMES = {
+    "campaign_id": "CampaignID", "name": "CampaignName", "subject": "Subject",
+    "origin": "Origin", "origin_api": "_origin_api", "status": "CampaignStatus",
+    "sent": "EmailsSent", "opens": "TotalOpens", "clicks": "UniqueClicks", "total_clicks": "TotalClicks",
+    "leads": "QtdLeads", "accesses": "QtdAcessos",
+    "finished_at": "SendProcessFinishedOn", "send_date": "SendDate", "created_at": "CreateDateTime",
+}
+
+
+class CampaignTable:
+    """Campanhas em colunas: `array('q')` para inteiros, `array('d')` para datas, códigos para textos repetidos.
+
+    Depois de `to_dataframe()` a tabela não deve receber novas linhas (o DataFrame
+    aponta para os mesmos buffers). Tabelas abertas com `from_buffer()` (ex.: de um
+    arquivo mapeado em memória) são somente leitura: as colunas numéricas são
+    `memoryview` sobre o buffer, sem cópia.
+    """
+
+    def __init__(self):
+        self._ints = {name: array("q") for name in _INT_COLUMNS}
+        self._times = {name: array("d") for name in _TIME_COLUMNS}
+        self._categories = {name: _Categories() for name in _CATEGORY_COLUMNS}
+        self._codes = {name: array("i") for name in _CATEGORY_COLUMNS}
+        self.names: List[str] = []
+        self.subjects: List[str] = []
+        self._order: Optional[List[int]] = None
+        self._key_index: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_campaigns(cls, campaigns: Iterable[Dict[str, Any]]) -> "CampaignTable":
+        table = cls()
+        for c in campaigns:
+            table.append(CampaignRecord.from_campaign(c))
+        return table
+
+    @classmethod
+    def from_records(cls, records: Iterable[CampaignRecord]) -> "CampaignTable":
+        table = cls()
+        for r in records:
+            table.append(r)
+        return table
+
+    def dump(self, fh) -> Dict[str, Any]:
+        """Grava as colunas numéricas em `fh` (alinhadas em 8 bytes) e devolve o layout.
+
+        O layout (offsets relativos ao início da gravação, categorias e textos) é
+        JSON-serializável e, junto com os bytes, reconstrói a tabela em `from_buffer()`.
+        """
+        layout: Dict[str, Any] = {"rows": len(self), "columns": {}}
+        offset = 0
+        for group in (self._ints, self._times, self._codes):
+            for name, column in group.items():
+                data = column.tobytes() if isinstance(column, array) else bytes(column)
+                pad = (-len(data)) % 8
+                fh.write(data + b"\0" * pad)
+                layout["columns"][name] = [offset, len(data), column.typecode if isinstance(column, array)
+                                           else column.format]
+                offset += len(data) + pad
+        layout["size"] = offset
+        layout["categories"] = {name: cats.values for name, cats in self._categories.items()}
+        layout["names"] = self.names
+        layout["subjects"] = self.subjects
+        return layout
+
+    @classmethod
+    def from_buffer(cls, buf, layout: Dict[str, Any]) -> "CampaignTable":
+        """Tabela somente leitura sobre `buf` (bytes, mmap...) gravado por `dump()`."""
+        view = memoryview(buf)
+        table = cls()
+        for group in (table._ints, table._times, table._codes):
+            for name in list(group):
+                offset, length, typecode = layout["columns"][name]
+                group[name] = view[offset:offset + length].cast(typecode)
+        for name, values in layout["categories"].items():
+            cats = table._categories[name]
+            for value in values:
+                cats.code(sys.intern(value))
+        table.names = layout["names"]
+        table.subjects = layout["subjects"]
+        return table
+
+    def append(self, record: CampaignRecord) -> None:
+        for name, column in self._ints.items():
+            column.append(getattr(record, name))
+        for name, column in self._times.items():
+            column.append(getattr(record, name))
+        for name, column in self._codes.items():
+            column.append(self._categories[name].code(getattr(record, name)))
+        self.names.append(record.name)
+        self.subjects.append(record.subject)
+        self._order = None
+        self._key_index = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def record(self, i: int) -> CampaignRecord:
+        ints, times, codes, cats = self._ints, self._times, self._codes, self._categories
+        return CampaignRecord(
+            campaign_id=ints["campaign_id"][i], name=self.names[i], subject=self.subjects[i],
+            origin=cats["origin"].values[codes["origin"][i]],
+            origin_api=cats["origin_api"].values[codes["origin_api"][i]],
+            status=cats["status"].values[codes["status"][i]],
+            sent=ints["sent"][i], opens=ints["opens"][i], clicks=ints["clicks"][i],
+            total_clicks=ints["total_clicks"][i], leads=ints["leads"][i], accesses=ints["accesses"][i],
+            finished_at=times["finished_at"][i], send_date=times["send_date"][i], created_at=times["created_at"][i],
+        )
+
+    def __iter__(self) -> Iterator[CampaignRecord]:
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def column(self, name: str):
+        """Coluna crua (`array` para números/datas, lista de textos para os demais)."""
+        if name in self._ints:
+            return self._ints[name]
+        if name in self._times:
+            return self._times[name]
+        if name in self._codes:
+            values = self._categories[name].values
+            return [values[code] for code in self._codes[name]]
+        if name == "name":
+            return self.names
+        if name == "subject":
+            return self.subjects
+        raise KeyError(name)
+
+    def keys(self) -> List[str]:
+        origins = self._categories["origin"].values
+        return [f"{origins[o]}:{cid}" for o, cid in zip(self._codes["origin"], self._ints["campaign_id"])]
+
+    def index_of(self, key: str) -> Optional[int]:
+        """Linha da campanha com a chave `origem:CampaignID` (mapa calculado uma vez)."""
+        if self._key_index is None:
+            self._key_index = {k: i for i, k in enumerate(self.keys())}
+        return self._key_index.get(key)
+
+    def with_deltas(self, deltas: Dict[str, Dict[str, int]]) -> Tuple["CampaignTable", List[Tuple[str, str, int]]]:
+        """Cópia com os contadores somados: {chave: {"opens": 1, ...}} (nunca abaixo de zero).
+
+        Só as colunas inteiras são copiadas; datas, códigos e textos são compartilhados
+        com esta tabela. Devolve também (chave, coluna, variação aplicada) de cada soma;
+        chaves desconhecidas são ignoradas.
+        """
+        table = CampaignTable.__new__(CampaignTable)
+        table._ints = {}
+        for name, column in self._ints.items():
+            copied = array("q")
+            copied.frombytes(memoryview(column).cast("B"))  # array ou memoryview (somente leitura)
+            table._ints[name] = copied
+        table._times = self._times
+        table._categories = self._categories
+        table._codes = self._codes
+        table.names = self.names
+        table.subjects = self.subjects
+        table._order = self._order
+        self.index_of("")  # garante o mapa, compartilhado com a cópia
+        table._key_index = self._key_index
+        applied = []
+        for key, changes in deltas.items():
+            i = self._key_index.get(key)
+            if i is None:
+                continue
+            for name, amount in changes.items():
+                column = table._ints[name]
+                if column[i] == UNKNOWN and name in _DB_COLUMNS:
+                    continue
+                new_value = max(0, column[i] + amount)
+                if new_value != column[i]:
+                    applied.append((key, name, new_value - column[i]))
+                    column[i] = new_value
+        return table, applied
+
+    def rows(self, names: Tuple[str, ...]) -> Iterator[Tuple]:
+        """Tuplas com as colunas pedidas, linha a linha (para comparações e somas)."""
+        return zip(*(self.column(n) for n in names))
+
+    def order_by_time(self) -> List[int]:
+        """Índices das linhas da campanha mais recente para a mais antiga (calculado uma vez)."""
+        if self._order is None:
+            def best(row):
+                for ts in row:
+                    if ts == ts:
+                        return ts
+                return -math.inf
+            times = [best(row) for row in self.rows(_TIME_COLUMNS)]
+            self._order = sorted(range(len(times)), key=times.__getitem__, reverse=True)
+        return self._order
+
+    def nbytes(self) -> int:
+        """Tamanho aproximado das colunas (sem contar os textos compartilhados)."""
+        total = sum(len(c) * c.itemsize for c in self._ints.values())
+        total += sum(len(c) * c.itemsize for c in self._times.values())
+        total += sum(len(c) * c.itemsize for c in self._codes.values())
+        total += sys.getsizeof(self.names) + sys.getsizeof(self.subjects)
+        total += sum(sys.getsizeof(s) for s in self.names) + sum(sys.getsizeof(s) for s in self.subjects)
+        return total
+
+    def to_dataframe(self):
+        """DataFrame com as colunas do painel (inteiros e códigos sem cópia por linha)."""
+        import numpy as np
+        import pandas as pd
+
+        if not len(self):
+            return pd.DataFrame()
+        data: Dict[str, Any] = {}
+        for name, column in self._ints.items():
+            values = np.frombuffer(column, dtype=np.int64)
+            if name in _DB_COLUMNS and (values == UNKNOWN).any():
+                # Inteiro com nulos (pd.NA), para não somar nem exibir -1
+                values = pd.arrays.IntegerArray(values.copy(), values == UNKNOWN)
+            data[_FRAME_NAMES[name]] = values
+        for name, column in self._codes.items():
+            data[_FRAME_NAMES[name]] = pd.Categorical.from_codes(
+                np.frombuffer(column, dtype=np.int32), categories=self._categories[name].values)
+        data["CampaignName"] = self.names
+        data["Subject"] = self.subjects
+        raw_times = {name: np.frombuffer(column, dtype=np.float64) for name, column in self._times.items()}
+        for name, values in raw_times.items():
+            data[_FRAME_NAMES[name]] = pd.to_datetime(values, unit="s")
+        # Data representativa: a primeira disponível entre término, envio e criação
+        best = raw_times["finished_at"]
+        for name in ("send_date", "created_at"):
+            best = np.where(np.isnan(best), raw_times[name], best)
+        data["send_date"] = pd.to_datetime(best, unit="s")
+        df = pd.DataFrame(data, copy=False)
+        df["TotalSent"] = df["EmailsSent"]
+        return df
@@ -0,0 +1,275 @@
+"""Totais pré-agregados por (dia, origem), mantidos junto com o snapshot.
+
+`MetricRollups` guarda, para cada dia e conta, a soma de campanhas, envios,
+aberturas, cliques únicos, leads e acessos, e quantas campanhas estão com leads/
+acessos desconhecidos (banco fora do ar na renovação; `stats_unknown`). Ligado ao `CampaignStore` como
+ouvinte, só ajusta as linhas das campanhas que entraram, mudaram ou saíram: a
+contribuição de cada campanha fica registrada e é subtraída/somada quando muda.
+
+O dia de uma campanha é a primeira data disponível entre término do envio,
+envio e criação (a mesma do painel); campanhas sem data não entram nas séries.
+`trends()` monta a série de um intervalo (por dia, semana ou mês) e compara os
+totais com o período anterior de mesmo tamanho ou com o mesmo período do ano
+anterior.
+"""
+import math
+import threading
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+METRICS = ("count", "sent", "opens", "clicks", "leads", "accesses", "stats_unknown")
+# Somas que ficam desconhecidas (None) quando nenhuma campanha do período tem contagem
+_DB_METRICS = ("leads", "accesses")
+GRANULARITIES = ("day", "week", "month")
+COMPARISONS = ("previous", "year", "none")
+# Séries maiores que isso pedem uma granularidade mais grossa
+MAX_PERIODS = 1000
+
+_ROW_COLUMNS = ("origin", "sent", "opens", "clicks", "leads", "accesses", "finished_at", "send_date", "created_at")
+_EPOCH = date(1970, 1, 1)
+
+Bucket = Tuple[int, str]
+
+
+def day_number(ts: float) -> Optional[int]:
+    """Dia (contado desde 1970-01-01) de um timestamp de `parse_timestamp`; None se ausente."""
+    if ts != ts or ts in (math.inf, -math.inf):
+        return None
+    return int(ts // 86400)
+
+
+def day_to_date(day: int) -> date:
+    return _EPOCH + timedelta(days=day)
+
+
+def date_to_day(value: date) -> int:
+    return (value - _EPOCH).days
+
+
+def _period_start(day: int, granularity: str) -> int:
+    if granularity == "week":
+        return day - day_to_date(day).weekday()  # segunda-feira
+    if granularity == "month":
+        return date_to_day(day_to_date(day).replace(day=1))
+    return day
+
+
+def _next_period(start: int, granularity: str) -> int:
+    if granularity == "week":
+        return start + 7
+    if granularity == "month":
+        d = day_to_date(start)
+        return date_to_day(date(d.year + d.month // 12, d.month % 12 + 1, 1))
+    return start + 1
+
+
+def _shift_year(value: date, years: int) -> date:
+    try:
+        return value.replace(year=value.year + years)
+    except ValueError:  # 29/02 -> 28/02
+        return value.replace(year=value.year + years, day=28)
+
+
+def _empty() -> Dict[str, Any]:
+    return dict.fromkeys(METRICS, 0)
+
+
+def _contribution(sent: int, opens: int, clicks: int, leads: int, accesses: int) -> Tuple[int, ...]:
+    # Leads/acessos desconhecidos (-1) não entram nas somas; contam em stats_unknown
+    unknown = leads < 0 or accesses < 0
+    return (1, sent, opens, clicks, max(0, leads), max(0, accesses), int(unknown))
+
+
+def _with_rates(row: Dict[str, Any]) -> Dict[str, Any]:
+    if row["count"] and row["stats_unknown"] >= row["count"]:
+        for name in _DB_METRICS:
+            row[name] = None
+    sent, opens = row["sent"], row["opens"]
+    row["open_rate"] = round(opens / sent, 4) if sent else None
+    row["click_rate"] = round(row["clicks"] / sent, 4) if sent else None
+    row["click_to_open"] = round(row["clicks"] / opens, 4) if opens else None
+    return row
+
+
+def _change(current: Dict[str, Any], previous: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    out = {}
+    for name in METRICS:
+        cur, prev = current[name], previous[name]
+        if cur is None or prev is None:
+            out[name] = {"delta": None, "pct": None}
+            continue
+        out[name] = {"delta": cur - prev, "pct": round((cur - prev) / prev * 100, 2) if prev else None}
+    return out
+
+
+class MetricRollups:
+    def __init__(self):
+        self._rows: Dict[Bucket, List[int]] = {}
+        # Contribuição atual de cada campanha: chave -> (dia, origem, valores)
+        self._contrib: Dict[str, Tuple[Optional[int], str, Tuple[int, ...]]] = {}
+        self._lock = threading.Lock()
+        self.version: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # --- Atualização ---------------------------------------------------------------
+
+    def _apply(self, day: Optional[int], origin: str, values: Tuple[int, ...], sign: int) -> None:
+        if day is None:
+            return
+        row = self._rows.get((day, origin))
+        if row is None:
+            row = self._rows[(day, origin)] = [0] * len(METRICS)
+        for i, v in enumerate(values):
+            row[i] += sign * v
+        if not row[0]:
+            del self._rows[(day, origin)]
+
+    def update_from_snapshot(self, snap) -> Dict[str, int]:
+        """Ajusta os totais ao `snap.table`; devolve quantas campanhas entraram, mudaram e saíram."""
+        table = snap.table
+        if snap.changed_keys is not None and snap.parent_version == self.version:
+            # Versão derivada da anterior só por somas: basta olhar as campanhas alteradas
+            return self._update_keys(snap)
+        rows = list(zip(table.keys(), table.rows(_ROW_COLUMNS)))
+        added = changed = 0
+        with self._lock:
+            seen = set()
+            for key, (origin, sent, opens, clicks, leads, accesses, *times) in rows:
+                seen.add(key)
+                day = day_number(next((t for t in times if t == t), math.nan))
+                entry = (day, origin, _contribution(sent, opens, clicks, leads, accesses))
+                prev = self._contrib.get(key)
+                if prev == entry:
+                    continue
+                if prev is None:
+                    added += 1
+                else:
+                    changed += 1
+                    self._apply(*prev, sign=-1)
+                self._apply(*entry, sign=1)
+                self._contrib[key] = entry
+            removed = [k for k in self._contrib if k not in seen]
+            for key in removed:
+                self._apply(*self._contrib.pop(key), sign=-1)
+            self.version = snap.version
+        return {"added": added, "changed": changed, "removed": len(removed), "rows": len(self._rows)}
+
+    def _update_keys(self, snap) -> Dict[str, int]:
+        table = snap.table
+        changed = 0
+        with self._lock:
+            for key in snap.changed_keys:
+                i = table.index_of(key)
+                prev = self._contrib.get(key)
+                if i is None or prev is None:
+                    continue
+                r = table.record(i)
+                entry = (prev[0], prev[1], _contribution(r.sent, r.opens, r.clicks, r.leads, r.accesses))
+                if entry != prev:
+                    changed += 1
+                    self._apply(*prev, sign=-1)
+                    self._apply(*entry, sign=1)
+                    self._contrib[key] = entry
+            self.version = snap.version
+        return {"added": 0, "changed": changed, "removed": 0, "rows": len(self._rows)}
+
+    # --- Consulta ------------------------------------------------------------------
+
+    def day_range(self) -> Optional[Tuple[int, int]]:
+        """Primeiro e último dia com campanhas."""
+        with self._lock:
+            days = [day for day, _ in self._rows]
+        return (min(days), max(days)) if days else None
+
+    def origins(self) -> List[str]:
+        with self._lock:
+            return sorted({origin for _, origin in self._rows})
+
+    def _select(self, first: int, last: int, origin: Optional[str]) -> List[Tuple[int, str, List[int]]]:
+        with self._lock:
+            return [(day, o, list(values)) for (day, o), values in self._rows.items()
+                    if first <= day <= last and (not origin or o == origin)]
+
+    def totals(self, first: int, last: int, origin: Optional[str] = None) -> Dict[str, Any]:
+        """Totais de `first` a `last` (dias, inclusive), geral e por origem."""
+        total = _empty()
+        by_origin: Dict[str, Dict[str, Any]] = {}
+        for _, o, values in self._select(first, last, origin):
+            row = by_origin.get(o)
+            if row is None:
+                row = by_origin[o] = _empty()
+            for name, v in zip(METRICS, values):
+                total[name] += v
+                row[name] += v
+        total = _with_rates(total)
+        total["by_origin"] = {o: _with_rates(row) for o, row in sorted(by_origin.items())}
+        return total
+
+    def series(self, first: int, last: int, origin: Optional[str] = None,
+               granularity: str = "day") -> List[Dict[str, Any]]:
+        """Totais por período de `first` a `last`, com os períodos vazios preenchidos com zero.
+
+        Em períodos em que todas as campanhas estão sem contagem do banco, leads e
+        acessos vêm None (desconhecidos), não zero; `stats_unknown` diz quantas faltam.
+        """
+        periods: Dict[int, Dict[str, Any]] = {}
+        start = _period_start(first, granularity)
+        while start <= last:
+            periods[start] = _empty()
+            start = _next_period(start, granularity)
+        for day, _, values in self._select(first, last, origin):
+            row = periods[_period_start(day, granularity)]
+            for name, v in zip(METRICS, values):
+                row[name] += v
+        return [dict(_with_rates(row), period=day_to_date(start).isoformat())
+                for start, row in sorted(periods.items())]
+
+    def trends(self, first: int, last: int, origin: Optional[str] = None,
+               granularity: str = "day", compare: str = "previous") -> Dict[str, Any]:
+        """Série do intervalo, totais e comparação com o período de referência."""
+        result: Dict[str, Any] = {
+            "From": day_to_date(first).isoformat(),
+            "To": day_to_date(last).isoformat(),
+            "Origin": origin,
+            "Granularity": granularity,
+            "Series": self.series(first, last, origin, granularity),
+            "Totals": self.totals(first, last, origin),
+            "Version": self.version,
+        }
+        if compare != "none":
+            if compare == "year":
+                prev_first = date_to_day(_shift_year(day_to_date(first), -1))
+                prev_last = date_to_day(_shift_year(day_to_date(last), -1))
+            else:
+                prev_last = first - 1
+                prev_first = prev_last - (last - first)
+            previous = self.totals(prev_first, prev_last, origin)
+            result["Previous"] = {
+                "Compare": compare,
+                "From": day_to_date(prev_first).isoformat(),
+                "To": day_to_date(prev_last).isoformat(),
+                "Totals": previous,
+            }
+            result["Change"] = _change(result["Totals"], previous)
+        return result
+
+
+def periods_between(first: int, last: int, granularity: str) -> int:
+    if granularity == "week":
+        return (_period_start(last, "week") - _period_start(first, "week")) // 7 + 1
+    if granularity == "month":
+        a, b = day_to_date(first), day_to_date(last)
+        return (b.year - a.year) * 12 + b.month - a.month + 1
+    return last - first + 1
+
+
+def attach_rollups(rollups: MetricRollups, store, logger=None) -> None:
+    """Atualiza os totais a cada nova versão do snapshot."""
+    def on_snapshot(old, new) -> None:
+        stats = rollups.update_from_snapshot(new)
+        if logger:
+            logger.debug("Totais por dia/origem v%s: %s", new.version, stats)
+
+    store.add_listener(on_snapshot)
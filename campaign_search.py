@@ -0,0 +1,257 @@
+"""Busca de campanhas em memória (todas as contas), sem acento e sem caixa.
+
+`CampaignIndex` mantém um índice invertido termo -> campanhas sobre nome, assunto
+e origem, mais a lista ordenada dos termos para busca por prefixo ("atual" acha
+"ATUALIZAÇÃO"). Ligado ao `CampaignStore` como ouvinte, é atualizado só com as
+campanhas que entraram, mudaram ou saíram a cada nova versão do snapshot.
+
+Cada termo da consulta é tratado como prefixo e todos precisam casar (E); status,
+origem e intervalo de datas filtram o resultado, ordenado da mais recente para a
+mais antiga.
+"""
+import bisect
+import math
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from campaign_records import format_timestamp
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+_TIME_COLUMNS = ("finished_at", "send_date", "created_at")
+_DOC_COLUMNS = ("campaign_id", "name", "subject", "origin", "status") + _TIME_COLUMNS
+
+
+def normalize(text: str) -> str:
+    """Minúsculas e sem acentos ("ATUALIZAÇÃO" -> "atualizacao")."""
+    text = str(text or "").casefold()
+    if not text.isascii():
+        # Decompor e descartar o que não é ASCII (os acentos combinantes)
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return text
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+class _Doc:
+    __slots__ = ("campaign_id", "name", "subject", "origin", "status", "ts", "terms")
+
+    def __init__(self, campaign_id: int, name: str, subject: str, origin: str, status: str, ts: float):
+        self.campaign_id = campaign_id
+        self.name = name
+        self.subject = subject
+        self.origin = origin
+        self.status = status
+        self.ts = ts
+        self.terms = frozenset(tokenize(name) + tokenize(subject) + tokenize(origin))
+
+    @property
+    def signature(self) -> Tuple:
+        return (self.name, self.subject, self.origin, self.status, self.ts)
+
+    def to_dict(self, key: str) -> Dict[str, Any]:
+        return {
+            "Key": key,
+            # Texto, como na listagem e nos eventos
+            "CampaignID": str(self.campaign_id),
+            "CampaignName": self.name,
+            "Subject": self.subject,
+            "Origin": self.origin,
+            "CampaignStatus": self.status,
+            "Date": format_timestamp(self.ts) if self.ts != -math.inf else None,
+        }
+
+
+class CampaignIndex:
+    # Prefixos curtos demais casariam com quase tudo: abaixo disso, só o termo exato
+    MIN_PREFIX = 2
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._keys: List[Optional[str]] = []
+        self._docs: List[Optional[_Doc]] = []
+        self._postings: Dict[str, Set[int]] = {}
+        self._terms: List[str] = []  # ordenada, para prefixos
+        self._new_terms: List[str] = []  # entram em `_terms` de uma vez ao fim da atualização
+        self._by_status: Dict[str, Set[int]] = {}
+        self._by_origin: Dict[str, Set[int]] = {}
+        # Ids da campanha mais recente para a mais antiga e -data correspondente (para bisect)
+        self._order: Optional[List[int]] = None
+        self._order_neg_ts: List[float] = []
+        self._prefix_cache: Dict[str, Set[int]] = {}
+        self._lock = threading.Lock()
+        self.version: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # --- Atualização ---------------------------------------------------------------
+
+    def _index(self, doc_id: int, doc: _Doc) -> None:
+        for term in doc.terms:
+            ids = self._postings.get(term)
+            if ids is None:
+                ids = self._postings[term] = set()
+                self._new_terms.append(term)
+            ids.add(doc_id)
+        self._by_status.setdefault(doc.status.casefold(), set()).add(doc_id)
+        self._by_origin.setdefault(doc.origin, set()).add(doc_id)
+
+    def _unindex(self, doc_id: int, doc: _Doc) -> None:
+        for term in doc.terms:
+            ids = self._postings.get(term)
+            if ids is None:
+                continue
+            ids.discard(doc_id)
+            if not ids:
+                del self._postings[term]
+                idx = bisect.bisect_left(self._terms, term)
+                if idx < len(self._terms) and self._terms[idx] == term:
+                    del self._terms[idx]
+        self._by_status.get(doc.status.casefold(), set()).discard(doc_id)
+        self._by_origin.get(doc.origin, set()).discard(doc_id)
+
+    def update_from_snapshot(self, snap) -> Dict[str, int]:
+        """Sincroniza com `snap.table`; devolve quantas campanhas entraram, mudaram e saíram."""
+        if snap.changed_keys is not None and snap.parent_version == self.version:
+            # Só contadores mudaram (`CampaignStore.apply_deltas`): nada indexado mudou
+            self.version = snap.version
+            return {"added": 0, "changed": 0, "removed": 0}
+        table = snap.table
+        rows = list(zip(table.keys(), table.rows(_DOC_COLUMNS)))
+        added = changed = 0
+        with self._lock:
+            seen = set()
+            for key, (cid, name, subject, origin, status, *times) in rows:
+                seen.add(key)
+                ts = next((t for t in times if t == t), -math.inf)
+                doc_id = self._ids.get(key)
+                prev = self._docs[doc_id] if doc_id is not None else None
+                if prev is not None and prev.signature == (name, subject, origin, status, ts):
+                    continue
+                doc = _Doc(cid, name, subject, origin, status, ts)
+                if prev is None:
+                    added += 1
+                    doc_id = self._ids[key] = len(self._docs)
+                    self._docs.append(doc)
+                    self._keys.append(key)
+                else:
+                    changed += 1
+                    self._unindex(doc_id, prev)
+                    self._docs[doc_id] = doc
+                self._index(doc_id, doc)
+            removed = [k for k in self._ids if k not in seen]
+            for key in removed:
+                doc_id = self._ids.pop(key)
+                self._unindex(doc_id, self._docs[doc_id])
+                self._docs[doc_id] = None
+                self._keys[doc_id] = None
+            if self._new_terms:
+                # Termos criados e já removidos na mesma atualização ficam de fora
+                self._terms = sorted(self._terms + [t for t in self._new_terms if t in self._postings])
+                self._new_terms = []
+            if added or changed or removed:
+                self._order = None
+                self._prefix_cache.clear()
+                self._ordered()  # fora do caminho das consultas
+            self.version = snap.version
+        return {"added": added, "changed": changed, "removed": len(removed)}
+
+    # --- Consulta ------------------------------------------------------------------
+
+    def _ordered(self) -> Tuple[List[int], List[float]]:
+        if self._order is None:
+            live = sorted((-doc.ts, doc_id) for doc_id, doc in enumerate(self._docs) if doc is not None)
+            self._order = [doc_id for _, doc_id in live]
+            self._order_neg_ts = [neg for neg, _ in live]
+        return self._order, self._order_neg_ts
+
+    def _prefix_ids(self, prefix: str) -> Set[int]:
+        if len(prefix) < self.MIN_PREFIX:
+            return self._postings.get(prefix, set())
+        cached = self._prefix_cache.get(prefix)
+        if cached is not None:
+            return cached
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + "\uffff")
+        if end - start == 1:
+            found = self._postings.get(self._terms[start], set())
+        else:
+            found = set().union(*(self._postings.get(t, ()) for t in self._terms[start:end]))
+        if len(self._prefix_cache) >= 256:
+            self._prefix_cache.clear()
+        self._prefix_cache[prefix] = found
+        return found
+
+    def search(self, query: str = "", status: Optional[str] = None, origin: Optional[str] = None,
+               date_from: Optional[float] = None, date_to: Optional[float] = None,
+               limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """Campanhas que casam com todos os termos (prefixo) e filtros, mais recentes primeiro."""
+        started = time.perf_counter()
+        terms = sorted(set(tokenize(query)), key=len, reverse=True)
+        wanted = offset + limit
+        with self._lock:
+            # Conjuntos de ids (nunca alterados aqui); None = todas as campanhas
+            candidates: Optional[Set[int]] = None
+            filters = [self._prefix_ids(t) for t in terms]
+            if status:
+                filters.append(self._by_status.get(status.casefold(), set()))
+            if origin:
+                filters.append(self._by_origin.get(origin, set()))
+            for ids in sorted(filters, key=len):
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    break
+
+            order, neg_ts = self._ordered()
+            lo = 0 if date_to is None else bisect.bisect_left(neg_ts, -date_to)
+            hi = len(order) if date_from is None else bisect.bisect_right(neg_ts, -date_from)
+            hi = max(lo, hi)
+            if candidates is None:
+                total = hi - lo
+                page_ids = order[lo + offset:lo + wanted]
+            elif len(candidates) * 8 < hi - lo:
+                # Poucos candidatos: ordenar só eles
+                docs = self._docs
+                hits = [i for i in candidates if -neg_ts[lo] >= docs[i].ts >= -neg_ts[hi - 1]] \
+                    if (lo, hi) != (0, len(order)) else list(candidates)
+                hits.sort(key=lambda i: docs[i].ts, reverse=True)
+                total = len(hits)
+                page_ids = hits[offset:wanted]
+            elif (lo, hi) == (0, len(order)):
+                # Muitos candidatos: percorrer a ordem por data até encher a página
+                total = len(candidates)
+                page_ids = []
+                for i in order:
+                    if i in candidates:
+                        page_ids.append(i)
+                        if len(page_ids) >= wanted:
+                            break
+                page_ids = page_ids[offset:]
+            else:
+                hits = [i for i in order[lo:hi] if i in candidates]
+                total = len(hits)
+                page_ids = hits[offset:wanted]
+            page = [self._docs[i].to_dict(self._keys[i]) for i in page_ids]
+            version = self.version
+        return {
+            "Query": query,
+            "Total": total,
+            "Results": page,
+            "Version": version,
+            "TookMs": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+
+def attach_index(index: CampaignIndex, store, logger=None) -> None:
+    """Atualiza o índice a cada nova versão do snapshot."""
+    def on_snapshot(old, new) -> None:
+        stats = index.update_from_snapshot(new)
+        if logger:
+            logger.debug("Índice de busca v%s: %s", new.version, stats)
+
+    store.add_listener(on_snapshot)
@@ -0,0 +1,407 @@
+"""Snapshot mantido do catálogo de campanhas de todas as contas.
+
+Em vez de cada requisição (ou cada aba do painel) baixar todas as contas do
+Flowbiz, o `CampaignStore` guarda o último snapshot com os KPIs já calculados e
+o renova no máximo uma vez por `ttl`. Quem pede um snapshot vencido recebe o
+atual imediatamente enquanto uma única thread renova em segundo plano; só a
+primeira chamada (sem snapshot algum) espera pela busca.
+
+Com `shared` (um `shared_snapshot.SharedSnapshot`), vários processos dividem o
+mesmo snapshot: só o worker eleito busca e grava o arquivo, numa thread própria;
+os demais carregam o arquivo quando ele muda. A versão é a do arquivo, então os
+caches derivados (DataFrames, figuras) de todos os workers mudam juntos.
+
+Entre as renovações, `apply_deltas` soma contadores recebidos por push (webhooks
+do Flowbiz) ao snapshot atual e publica uma versão nova. Somas recebidas depois
+que uma busca terminou são reaplicadas ao resultado dela, para não se perderem;
+as recebidas durante a busca não (podem já estar nos totais do Flowbiz, e somá-las
+de novo contaria o evento duas vezes). A busca seguinte volta a ser a referência.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from campaign_records import UNKNOWN, CampaignTable
+
+FetchResult = Tuple[List[Dict[str, Any]], List[Dict[str, Any]], bool]
+
+
+def campaign_key(campaign: Dict[str, Any]) -> str:
+    """Chave única entre contas: origem + CampaignID."""
+    return f"{campaign.get('Origin', '-')}:{campaign.get('CampaignID', '')}"
+
+
+_KPI_COLUMNS = ("origin", "sent", "opens", "clicks", "leads", "accesses")
+
+
+def compute_kpis(table: CampaignTable) -> Dict[str, Any]:
+    """Totais de campanhas, envios, aberturas, cliques únicos, leads e acessos (geral e por origem).
+
+    Leads e acessos somam só as campanhas com contagem conhecida; `stats_unknown`
+    diz quantas ficaram sem (banco fora do ar ou lento na renovação).
+    """
+    def empty():
+        return {"count": 0, "sent": 0, "opens": 0, "clicks": 0, "leads": 0, "accesses": 0, "stats_unknown": 0}
+
+    totals = empty()
+    by_origin: Dict[str, Dict[str, int]] = {}
+    for origin, sent, opens, clicks, leads, accesses in table.rows(_KPI_COLUMNS):
+        row = by_origin.get(origin)
+        if row is None:
+            row = by_origin[origin] = empty()
+        for target in (totals, row):
+            target["count"] += 1
+            target["sent"] += sent
+            target["opens"] += opens
+            target["clicks"] += clicks
+            if leads == UNKNOWN or accesses == UNKNOWN:
+                target["stats_unknown"] += 1
+            target["leads"] += max(0, leads)
+            target["accesses"] += max(0, accesses)
+    totals["by_origin"] = by_origin
+    return totals
+
+
+_KPI_DELTA_FIELDS = {"sent": "sent", "opens": "opens", "clicks": "clicks", "leads": "leads", "accesses": "accesses"}
+
+
+def kpis_with_deltas(kpis: Dict[str, Any], applied: List[Tuple[str, str, int]]) -> Dict[str, Any]:
+    """KPIs de `compute_kpis` atualizados com as somas de `CampaignTable.with_deltas`."""
+    totals = dict(kpis)
+    by_origin = {origin: dict(row) for origin, row in kpis.get("by_origin", {}).items()}
+    for key, column, amount in applied:
+        field = _KPI_DELTA_FIELDS.get(column)
+        if field is None:
+            continue
+        totals[field] += amount
+        row = by_origin.get(key.split(":", 1)[0])
+        if row is not None:
+            row[field] += amount
+    totals["by_origin"] = by_origin
+    return totals
+
+
+class CampaignSnapshot:
+    """Resultado imutável de uma renovação do catálogo (campanhas em `CampaignTable`)."""
+
+    def __init__(self, version: int, table: CampaignTable, accounts: List[Dict[str, Any]],
+                 partial: bool, fingerprint: str, kpis: Optional[Dict[str, Any]] = None):
+        self.version = version
+        self.built_at = time.time()
+        self.table = table
+        self.accounts = accounts
+        self.partial = partial
+        self.fingerprint = fingerprint
+        # Momento da última mudança de conteúdo (mantido entre renovações sem mudança)
+        self.changed_at = self.built_at
+        self.kpis = kpis if kpis is not None else compute_kpis(table)
+        # Versão criada por `apply_deltas`: versão de origem e campanhas alteradas,
+        # para os ouvintes olharem só essas linhas
+        self.parent_version: Optional[int] = None
+        self.changed_keys: Optional[List[str]] = None
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.built_at
+
+
+class CampaignStore:
+    """Mantém o snapshot mais recente e avisa os ouvintes quando ele muda.
+
+    `fetch` devolve (campanhas, status_por_conta, parcial), como em
+    `flowbiz_fetch.fetch_all_accounts`; `enrich` (opcional) completa as campanhas
+    com dados locais (ex.: leads e acessos do banco) antes do snapshot ser publicado.
+    """
+
+    # Intervalo mínimo entre verificações do arquivo compartilhado no caminho da requisição
+    SHARED_CHECK_SECONDS = 0.5
+
+    def __init__(self, fetch: Callable[[], FetchResult],
+                 enrich: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+                 ttl: float = 60.0, logger=None, shared=None, shared_wait: float = 30.0):
+        self._fetch = fetch
+        self._enrich = enrich
+        self.ttl = ttl
+        self.logger = logger
+        self.shared = shared if shared is not None and shared.electable else None
+        self.shared_wait = shared_wait
+        self._shared_checked = 0.0
+        self._leader_pid: Optional[int] = None
+        self._snapshot: Optional[CampaignSnapshot] = None
+        self._version = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        # Somas aplicadas por `apply_deltas`: (recebidas em, `time.time()`; deltas), para
+        # reaplicar as que chegaram depois de uma busca
+        self._delta_log: List[Tuple[float, Dict[str, Dict[str, int]]]] = []
+        self._listeners: List[Callable[[Optional[CampaignSnapshot], CampaignSnapshot], None]] = []
+
+    def add_listener(self, listener: Callable[[Optional[CampaignSnapshot], CampaignSnapshot], None]) -> None:
+        """Registra `listener(anterior, novo)`, chamado a cada nova versão do snapshot."""
+        self._listeners.append(listener)
+
+    @property
+    def current(self) -> Optional[CampaignSnapshot]:
+        return self._snapshot
+
+    def snapshot(self) -> CampaignSnapshot:
+        """Snapshot atual; dispara renovação em segundo plano se venceu."""
+        if self.shared is not None:
+            return self._shared_snapshot()
+        snap = self._snapshot
+        if snap is None:
+            metrics.cache_result("campaign_snapshot", False)
+            return self.refresh()
+        stale = snap.age >= self.ttl
+        metrics.cache_result("campaign_snapshot", not stale)
+        if stale:
+            self._refresh_in_background()
+        return snap
+
+    def _refresh_in_background(self) -> None:
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as exc:
+                if self.logger:
+                    self.logger.exception("Erro renovando snapshot de campanhas: %s", exc)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="campaign-store-refresh", daemon=True).start()
+
+    # --- Modo compartilhado entre processos -------------------------------------------
+
+    def _shared_snapshot(self) -> CampaignSnapshot:
+        self._ensure_leader_thread()
+        now = time.monotonic()
+        if now - self._shared_checked >= self.SHARED_CHECK_SECONDS:
+            self._shared_checked = now
+            self._sync_shared()
+        snap = self._snapshot
+        if snap is None:
+            metrics.cache_result("campaign_snapshot", False)
+            return self._first_shared_snapshot()
+        metrics.cache_result("campaign_snapshot", snap.age < self.ttl)
+        return snap
+
+    def _first_shared_snapshot(self) -> CampaignSnapshot:
+        """Nenhum snapshot ainda: o líder busca; os outros esperam o arquivo."""
+        deadline = time.monotonic() + self.shared_wait
+        while time.monotonic() < deadline:
+            snap = self._sync_shared()
+            if snap is not None:
+                return snap
+            if self.shared.try_lead():
+                return self.refresh()
+            time.sleep(0.1)
+        # Líder travado: melhor servir uma busca própria do que nada
+        if self.logger:
+            self.logger.warning("Snapshot compartilhado indisponível após %.0fs; buscando localmente", self.shared_wait)
+        return self.refresh()
+
+    def _sync_shared(self) -> Optional[CampaignSnapshot]:
+        """Carrega o arquivo compartilhado se ele mudou desde a última leitura."""
+        if self.shared.is_leader or not self.shared.changed():
+            return self._snapshot
+        try:
+            loaded = self.shared.load()
+        except Exception as exc:
+            if self.logger:
+                self.logger.exception("Erro lendo snapshot compartilhado: %s", exc)
+            return self._snapshot
+        if loaded is None:
+            return self._snapshot
+        return self._install(loaded)
+
+    def _ensure_leader_thread(self) -> None:
+        # Uma thread por processo (criada depois do fork do gunicorn, nunca no mestre)
+        pid = os.getpid()
+        with self._lock:
+            if self._leader_pid == pid:
+                return
+            self._leader_pid = pid
+        threading.Thread(target=self._leader_loop, name="campaign-store-leader", daemon=True).start()
+
+    def _leader_loop(self) -> None:
+        interval = max(1.0, min(self.ttl / 2.0, 5.0))
+        while True:
+            try:
+                if self.shared.try_lead():
+                    self._drain_shared_deltas()
+                    snap = self._snapshot
+                    if snap is None:
+                        # Acabou de assumir: continuar a numeração de versões do arquivo
+                        self._sync_shared_as_leader()
+                        snap = self._snapshot
+                    if snap is None or snap.age >= self.ttl:
+                        self.refresh()
+            except Exception as exc:
+                if self.logger:
+                    self.logger.exception("Erro renovando snapshot compartilhado: %s", exc)
+            time.sleep(interval)
+
+    def _drain_shared_deltas(self) -> None:
+        """Líder: aplica as somas que os outros workers deixaram no arquivo de deltas."""
+        pending = self.shared.take_deltas()
+        if pending and self._snapshot is None:
+            self._sync_shared_as_leader()
+        for received_at, deltas in pending:
+            self.apply_deltas(deltas, received_at=received_at)
+
+    def _sync_shared_as_leader(self) -> None:
+        loaded = self.shared.load()
+        if loaded is not None:
+            self._install(loaded)
+
+    def _install(self, new: CampaignSnapshot) -> CampaignSnapshot:
+        with self._lock:
+            old = self._snapshot
+            self._version = max(self._version, new.version)
+            self._snapshot = new
+        if old is None or old.version != new.version or old.fingerprint != new.fingerprint:
+            self._notify(old, new)
+        return new
+
+    def refresh(self) -> CampaignSnapshot:
+        """Busca as contas agora (uma renovação por vez) e publica o resultado."""
+        with self._refresh_lock:
+            # Outra thread pode ter acabado de renovar enquanto esperávamos
+            snap = self._snapshot
+            if snap is not None and snap.age < 1.0:
+                return snap
+            campaigns, accounts, partial = self._fetch()
+            fetch_ended = time.time()
+            if self._enrich:
+                try:
+                    self._enrich(campaigns)
+                except Exception as exc:
+                    if self.logger:
+                        self.logger.exception("Erro enriquecendo snapshot de campanhas: %s", exc)
+            return self.publish(campaigns, accounts, partial, replay_since=fetch_ended)
+
+    def publish(self, campaigns: List[Dict[str, Any]], accounts: List[Dict[str, Any]],
+                partial: bool, replay_since: Optional[float] = None) -> CampaignSnapshot:
+        """Instala um novo snapshot; a versão só avança quando o conteúdo muda.
+
+        Com `replay_since` (fim da busca, `time.time()`), as somas de `apply_deltas`
+        recebidas desde então são reaplicadas sobre o resultado. As recebidas durante
+        a busca não: o Flowbiz conta o evento quando emite o webhook, então elas podem
+        já estar nos totais buscados (se não estiverem, entram na próxima renovação).
+        """
+        # Os dicts do Flowbiz não ficam no snapshot: só a forma compacta
+        table = CampaignTable.from_campaigns(campaigns)
+        fingerprint = _fingerprint(table)
+        with self._lock:
+            if replay_since is not None:
+                self._delta_log = [(at, d) for at, d in self._delta_log if at >= replay_since]
+                for _, deltas in self._delta_log:
+                    table, _ = table.with_deltas(deltas)
+                if self._delta_log:
+                    fingerprint = _chain_fingerprint(fingerprint, [d for _, d in self._delta_log])
+            old = self._snapshot
+            if old is None or old.fingerprint != fingerprint:
+                self._version += 1
+            new = CampaignSnapshot(self._version, table, accounts, partial, fingerprint)
+            if old is not None and old.version == new.version:
+                new.changed_at = old.changed_at
+            self._snapshot = new
+        if self.shared is not None and self.shared.is_leader:
+            try:
+                self.shared.write(new)
+            except Exception as exc:
+                if self.logger:
+                    self.logger.exception("Erro gravando snapshot compartilhado: %s", exc)
+        if old is None or old.version != new.version:
+            self._notify(old, new)
+        return new
+
+    def accepts_deltas(self) -> bool:
+        """Há onde aplicar somas? Sem snapshot, elas seriam descartadas (a primeira busca já as inclui)."""
+        return self._snapshot is not None or (self.shared is not None and not self.shared.is_leader)
+
+    def apply_deltas(self, deltas: Dict[str, Dict[str, int]], received_at: Optional[float] = None) -> int:
+        """Soma contadores ({chave: {"opens": 1, ...}}) ao snapshot atual e publica a nova versão.
+
+        `received_at` (`time.time()`, padrão agora) é quando os eventos chegaram; decide
+        se as somas são reaplicadas depois de uma busca (ver `publish`). Devolve quantas
+        somas foram aplicadas (chaves desconhecidas são ignoradas; sem snapshot, nenhuma).
+        Em modo compartilhado, um worker que não é o líder só registra as somas para o
+        líder aplicar.
+        """
+        if not deltas:
+            return 0
+        if received_at is None:
+            received_at = time.time()
+        if self.shared is not None and not self.shared.is_leader:
+            self.shared.append_deltas(deltas, received_at)
+            return sum(len(changes) for changes in deltas.values())
+        with self._lock:
+            old = self._snapshot
+            if old is None:
+                if self.logger:
+                    self.logger.warning("Somas descartadas: nenhum snapshot ainda (%d campanhas)", len(deltas))
+                return 0
+            table, applied = old.table.with_deltas(deltas)
+            # Só quem pode estar buscando agora precisa do histórico
+            horizon = time.time() - max(self.ttl * 4, 600.0)
+            self._delta_log = [(at, d) for at, d in self._delta_log if at >= horizon]
+            self._delta_log.append((received_at, deltas))
+            if not applied:
+                return 0
+            self._version += 1
+            new = CampaignSnapshot(self._version, table, old.accounts, old.partial,
+                                   _chain_fingerprint(old.fingerprint, [deltas]),
+                                   kpis=kpis_with_deltas(old.kpis, applied))
+            # A idade continua sendo a da última busca: as somas não adiam a renovação
+            new.built_at = old.built_at
+            new.parent_version = old.version
+            new.changed_keys = sorted({key for key, _, _ in applied})
+            self._snapshot = new
+        if self.shared is not None and self.shared.is_leader:
+            try:
+                self.shared.write(new)
+            except Exception as exc:
+                if self.logger:
+                    self.logger.exception("Erro gravando snapshot compartilhado: %s", exc)
+        self._notify(old, new)
+        return len(applied)
+
+    def _notify(self, old: Optional[CampaignSnapshot], new: CampaignSnapshot) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(old, new)
+            except Exception as exc:
+                if self.logger:
+                    self.logger.exception("Erro em ouvinte do snapshot: %s", exc)
+
+
+_FINGERPRINT_COLUMNS = ("status", "sent", "opens", "clicks", "total_clicks", "leads", "accesses",
+                        "finished_at", "send_date", "created_at", "name", "subject")
+
+
+def _chain_fingerprint(fingerprint: str, batches: List[Dict[str, Dict[str, int]]]) -> str:
+    digest = hashlib.sha1(fingerprint.encode("ascii"))
+    for deltas in batches:
+        digest.update(json.dumps(deltas, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _fingerprint(table: CampaignTable) -> str:
+    digest = hashlib.sha1()
+    for key, row in sorted(zip(table.keys(), table.rows(_FINGERPRINT_COLUMNS))):
+        digest.update(key.encode("utf-8"))
+        for value in row:
+            digest.update(b"\x1f" + str(value).encode("utf-8"))
+    return digest.hexdigest()
@@ -0,0 +1,78 @@
+"""Compressão gzip/brotli das respostas JSON grandes.
+
+Registrada como `after_request` no app principal e no servidor do Dash. Usa
+brotli quando o módulo está instalado e o cliente aceita `br`; senão gzip.
+Respostas pequenas, em streaming ou já codificadas passam intactas. Tamanho
+das respostas e tempo de compressão vão para as métricas.
+"""
+import gzip
+import os
+
+from flask import Flask, request
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ("application/json", "text/html", "text/plain", "application/javascript", "text/css")
+
+
+def _accepted(header: str) -> set:
+    accepted = set()
+    for part in (header or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in {"q=0", "q=0.0"}:
+            continue
+        if name:
+            accepted.add(name)
+    return accepted
+
+
+def init_compression(app: Flask) -> None:
+    min_bytes = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+    gzip_level = int(os.getenv("COMPRESS_GZIP_LEVEL", "5"))
+    brotli_quality = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+    @app.after_request
+    def _compress(response):
+        endpoint = request.endpoint or "unknown"
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE
+        ):
+            return response
+        data = response.get_data()
+        size = len(data)
+        accepted = _accepted(request.headers.get("Accept-Encoding", ""))
+        encoding = None
+        if size >= min_bytes:
+            if brotli is not None and "br" in accepted:
+                encoding = "br"
+            elif "gzip" in accepted:
+                encoding = "gzip"
+        response.vary.add("Accept-Encoding")
+        if encoding is None:
+            metrics.RESPONSE_BYTES.observe(size, endpoint=endpoint, encoding="identity")
+            return response
+
+        with metrics.timer(metrics.COMPRESS_SECONDS, encoding=encoding):
+            if encoding == "br":
+                body = brotli.compress(data, quality=brotli_quality)
+            else:
+                body = gzip.compress(data, compresslevel=gzip_level)
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        response.headers["Content-Length"] = str(len(body))
+        # O corpo mudou de bytes: ETag forte vira fraca (continua válida para If-None-Match)
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        metrics.RESPONSE_BYTES.observe(len(body), endpoint=endpoint, encoding=encoding)
+        return response
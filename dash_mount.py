@@ -0,0 +1,85 @@
+"""Montagem do painel Dash sob /dash, imediata ou sob demanda.
+
+O Dash (e com ele pandas, plotly e dash-bootstrap-components) roda num Flask
+próprio, despachado por este middleware WSGI. Em modo `lazy` a importação só
+acontece no primeiro acesso a /dash/, de modo que workers que atendem apenas a
+API JSON não pagam o custo de importação nem de memória. Em modo `eager` o painel
+é montado em `create_app()` — combinado com `gunicorn --preload`, isso carrega
+tudo no processo mestre antes do fork. `off` nunca monta.
+
+`/dash/status` e `/dash/metrics` continuam no app principal e não disparam a
+montagem.
+"""
+import os
+import threading
+import time
+from typing import Optional
+
+from flask import Flask
+
+PASSTHROUGH = ("/dash/status", "/dash/metrics")
+
+
+class DashMount:
+    def __init__(self, app: Flask, mode: str = "lazy", prefix: str = "/dash"):
+        self.app = app
+        self.mode = mode
+        self.prefix = prefix.rstrip("/")
+        self.server: Optional[Flask] = None
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+        self._next = app.wsgi_app
+        app.wsgi_app = self
+        if mode == "off":
+            self.error = "Dash desativado (DASH_MOUNT=off)"
+        elif mode == "eager":
+            self.load()
+
+    @property
+    def status(self) -> str:
+        if self.server is not None:
+            return "dash-ready"
+        if self.error is not None:
+            return "dash-unavailable"
+        return "dash-not-loaded"
+
+    def load(self) -> Optional[Flask]:
+        """Importa e inicializa o Dash uma única vez (thread-safe)."""
+        if self.server is not None or self.error is not None:
+            return self.server
+        with self._lock:
+            if self.server is not None or self.error is not None:
+                return self.server
+            started = time.perf_counter()
+            try:
+                from compression import init_compression
+                from dashboard_app import init_dash
+                from request_profile import init_profiling
+
+                server = Flask("dashboard_app", root_path=os.path.dirname(os.path.abspath(__file__)))
+                server.config.update(self.app.config)
+                # Mesmo snapshot, canal de eventos etc. do app principal
+                server.extensions = self.app.extensions
+                init_profiling(server)
+                init_dash(server)
+                init_compression(server)
+                self.load_seconds = time.perf_counter() - started
+                self.server = server
+                self.app.logger.info("Dash montado em %.0f ms (modo %s)", self.load_seconds * 1000, self.mode)
+            except Exception as e:
+                self.error = str(e)
+                self.app.logger.warning(f"Dash não inicializado: {e}")
+        return self.server
+
+    def _is_dash_path(self, path: str) -> bool:
+        if path in PASSTHROUGH:
+            return False
+        return path == self.prefix or path.startswith(self.prefix + "/")
+
+    def __call__(self, environ, start_response):
+        if self._is_dash_path(environ.get("PATH_INFO", "")):
+            server = self.server if self.server is not None else self.load()
+            if server is not None:
+                return server(environ, start_response)
+        return self._next(environ, start_response)
@@ -1,6 +1,8 @@
 import os
 import requests
 import json
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import pandas as pd
 import plotly.express as px
@@ -8,10 +10,19 @@ from dash import Dash, dcc, html, Input, Output, State, callback_context
 from dash import dash_table
 import dash_bootstrap_components as dbc
 
+import metrics
+from campaign_fields import LEAN_FIELDS
+from campaign_records import CampaignTable, parse_timestamp
+from campaign_rollups import day_number
+from campaign_search import normalize
+from flowbiz_fetch import fetch_all_accounts
+from request_profile import phase
+
 
 def init_dash(flask_app):
     """Inicializa um app Dash montado no Flask `flask_app`.
-    Busca campanhas diretamente da API Flowbiz (não passa pelo Flask para evitar deadlocks).
+    Lê o snapshot de campanhas do app (`extensions["campaign_store"]`); sem ele, busca
+    direto da API Flowbiz (não passa pelo Flask para evitar deadlocks).
     """
     server = flask_app
     prefix = "/dash/"
@@ -28,186 +39,159 @@ def init_dash(flask_app):
     )
     server.logger.info("Dash inicializado (prefix: %s)", prefix)
 
-    def fetch_campaigns_from_flowbiz():
-        """Busca campanhas diretamente da API Flowbiz (mesma lógica do app.py)"""
+    def fetch_campaigns_with_status():
+        """Busca campanhas diretamente da API Flowbiz (mesma lógica do app.py).
+
+        Retorna (campanhas, status_por_conta, parcial); contas lentas além do orçamento
+        de latência entram com o último resultado bom ou ficam de fora.
+        """
         try:
             flowbiz_endpoint = os.getenv("FLOWBIZ_ENDPOINT", "https://mbiz.mailclick.me/api.php")
-            api_keys = {k: v for k, v in os.environ.items() if k.startswith("FLOWBIZ_API_KEY_") and v}
+            api_keys = {k: v.strip().strip('"') for k, v in os.environ.items() if k.startswith("FLOWBIZ_API_KEY_") and v}
             
             if not api_keys:
                 server.logger.warning("fetch_campaigns_from_flowbiz: nenhuma API key encontrada")
-                return []
+                return [], [], False
             
-            merged = []
             timeout = 20
             per_page = 100  # buscar menos para ser mais rápido
-            
-            failed_accounts = []
-            for name, key in api_keys.items():
-                local_payload = {
-                    "APIKey": key.strip().strip('"'),
-                    "Command": "Campaigns.Get",
-                    "RecordsPerRequest": str(per_page),
-                    "ResponseFormat": "JSON"
-                }
-                attempt = 0
-                max_attempts = 3
-                backoff = 1
-                last_exc = None
-                while attempt < max_attempts:
-                    attempt += 1
-                    try:
-                        server.logger.debug("Fetching campaigns for %s attempt %d", name, attempt)
-                        res = requests.post(flowbiz_endpoint, data=local_payload, timeout=timeout)
-                        if res.status_code != 200:
-                            server.logger.warning("Account %s returned status %s", name, res.status_code)
-                            last_exc = Exception(f"HTTP {res.status_code}")
-                            raise last_exc
-                        d = res.json()
-                        campaigns = d.get("Campaigns") if isinstance(d, dict) else None
-                        if campaigns:
-                            for c in campaigns:
-                                c["_origin_api"] = name
-                                try:
-                                    c["Origin"] = name.replace('FLOWBIZ_API_KEY_', '')
-                                except Exception:
-                                    c["Origin"] = name
-                                merged.append(c)
-                        last_exc = None
-                        break
-                    except requests.exceptions.ReadTimeout as rte:
-                        server.logger.warning("Timeout fetching campaigns for %s (attempt %d): %s", name, attempt, rte)
-                        last_exc = rte
-                    except requests.exceptions.ConnectionError as ce:
-                        server.logger.warning("Connection error for %s (attempt %d): %s", name, attempt, ce)
-                        last_exc = ce
-                    except Exception as e:
-                        server.logger.exception("Erro buscando campanhas de %s (attempt %d): %s", name, attempt, e)
-                        last_exc = e
-                    # Exponential backoff before retrying
-                    if attempt < max_attempts:
-                        import time
-                        time.sleep(backoff)
-                        backoff *= 2
-                if last_exc is not None:
-                    failed_accounts.append({"account": name, "error": str(last_exc)})
-            if failed_accounts:
-                server.logger.warning("Algumas contas falharam ao buscar campanhas: %s", failed_accounts)
-            
+            budget = float(os.getenv("FLOWBIZ_LIST_BUDGET_SECONDS", "5"))
+            merged, accounts, partial = fetch_all_accounts(
+                flowbiz_endpoint, api_keys, per_page, timeout,
+                budget=budget, attempts=3, logger=server.logger, fields=LEAN_FIELDS,
+            )
             server.logger.debug("fetch_campaigns_from_flowbiz: retornou %d campanhas", len(merged))
-            return merged
+            return merged, accounts, partial
         except Exception as e:
             server.logger.exception("Erro em fetch_campaigns_from_flowbiz: %s", e)
-            return []
+            return [], [], True
+
+    def fetch_campaigns_from_flowbiz():
+        campaigns, _, _ = fetch_campaigns_with_status()
+        return campaigns
 
     def fetch_campaigns():
         """Wrapper que usa a função de busca direta"""
         return fetch_campaigns_from_flowbiz()
 
+    def describe_partial(accounts):
+        """Resumo curto das origens que não vieram atualizadas (para a linha de status)."""
+        parts = []
+        for a in accounts:
+            if a.get("Status") == "stale":
+                parts.append(f"{a['Origin']} (há {a.get('DataAgeSeconds', 0)}s)")
+            elif a.get("Status") != "ok":
+                parts.append(f"{a['Origin']} ({a.get('Status')})")
+        return ", ".join(parts)
+
+    # Snapshot do app principal (compartilhado entre workers quando configurado).
+    # DataFrame e figuras ficam em cache por versão do snapshot e caem juntos.
+    store = server.extensions.get("campaign_store")
+    derived = {"version": None, "df": None, "figures": OrderedDict()}
+    derived_lock = threading.Lock()
+    max_cached_figures = 32
+
+    def load_frame():
+        """(DataFrame, status_por_conta, parcial, versão) do catálogo atual."""
+        if store is None:
+            campaigns, accounts, partial = fetch_campaigns_with_status()
+            return campaigns_to_df(campaigns), accounts, partial, None
+        with phase("snapshot"):
+            snap = store.snapshot()
+        with derived_lock:
+            hit = derived["version"] == snap.version
+            metrics.cache_result("dash_frame", hit)
+            if not hit:
+                with metrics.timer(metrics.DATAFRAME_BUILD_SECONDS):
+                    df = snap.table.to_dataframe()
+                derived.update(version=snap.version, df=df, figures=OrderedDict())
+            return derived["df"], snap.accounts, snap.partial, snap.version
+
+    def cached_figures(version, key):
+        if version is None:
+            return None
+        with derived_lock:
+            if derived["version"] != version:
+                return None
+            found = derived["figures"].get(key)
+        metrics.cache_result("dash_figures", found is not None)
+        return found
+
+    def store_figures(version, key, value):
+        if version is None:
+            return
+        with derived_lock:
+            if derived["version"] != version:
+                return
+            figures = derived["figures"]
+            figures[key] = value
+            while len(figures) > max_cached_figures:
+                figures.popitem(last=False)
+
     def campaigns_to_df(campaigns: list):
-        if not campaigns:
-            return pd.DataFrame()
-
-        # Normalizar e agregar métricas que podem vir em formatos diferentes
-        normalized = []
-        for c in campaigns:
-            item = dict(c)  # copiar para não alterar original
-            # EmailsSent
-            try:
-                item['EmailsSent'] = int(item.get('TotalSent') or item.get('EmailsSent') or 0)
-            except Exception:
-                item['EmailsSent'] = 0
-            # UniqueClicks: priorizar 'UniqueClicks' quando disponível; caso contrário derivar de ClickStatistics/Clicks
-            try:
-                if item.get('UniqueClicks') is not None:
-                    item['UniqueClicks'] = int(item.get('UniqueClicks') or 0)
-                else:
-                    unique_clicks = 0
-                    cs = item.get('ClickStatistics') or item.get('ClickStats') or item.get('Clicks')
-                    if isinstance(cs, dict):
-                        for v in cs.values():
-                            if isinstance(v, dict):
-                                unique_clicks += int(v.get('Unique', v.get('Total', 0) or 0) or 0)
-                            else:
-                                try:
-                                    unique_clicks += int(v or 0)
-                                except Exception:
-                                    pass
-                    elif isinstance(cs, list):
-                        for it in cs:
-                            if isinstance(it, dict):
-                                unique_clicks += int(it.get('Unique', it.get('Total', it.get('Clicks', 0) or 0) or 0) or 0)
-                    item['UniqueClicks'] = int(unique_clicks)
-            except Exception:
-                item['UniqueClicks'] = 0
-
-            # Manter TotalClicks para compatibilidade, mas usar UniqueClicks como fallback
-            try:
-                if item.get('TotalClicks') is None:
-                    item['TotalClicks'] = int(item.get('UniqueClicks', 0) or 0)
-                else:
-                    item['TotalClicks'] = int(item.get('TotalClicks') or 0)
-            except Exception:
-                item['TotalClicks'] = int(item.get('UniqueClicks', 0) or 0)
-            # TotalOpens: similar a opens
-            if not item.get('TotalOpens'):
-                total_opens = 0
-                osd = item.get('OpenStatistics') or item.get('OpenStats') or item.get('Opens')
-                if isinstance(osd, dict):
-                    for v in osd.values():
-                        if isinstance(v, dict):
-                            total_opens += int(v.get('Unique', v.get('Total', 0) or 0) or 0)
-                        else:
-                            try:
-                                total_opens += int(v or 0)
-                            except Exception:
-                                pass
-                try:
-                    item['TotalOpens'] = int(total_opens)
-                except Exception:
-                    item['TotalOpens'] = 0
-            else:
-                try:
-                    item['TotalOpens'] = int(item.get('TotalOpens') or 0)
-                except Exception:
-                    item['TotalOpens'] = 0
+        with metrics.timer(metrics.DATAFRAME_BUILD_SECONDS):
+            return _campaigns_to_df(campaigns)
 
-            # Garantir campos de leads e acessos
-            try:
-                item['QtdLeads'] = int(item.get('QtdLeads', 0) or 0)
-            except Exception:
-                item['QtdLeads'] = 0
-            try:
-                item['QtdAcessos'] = int(item.get('QtdAcessos', 0) or 0)
-            except Exception:
-                item['QtdAcessos'] = 0
+    # Totais por (dia, origem) mantidos pelo app (`campaign_rollups`)
+    rollups = server.extensions.get("campaign_rollups")
 
-            normalized.append(item)
+    def granularity_for(days: int) -> str:
+        return "day" if days <= 180 else "week" if days <= 730 else "month"
 
-        df = pd.DataFrame(normalized)
+    def rollup_view(version, origin, start_date, end_date):
+        """{"totals", "series"} dos totais pré-agregados; None se não estiverem na versão do snapshot."""
+        if rollups is None or version is None or rollups.version != version:
+            return None
+        known = rollups.day_range()
+        if known is None:
+            return {"totals": {"opens": 0, "clicks": 0}, "series": []}
+        first = day_number(parse_timestamp(start_date)) if start_date else None
+        last = day_number(parse_timestamp(end_date)) if end_date else None
+        first = known[0] if first is None else first
+        last = known[1] if last is None else last
+        if first > last:
+            return {"totals": {"opens": 0, "clicks": 0}, "series": []}
+        return {
+            "totals": rollups.totals(first, last, origin or None),
+            "series": rollups.series(first, last, origin or None, granularity_for(last - first + 1)),
+        }
 
-        # Tentar parse de datas
-        for date_field in ["SendProcessFinishedOn", "SendDate", "CreateDateTime"]:
-            if date_field in df.columns:
-                try:
-                    df[date_field] = pd.to_datetime(df[date_field], errors="coerce", dayfirst=True)
-                except Exception:
-                    df[date_field] = pd.NaT
-        # Escolher data representativa
-        date_cols = [c for c in ["SendProcessFinishedOn", "SendDate", "CreateDateTime"] if c in df.columns]
-        if date_cols:
-            df["send_date"] = df[date_cols].bfill(axis=1).iloc[:, 0]
-        else:
-            df["send_date"] = pd.NaT
+    def frame_series(df):
+        """Mesma série do `rollup_view`, calculada do DataFrame já filtrado."""
+        dated = df[df["send_date"].notna()]
+        if dated.empty:
+            return []
+        span = (dated["send_date"].max() - dated["send_date"].min()).days + 1
+        freq = {"day": "D", "week": "W-MON", "month": "MS"}[granularity_for(span)]
+        grouped = dated.groupby(pd.Grouper(key="send_date", freq=freq, label="left", closed="left"))
+        sums = grouped[["EmailsSent", "TotalOpens", "UniqueClicks"]].sum()
+        return [{"period": ts.date().isoformat(), "sent": int(r.EmailsSent), "opens": int(r.TotalOpens),
+                 "clicks": int(r.UniqueClicks)} for ts, r in sums.iterrows()]
+
+    def trend_figure(series):
+        if not series:
+            fig = px.scatter()
+            fig.update_layout(
+                annotations=[{
+                    'text': 'Nenhuma campanha com data no período',
+                    'xref': 'paper', 'yref': 'paper', 'showarrow': False,
+                    'font': {'size': 14}
+                }],
+                xaxis={'visible': False},
+                yaxis={'visible': False}
+            )
+            return fig
+        frame = pd.DataFrame(series).rename(columns={
+            "period": "Período", "sent": "E-mails enviados", "opens": "Aberturas", "clicks": "Cliques (únicos)"})
+        fig = px.line(frame, x="Período", y=["E-mails enviados", "Aberturas", "Cliques (únicos)"],
+                      markers=len(frame) <= 60, title="Evolução no período")
+        fig.update_layout(legend_title_text="", yaxis_title="")
+        return fig
 
-        # Nome
-        df["CampaignName"] = df.get("CampaignName")
-        # Garantir tipos
-        df["EmailsSent"] = pd.to_numeric(df.get("EmailsSent", 0), errors="coerce").fillna(0).astype(int)
-        df["TotalOpens"] = pd.to_numeric(df.get("TotalOpens", 0), errors="coerce").fillna(0).astype(int)
-        df["TotalClicks"] = pd.to_numeric(df.get("TotalClicks", 0), errors="coerce").fillna(0).astype(int)
-        df["UniqueClicks"] = pd.to_numeric(df.get("UniqueClicks", 0), errors="coerce").fillna(0).astype(int)
-        return df
+    def _campaigns_to_df(campaigns: list):
+        # Normalização (métricas inteiras, cliques/aberturas a partir das estatísticas,
+        # datas) feita uma vez no registro compacto; o DataFrame sai das colunas
+        return CampaignTable.from_campaigns(campaigns).to_dataframe()
 
     app.layout = dbc.Container([
         dbc.Row([
@@ -222,7 +206,7 @@ def init_dash(flask_app):
                 dbc.CardBody([
                     html.H5("Filtros", className="card-title"),
                     dcc.Dropdown(id="origin-filter", placeholder="Filtrar por origem (conta)", multi=False),
-                    dcc.Dropdown(id="campaign-filter", placeholder="Filtrar por nome da campanha", multi=True, options=[]),
+                    dcc.Dropdown(id="campaign-filter", placeholder="Buscar campanha (nome, assunto, origem)", multi=True, options=[]),
                     dcc.DatePickerRange(id="date-range"),
                     html.Div(dbc.Button("Filtrar", id="apply-filters", color="primary", className="mt-2"), style={"marginTop": "8px"}),
                     dcc.Location(id='url', refresh=False)
@@ -240,6 +224,10 @@ def init_dash(flask_app):
             dbc.Col(dcc.Loading(dbc.Card(dbc.CardBody(dcc.Graph(id="time-opens"))), id='loading-time', type='circle'), md=6),
         ], className="my-2"),
 
+        dbc.Row([
+            dbc.Col(dcc.Loading(dbc.Card(dbc.CardBody(dcc.Graph(id="trend-daily"))), id='loading-trend', type='circle'), md=12),
+        ], className="my-2"),
+
         dbc.Row([
             dbc.Col(dcc.Loading(
                 dbc.Card(dbc.CardBody([
@@ -271,7 +259,6 @@ def init_dash(flask_app):
     @app.callback(
         Output("origin-filter", "options"),
         Output("origin-filter", "value"),
-        Output("campaign-filter", "options"),
         Output("campaign-filter", "value"),
         Input("url", "pathname"),
         Input("apply-filters", "n_clicks"),
@@ -280,21 +267,18 @@ def init_dash(flask_app):
     )
     def update_origins(pathname, n_clicks, current_origin_value, current_campaign_value):
         try:
-            campaigns = fetch_campaigns()
-            df = campaigns_to_df(campaigns)
+            df, _, _, _ = load_frame()
             if df.empty:
-                return [], None, [], current_campaign_value if current_campaign_value else None
+                return [], None, current_campaign_value if current_campaign_value else None
             origin_values = sorted(df.get("Origin", df.get("_origin_api", [])).dropna().unique())
             origin_opts = [{"label": o, "value": o} for o in origin_values]
-            # Campaign options for dropdown (unique campaign names)
-            names = sorted(df.get("CampaignName", pd.Series(dtype=str)).dropna().unique())
-            campaign_opts = [{"label": str(n), "value": str(n)} for n in names]
             # Preserve previous selections when still available
             origin_value = current_origin_value if (current_origin_value in origin_values) else None
             # campaign value can be list or single
             if not current_campaign_value:
                 campaign_value = None
             else:
+                names = set(df.get("CampaignName", pd.Series(dtype=str)).dropna())
                 # normalize to list
                 if isinstance(current_campaign_value, (list, tuple)):
                     campaign_value = [str(v) for v in current_campaign_value if str(v) in names]
@@ -302,17 +286,58 @@ def init_dash(flask_app):
                         campaign_value = None
                 else:
                     campaign_value = str(current_campaign_value) if str(current_campaign_value) in names else None
-            return origin_opts, origin_value, campaign_opts, campaign_value
+            return origin_opts, origin_value, campaign_value
         except Exception as exc:
             # Log the exception and return safe defaults so the callback doesn't fail
             server.logger.exception("Erro em update_origins: %s", exc)
-            return [], current_origin_value, [], current_campaign_value
+            return [], current_origin_value, current_campaign_value
+
+    search_index = server.extensions.get("campaign_search")
+    max_campaign_options = 50
+
+    @app.callback(
+        Output("campaign-filter", "options"),
+        Input("campaign-filter", "search_value"),
+        State("campaign-filter", "value"),
+        State("origin-filter", "value"),
+    )
+    def search_campaign_options(search_value, current_value, origin):
+        """Opções do filtro de campanhas vindas da busca no servidor (não a lista inteira de nomes)."""
+        selected = current_value if isinstance(current_value, (list, tuple)) else ([current_value] if current_value else [])
+        names = [str(v) for v in selected]
+        # `search` alimenta o filtro do próprio dropdown no navegador: sem acento e com
+        # assunto/origem, para não esconder o que o servidor já encontrou
+        search_text = {}
+        query = (search_value or "").strip()
+        if query:
+            try:
+                if search_index is not None:
+                    load_frame()  # garante o índice na versão atual do snapshot
+                    results = search_index.search(query, origin=origin or None, limit=200)["Results"]
+                    found = [r["CampaignName"] for r in results]
+                    for r in results:
+                        search_text.setdefault(r["CampaignName"], " ".join(
+                            normalize(r[f]) for f in ("CampaignName", "Subject", "Origin")))
+                else:
+                    df, _, _, _ = load_frame()
+                    col = df.get("CampaignName", pd.Series(dtype=str))
+                    found = list(col[col.str.contains(query, case=False, na=False, regex=False)])
+            except Exception as exc:
+                server.logger.exception("Erro em search_campaign_options: %s", exc)
+                found = []
+            for name in found:
+                if name not in names:
+                    names.append(name)
+                if len(names) >= max_campaign_options + len(selected):
+                    break
+        return [{"label": n, "value": n, "search": search_text.get(n, normalize(n))} for n in names]
 
 
     @app.callback(
         Output("bar-emails-sent", "figure"),
         Output("pie-opens-clicks", "figure"),
         Output("time-opens", "figure"),
+        Output("trend-daily", "figure"),
         Output("table-campaigns", "data"),
         Output("dash-status", "children"),
         Input("url", "pathname"),
@@ -331,9 +356,18 @@ def init_dash(flask_app):
         else:
             server.logger.debug('Atualizando métricas (carregamento de página)')
         try:
-            campaigns = fetch_campaigns()
-            df = campaigns_to_df(campaigns)
+            df, accounts, partial, version = load_frame()
             now = datetime.now().strftime('%H:%M:%S')
+            partial_note = f" — ⚠️ parcial: {describe_partial(accounts)}" if partial else ""
+            if "QtdLeads" in df.columns and df["QtdLeads"].hasnans:
+                # Banco fora do ar/lento na renovação: contagens desconhecidas, não zero
+                partial_note += f" — leads/acessos indisponíveis para {int(df['QtdLeads'].isna().sum())} (banco)"
+            names_key = tuple(campaign_names) if isinstance(campaign_names, (list, tuple)) else campaign_names
+            cache_key = (origin, names_key, start_date, end_date)
+            cached = cached_figures(version, cache_key)
+            if cached is not None:
+                fig_bar, fig_pie, fig_time, fig_trend, table_data, count = cached
+                return fig_bar, fig_pie, fig_time, fig_trend, table_data, f"✓ {now} — {count} campanhas{partial_note}"
             if df.empty:
                 # figuras com anotação "nenhum dado" para o usuário ver a situação
                 empty_fig = px.scatter()
@@ -347,8 +381,8 @@ def init_dash(flask_app):
                     yaxis={'visible': False}
                 )
                 server.logger.info("update_metrics: sem campanhas para mostrar")
-                status_msg = f"⚠️ {now} — 0 campanhas encontradas"
-                return empty_fig, empty_fig, empty_fig, [], status_msg
+                status_msg = f"⚠️ {now} — 0 campanhas encontradas{partial_note}"
+                return empty_fig, empty_fig, empty_fig, empty_fig, [], status_msg
 
             # If called by button, add an informational status while processing
             if applying:
@@ -356,73 +390,92 @@ def init_dash(flask_app):
             else:
                 working_status = 'Atualizando métricas...'
 
-            # Filtrar por origem
-            if origin:
-                df = df[df.get("Origin") == origin]
-            # Filtrar por nome da campanha
-            if campaign_names:
-                # Se for lista (multi-select), filtrar por correspondência exata nas opções selecionadas
-                if isinstance(campaign_names, (list, tuple)):
-                    df = df[df.get("CampaignName").isin([str(x) for x in campaign_names])]
+            with phase("filters"):
+                # Filtrar por origem
+                if origin:
+                    df = df[df.get("Origin") == origin]
+                # Filtrar por nome da campanha
+                if campaign_names:
+                    # Se for lista (multi-select), filtrar por correspondência exata nas opções selecionadas
+                    if isinstance(campaign_names, (list, tuple)):
+                        df = df[df.get("CampaignName").isin([str(x) for x in campaign_names])]
+                    else:
+                        # Compatibilidade: aceitar string como fallback (contains)
+                        q = str(campaign_names).strip()
+                        if q:
+                            df = df[df.get("CampaignName", "").str.contains(q, case=False, na=False)]
+                # Filtrar por intervalo de datas (aplicar somente se send_date estiver disponível)
+                if "send_date" in df.columns and not df["send_date"].isna().all():
+                    if start_date:
+                        df = df[df["send_date"] >= pd.to_datetime(start_date)]
+                    if end_date:
+                        # Data final inclusive (o seletor envia só o dia)
+                        df = df[df["send_date"] < pd.to_datetime(end_date) + pd.Timedelta(days=1)]
                 else:
-                    # Compatibilidade: aceitar string como fallback (contains)
-                    q = str(campaign_names).strip()
-                    if q:
-                        df = df[df.get("CampaignName", "").str.contains(q, case=False, na=False)]
-            # Filtrar por intervalo de datas (aplicar somente se send_date estiver disponível)
-            if "send_date" in df.columns and not df["send_date"].isna().all():
-                if start_date:
-                    df = df[df["send_date"] >= pd.to_datetime(start_date)]
-                if end_date:
-                    df = df[df["send_date"] <= pd.to_datetime(end_date)]
-            else:
-                if start_date or end_date:
-                    server.logger.warning("Filtro de data ignorado: 'send_date' ausente nos dados")
-            # Bar: top 15 por EmailsSent
-            top = df.sort_values("EmailsSent", ascending=False).head(15)
-            top_plot = top.copy()
-            top_plot['Aberturas'] = top_plot['TotalOpens']
-            top_plot['Cliques (únicos)'] = top_plot['UniqueClicks']
-            fig_bar = px.bar(top_plot, x="CampaignName", y="EmailsSent", hover_data=["Aberturas", "Cliques (únicos)"], title="E-mails enviados por campanha")
-            fig_bar.update_layout(xaxis_tickangle=-45)
-            # Pizza: Aberturas vs Cliques (únicos)
-            total_opens = int(df["TotalOpens"].sum())
-            total_clicks = int(df["UniqueClicks"].sum())
-            fig_pie = px.pie(names=["Aberturas", "Cliques (únicos)"], values=[total_opens, total_clicks], title="Aberturas vs Cliques (únicos) — total")
-            # Top de cliques: ordenar campanhas por Cliques (únicos) (do maior para o menor)
-            try:
-                clicks_top = df.sort_values("UniqueClicks", ascending=False).head(15)
-                if clicks_top.empty:
+                    if start_date or end_date:
+                        server.logger.warning("Filtro de data ignorado: 'send_date' ausente nos dados")
+            with metrics.timer(metrics.FIGURE_RENDER_SECONDS, callback="update_metrics"):
+                # Bar: top 15 por EmailsSent
+                top = df.sort_values("EmailsSent", ascending=False).head(15)
+                top_plot = top.copy()
+                top_plot['Aberturas'] = top_plot['TotalOpens']
+                top_plot['Cliques (únicos)'] = top_plot['UniqueClicks']
+                fig_bar = px.bar(top_plot, x="CampaignName", y="EmailsSent", hover_data=["Aberturas", "Cliques (únicos)"], title="E-mails enviados por campanha")
+                fig_bar.update_layout(xaxis_tickangle=-45)
+                # Pizza: Aberturas vs Cliques (únicos); sem seleção de campanhas, dos totais por dia/origem.
+                # Sem período, a tabela inclui campanhas sem data, que os totais por dia não têm
+                aggregated = None if campaign_names else rollup_view(version, origin, start_date, end_date)
+                if aggregated is not None and (start_date or end_date):
+                    total_opens, total_clicks = aggregated["totals"]["opens"], aggregated["totals"]["clicks"]
+                else:
+                    total_opens = int(df["TotalOpens"].sum())
+                    total_clicks = int(df["UniqueClicks"].sum())
+                fig_pie = px.pie(names=["Aberturas", "Cliques (únicos)"], values=[total_opens, total_clicks], title="Aberturas vs Cliques (únicos) — total")
+                # Top de cliques: ordenar campanhas por Cliques (únicos) (do maior para o menor)
+                try:
+                    clicks_top = df.sort_values("UniqueClicks", ascending=False).head(15)
+                    if clicks_top.empty:
+                        fig_time = px.scatter()
+                        fig_time.update_layout(
+                            annotations=[{
+                                'text': 'Nenhum dado de cliques disponível para as campanhas filtradas',
+                                'xref': 'paper', 'yref': 'paper', 'showarrow': False,
+                                'font': {'size': 14}
+                            }],
+                            xaxis={'visible': False},
+                            yaxis={'visible': False}
+                        )
+                    else:
+                        clicks_plot = clicks_top.copy()
+                        clicks_plot['Cliques (únicos)'] = clicks_plot['UniqueClicks']
+                        fig_time = px.bar(clicks_plot, x='Cliques (únicos)', y='CampaignName', orientation='h', title='Top campanhas por Cliques (únicos)', text='Cliques (únicos)')
+                        fig_time.update_layout(yaxis={'autorange':'reversed'}, xaxis_title='Cliques (únicos)', yaxis_title='Campanha')
+                except Exception as ee:
+                    server.logger.exception('Erro ao gerar top de cliques: %s', ee)
                     fig_time = px.scatter()
                     fig_time.update_layout(
                         annotations=[{
-                            'text': 'Nenhum dado de cliques disponível para as campanhas filtradas',
+                            'text': 'Erro ao gerar relatório de top de cliques',
                             'xref': 'paper', 'yref': 'paper', 'showarrow': False,
-                            'font': {'size': 14}
-                        }],
-                        xaxis={'visible': False},
-                        yaxis={'visible': False}
+                            'font': {'size': 12, 'color': 'red'}
+                        }]
                     )
-                else:
-                    clicks_plot = clicks_top.copy()
-                    clicks_plot['Cliques (únicos)'] = clicks_plot['UniqueClicks']
-                    fig_time = px.bar(clicks_plot, x='Cliques (únicos)', y='CampaignName', orientation='h', title='Top campanhas por Cliques (únicos)', text='Cliques (únicos)')
-                    fig_time.update_layout(yaxis={'autorange':'reversed'}, xaxis_title='Cliques (únicos)', yaxis_title='Campanha')
-            except Exception as ee:
-                server.logger.exception('Erro ao gerar top de cliques: %s', ee)
-                fig_time = px.scatter()
-                fig_time.update_layout(
-                    annotations=[{
-                        'text': 'Erro ao gerar relatório de top de cliques',
-                        'xref': 'paper', 'yref': 'paper', 'showarrow': False,
-                        'font': {'size': 12, 'color': 'red'}
-                    }]
-                )
+                fig_trend = trend_figure(aggregated["series"] if aggregated is not None else frame_series(df))
             # Table data
-            table_data = df.sort_values("send_date", ascending=False).fillna("-").to_dict("records")
+            # Só as colunas exibidas vão para o navegador
+            table_cols = [c for c in ("CampaignName", "Origin", "EmailsSent", "TotalOpens", "UniqueClicks",
+                                      "QtdLeads", "QtdAcessos") if c in df.columns]
+            with phase("table"):
+                table_df = df.sort_values("send_date", ascending=False)[table_cols]
+                for col in ("QtdLeads", "QtdAcessos"):
+                    # Contagem desconhecida (banco fora do ar) não aparece como zero
+                    if col in table_df.columns and table_df[col].hasnans:
+                        table_df[col] = table_df[col].astype(object).where(table_df[col].notna(), "indisponível")
+                table_data = table_df.fillna("-").to_dict("records")
+            store_figures(version, cache_key, (fig_bar, fig_pie, fig_time, fig_trend, table_data, len(df)))
             now = datetime.now().strftime('%H:%M:%S')
-            status_msg = f"✓ {now} — {len(df)} campanhas"
-            return fig_bar, fig_pie, fig_time, table_data, status_msg
+            status_msg = f"✓ {now} — {len(df)} campanhas{partial_note}"
+            return fig_bar, fig_pie, fig_time, fig_trend, table_data, status_msg
         except Exception as exc:
             server.logger.exception("Erro em update_metrics: %s", exc)
             empty_fig = px.scatter()
@@ -438,23 +491,11 @@ def init_dash(flask_app):
             # retornar figuras vazias e dados vazios para evitar "Callback failed"
             now = datetime.now().strftime('%H:%M:%S')
             status_msg = f"❌ {now} — Erro: {str(exc)[:80]}"
-            return empty_fig, empty_fig, empty_fig, [], status_msg
+            return empty_fig, empty_fig, empty_fig, empty_fig, [], status_msg
 
     # Expor uma rota simples informando que o Dash está ativo
     @server.route(prefix.rstrip('/'))
     def _dash_index():
         return "Painel disponível em <a href='{}'>{}</a>".format(prefix, prefix)
 
-    # Rota de diagnóstico: quantas campanhas o Dash enxerga agora
-    from flask import jsonify
-    @server.route(prefix + 'metrics')
-    def _dash_metrics():
-        try:
-            campaigns = fetch_campaigns_from_flowbiz()
-            # Tentar obter informações sobre contas que falharam (se houver registro nos logs, retornará só count)
-            return jsonify({"count": len(campaigns), "status": "ok"}), 200
-        except Exception as exc:
-            server.logger.exception("Erro em /dash/metrics: %s", exc)
-            return jsonify({"count": 0, "error": str(exc), "status": "exception"}), 500
-
     return app
@@ -0,0 +1,312 @@
+"""Busca concorrente de campanhas em várias contas Flowbiz.
+
+Cada conta é consultada em paralelo; quem chama define um orçamento de latência
+(`budget`) e recebe o que ficou pronto dentro dele. Contas que estouram o orçamento
+ou falham são servidas a partir do último resultado bom (quando existir) e marcadas
+como desatualizadas, para que a interface saiba quais origens estão velhas.
+Requisições simultâneas com os mesmos parâmetros compartilham a chamada em
+andamento de cada conta: uma conta lenta ocupa uma thread do pool, não uma por
+requisição.
+
+`call_accounts` faz o mesmo para qualquer comando (proxy genérico com
+`account=all`) e `merge_account_results` junta as respostas: listas concatenadas
+com `Origin` em cada item, totais somados e status/latência por conta.
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+import metrics
+from campaign_fields import project
+
+API_KEY_PREFIX = "FLOWBIZ_API_KEY_"
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FLOWBIZ_FETCH_WORKERS", "16")),
+    thread_name_prefix="flowbiz-fetch",
+)
+
+# Último resultado bom por (conta, parâmetros): {chave: (timestamp, campanhas)}
+_last_good: Dict[Tuple, Tuple[float, List[Dict[str, Any]]]] = {}
+_last_good_lock = threading.Lock()
+
+# Chamadas em andamento por (endpoint, chave do cache), compartilhadas entre requisições
+_inflight: Dict[Tuple, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def origin_label(account: str) -> str:
+    """Nome amigável da conta (ex.: FLOWBIZ_API_KEY_Voxcall -> Voxcall)."""
+    return account.replace(API_KEY_PREFIX, "") if account else "-"
+
+
+def _cache_key(account: str, records: int, extra: Dict[str, Any], fields: Optional[List[str]] = None) -> Tuple:
+    return (account, records, tuple(sorted((k, str(v)) for k, v in extra.items())),
+            tuple(fields) if fields is not None else None)
+
+
+def fetch_account_campaigns(
+    endpoint: str,
+    account: str,
+    api_key: str,
+    records: int,
+    timeout: float,
+    extra: Optional[Dict[str, Any]] = None,
+    attempts: int = 1,
+    logger=None,
+    fields: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Busca `Campaigns.Get` de uma conta, com retentativas e backoff exponencial.
+
+    `fields` (ver `campaign_fields`) reduz cada campanha antes de ir para o cache.
+    Em caso de sucesso, o resultado vira o "último bom" da conta. Levanta a última
+    exceção se todas as tentativas falharem.
+    """
+    extra = dict(extra or {})
+    payload = {
+        "APIKey": api_key,
+        "Command": "Campaigns.Get",
+        "RecordsPerRequest": str(records),
+        "ResponseFormat": "JSON",
+    }
+    payload.update(extra)
+
+    origin = origin_label(account)
+    backoff = 1
+    last_exc: Optional[Exception] = None
+    for attempt in range(1, attempts + 1):
+        try:
+            with metrics.timer(metrics.FLOWBIZ_REQUEST_SECONDS, command="Campaigns.Get", account=origin):
+                res = requests.post(endpoint, data=payload, timeout=timeout)
+            if res.status_code != 200:
+                raise RuntimeError(f"HTTP {res.status_code}")
+            d = res.json()
+            campaigns = (d.get("Campaigns") if isinstance(d, dict) else None) or []
+            for c in campaigns:
+                # Manter a chave bruta da conta e um campo Origin legível
+                c["_origin_api"] = account
+                c["Origin"] = origin
+            if fields is not None:
+                campaigns = [project(c, fields) for c in campaigns]
+            with _last_good_lock:
+                _last_good[_cache_key(account, records, extra, fields)] = (time.time(), campaigns)
+            if logger:
+                logger.debug("Account %s returned %d campaigns (attempt %d)", account, len(campaigns), attempt)
+            return campaigns
+        except Exception as exc:
+            last_exc = exc
+            metrics.FLOWBIZ_ERRORS.inc(command="Campaigns.Get", account=origin)
+            if logger:
+                logger.warning("Erro buscando campanhas de %s (attempt %d): %s", account, attempt, exc)
+            if attempt < attempts:
+                time.sleep(backoff)
+                backoff *= 2
+    raise last_exc if last_exc else RuntimeError("no attempts made")
+
+
+def _timed_fetch(*args, **kwargs) -> Tuple[List[Dict[str, Any]], float]:
+    started = time.monotonic()
+    campaigns = fetch_account_campaigns(*args, **kwargs)
+    return campaigns, time.monotonic() - started
+
+
+def _shared_fetch(endpoint: str, account: str, api_key: str, records: int, timeout: float,
+                  extra: Dict[str, Any], attempts: int, logger, fields: Optional[List[str]]) -> Future:
+    """Future de `_timed_fetch` para a conta, reaproveitando a chamada em andamento, se houver."""
+    key = (endpoint,) + _cache_key(account, records, extra, fields)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        shared = future is not None
+        if not shared:
+            future = _inflight[key] = _executor.submit(
+                _timed_fetch, endpoint, account, api_key, records, timeout, extra, attempts, logger, fields
+            )
+    metrics.cache_result("flowbiz_inflight", shared)
+    if not shared:
+        def forget(done: Future) -> None:
+            with _inflight_lock:
+                if _inflight.get(key) is done:
+                    del _inflight[key]
+        # Fora do lock: se já terminou, o callback roda aqui mesmo
+        future.add_done_callback(forget)
+    return future
+
+
+def fetch_all_accounts(
+    endpoint: str,
+    api_keys: Dict[str, str],
+    records: int,
+    timeout: float,
+    budget: Optional[float] = None,
+    extra: Optional[Dict[str, Any]] = None,
+    attempts: int = 1,
+    logger=None,
+    fields: Optional[List[str]] = None,
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], bool]:
+    """Busca campanhas de todas as contas em paralelo, respeitando `budget` (segundos).
+
+    Retorna (campanhas, status_por_conta, parcial). `status_por_conta` traz, para cada
+    origem, `Status` (ok, stale, timeout, error), `LatencyMs` e `DataAgeSeconds`.
+    Contas ainda em andamento continuam rodando em segundo plano e atualizam o
+    último resultado bom para as próximas chamadas. `fields` projeta as campanhas
+    de cada conta antes do cache e da união. As campanhas devolvidas são cópias: o
+    cache e as buscas compartilhadas entre requisições não mudam.
+    """
+    extra = dict(extra or {})
+    fields = list(fields) if fields is not None else None
+    started = time.monotonic()
+    futures = {
+        account: _shared_fetch(endpoint, account, key, records, timeout, extra, attempts, logger, fields)
+        for account, key in api_keys.items()
+    }
+    if futures:
+        wait(list(futures.values()), timeout=budget if budget and budget > 0 else None)
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+
+    merged: List[Dict[str, Any]] = []
+    accounts: List[Dict[str, Any]] = []
+    partial = False
+    for account, future in futures.items():
+        entry: Dict[str, Any] = {"Origin": origin_label(account)}
+        error = None
+        if future.done():
+            try:
+                campaigns, latency = future.result()
+                merged.extend(dict(c) for c in campaigns)
+                entry.update(Status="ok", LatencyMs=int(latency * 1000), DataAgeSeconds=0,
+                             Campaigns=len(campaigns))
+                accounts.append(entry)
+                # Toda conta é uma consulta ao último bom: respondeu a tempo, ele não foi usado
+                metrics.CACHE_REQUESTS.inc(cache="flowbiz_last_good", result="fresh")
+                continue
+            except Exception as exc:
+                error = str(exc)
+                entry.update(Status="error", LatencyMs=elapsed_ms, Error=error)
+        else:
+            entry.update(Status="timeout", LatencyMs=elapsed_ms)
+
+        partial = True
+        with _last_good_lock:
+            cached = _last_good.get(_cache_key(account, records, extra, fields))
+        metrics.cache_result("flowbiz_last_good", bool(cached))
+        if cached:
+            fetched_at, campaigns = cached
+            merged.extend(dict(c) for c in campaigns)
+            entry.update(Status="stale", DataAgeSeconds=int(time.time() - fetched_at),
+                         Campaigns=len(campaigns))
+        else:
+            entry.update(DataAgeSeconds=None, Campaigns=0)
+        accounts.append(entry)
+
+    if partial and logger:
+        logger.warning("Busca parcial de campanhas: %s", [a for a in accounts if a["Status"] != "ok"])
+    return merged, accounts, partial
+
+
+# Campos de controle da resposta Flowbiz: ficam no status de cada conta, não na união
+_CONTROL_FIELDS = ("Success", "ErrorCode", "ErrorText", "ErrorMessage")
+
+
+def _timed_call(call: Callable[[str, str], Tuple[Any, int]], account: str, api_key: str) -> Tuple[Any, int, float]:
+    started = time.monotonic()
+    payload, status = call(account, api_key)
+    return payload, status, time.monotonic() - started
+
+
+def call_accounts(
+    call: Callable[[str, str], Tuple[Any, int]],
+    api_keys: Dict[str, str],
+    budget: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """Roda `call(conta, chave) -> (resposta, status HTTP)` em todas as contas em paralelo.
+
+    Devolve, na ordem de `api_keys`, {"account", "payload", "http_status", "latency",
+    "error"}; contas que não terminam dentro de `budget` saem com `error="timeout"`.
+    """
+    started = time.monotonic()
+    futures = {account: _executor.submit(_timed_call, call, account, key) for account, key in api_keys.items()}
+    if futures:
+        wait(list(futures.values()), timeout=budget if budget and budget > 0 else None)
+    elapsed = time.monotonic() - started
+    results = []
+    for account, future in futures.items():
+        result: Dict[str, Any] = {"account": account, "payload": None, "http_status": None,
+                                  "latency": elapsed, "error": None}
+        if not future.done():
+            result["error"] = "timeout"
+        else:
+            try:
+                result["payload"], result["http_status"], result["latency"] = future.result()
+            except Exception as exc:
+                result["error"] = str(exc)
+        results.append(result)
+    return results
+
+
+def _flowbiz_error(payload: Any, http_status: Optional[int]) -> Optional[str]:
+    """Mensagem de erro de uma resposta Flowbiz, ou None se ela deu certo."""
+    if not isinstance(payload, dict) or "raw" in payload:
+        return f"HTTP {http_status}: resposta não é JSON"
+    if http_status is None or http_status >= 400 or str(payload.get("Success", True)).lower() in ("false", "0"):
+        detail = payload.get("error") or payload.get("ErrorText") or payload.get("ErrorMessage")
+        code = payload.get("ErrorCode")
+        return " ".join(str(p) for p in (f"HTTP {http_status}", f"ErrorCode {code}" if code else None, detail) if p)
+    return None
+
+
+def _as_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_account_results(results: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+    """Une as respostas de `call_accounts`; devolve (resposta, alguma conta deu certo).
+
+    Listas (e objetos isolados, como `List` de `List.Get`) viram uma lista só, com
+    `Origin` em cada item; campos `Total*` numéricos são somados; o resto fica em
+    `Accounts`, junto com status, latência e erro de cada conta.
+    """
+    merged: Dict[str, Any] = {}
+    accounts: List[Dict[str, Any]] = []
+    succeeded = 0
+    for result in results:
+        origin = origin_label(result["account"])
+        payload, http_status = result["payload"], result["http_status"]
+        entry: Dict[str, Any] = {"Origin": origin, "LatencyMs": int(result["latency"] * 1000),
+                                 "HttpStatus": http_status}
+        error = result["error"] or _flowbiz_error(payload, http_status)
+        if error:
+            entry.update(Status="timeout" if result["error"] == "timeout" else "error", Error=error)
+            accounts.append(entry)
+            continue
+        succeeded += 1
+        items = 0
+        for key, value in payload.items():
+            if key in _CONTROL_FIELDS:
+                continue
+            if isinstance(value, dict):
+                value = [value]
+            if isinstance(value, list):
+                merged.setdefault(key, []).extend(
+                    dict(item, Origin=origin) if isinstance(item, dict) else {"Value": item, "Origin": origin}
+                    for item in value
+                )
+                items += len(value)
+            elif key.startswith("Total") and _as_int(value) is not None:
+                merged[key] = merged.get(key, 0) + _as_int(value)
+            else:
+                entry.setdefault("Fields", {})[key] = value
+        entry.update(Status="ok", Items=items)
+        accounts.append(entry)
+    merged["Success"] = succeeded > 0
+    merged["Partial"] = succeeded < len(results)
+    merged["Accounts"] = accounts
+    return merged, succeeded > 0
@@ -0,0 +1,260 @@
+"""Recebimento de eventos do Flowbiz por webhook (envios, aberturas, cliques).
+
+Em vez de depender só da busca periódica de `Campaigns.Get`, o Flowbiz pode
+chamar `/api/webhooks/flowbiz` a cada evento. A requisição é validada (token ou
+assinatura HMAC-SHA256 do corpo), os eventos são normalizados e entram numa fila
+limitada; se a fila está cheia, a requisição inteira recebe 503 e o Flowbiz
+tenta de novo mais tarde.
+
+Uma thread esvazia a fila em lotes: descarta eventos repetidos (`EventID`),
+soma os contadores por campanha e aplica tudo de uma vez com
+`CampaignStore.apply_deltas` — uma versão nova do snapshot por lote, não por
+evento. Antes do primeiro snapshot não há onde somar: os eventos são contados
+como descartados (a primeira busca ao Flowbiz já os inclui).
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from flowbiz_fetch import origin_label
+
+# Tipo do evento (como vier, em minúsculas) -> tipo normalizado
+EVENT_TYPES = {
+    "open": "open", "opened": "open", "email.open": "open",
+    "click": "click", "clicked": "click", "link_click": "click", "email.click": "click",
+    "sent": "sent", "send": "sent", "delivered": "sent", "email.sent": "sent",
+}
+SIGNATURE_HEADERS = ("X-Flowbiz-Signature", "X-Hub-Signature-256")
+TIMESTAMP_HEADER = "X-Flowbiz-Timestamp"
+
+
+class WebhookError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def verify_request(secret: str, body: bytes, headers, token: Optional[str],
+                   tolerance: float = 300.0, now: Optional[float] = None) -> None:
+    """Aceita `?token=<segredo>` ou assinatura `sha256=<hex>` do corpo (com timestamp, se enviado).
+
+    Com `X-Flowbiz-Timestamp`, a assinatura cobre `"<timestamp>.<corpo>"` e pedidos
+    fora da janela de `tolerance` segundos são recusados (repetição de pedidos antigos).
+    """
+    signature = next((headers.get(h) for h in SIGNATURE_HEADERS if headers.get(h)), None)
+    if signature:
+        timestamp = headers.get(TIMESTAMP_HEADER)
+        signed = body
+        if timestamp:
+            try:
+                skew = abs((now if now is not None else time.time()) - float(timestamp))
+            except ValueError:
+                raise WebhookError("Invalid timestamp", 401)
+            if skew > tolerance:
+                raise WebhookError("Timestamp outside tolerance", 401)
+            signed = timestamp.encode("ascii") + b"." + body
+        expected = hmac.new(secret.encode("utf-8"), signed, hashlib.sha256).hexdigest()
+        given = signature.split("=", 1)[1] if signature.startswith("sha256=") else signature
+        if not hmac.compare_digest(expected, given.strip().lower()):
+            raise WebhookError("Invalid signature", 401)
+        return
+    if token and hmac.compare_digest(secret.encode("utf-8"), token.encode("utf-8")):
+        return
+    raise WebhookError("Missing or invalid webhook credentials", 401)
+
+
+def _first(raw: Dict[str, Any], *names: str) -> Any:
+    for name in names:
+        value = raw.get(name)
+        if value not in (None, ""):
+            return value
+    return None
+
+
+def normalize_event(raw: Any, default_origin: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Evento no formato interno ou None se não for de um tipo/campanha reconhecível."""
+    if not isinstance(raw, dict):
+        return None
+    kind = EVENT_TYPES.get(str(_first(raw, "Event", "EventType", "Type", "event", "type") or "").strip().lower())
+    campaign_id = _first(raw, "CampaignID", "campaign_id", "CampaignId")
+    origin = _first(raw, "Origin", "Account", "origin", "account") or default_origin
+    if kind is None or campaign_id is None or not origin:
+        return None
+    try:
+        count = max(1, int(_first(raw, "Count", "count") or 1))
+        campaign_id = int(str(campaign_id).strip())
+    except ValueError:
+        return None
+    unique = _first(raw, "Unique", "IsUnique", "unique")
+    return {
+        "type": kind,
+        # Aceita o nome da variável da conta (FLOWBIZ_API_KEY_Voxcall) ou o rótulo (Voxcall)
+        "key": f"{origin_label(str(origin).strip())}:{campaign_id}",
+        "subscriber": str(_first(raw, "SubscriberID", "EmailAddress", "subscriber_id", "email") or ""),
+        "event_id": str(_first(raw, "EventID", "event_id", "ID", "id") or ""),
+        "unique": None if unique is None else str(unique).strip().lower() in ("1", "true", "yes"),
+        "count": count,
+    }
+
+
+def events_from_payload(payload: Any) -> List[Any]:
+    """Lista de eventos de um corpo: objeto, lista ou {"events": [...]}."""
+    if isinstance(payload, list):
+        return payload
+    if isinstance(payload, dict):
+        for name in ("events", "Events"):
+            if isinstance(payload.get(name), list):
+                return payload[name]
+        return [payload]
+    return []
+
+
+class _BoundedSet:
+    """Conjunto com no máximo `size` itens (descarta os mais antigos)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._items: "OrderedDict[Any, None]" = OrderedDict()
+
+    def add(self, item) -> bool:
+        """True se o item é novo."""
+        if item in self._items:
+            self._items.move_to_end(item)
+            return False
+        self._items[item] = None
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+        return True
+
+
+class WebhookQueue:
+    """Fila limitada de eventos aplicada ao `CampaignStore` em lotes por uma thread."""
+
+    def __init__(self, store, max_size: int = 10000, batch_size: int = 1000,
+                 flush_seconds: float = 1.0, dedupe_size: int = 100000, logger=None):
+        self.store = store
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.logger = logger
+        self._events: deque = deque()
+        self._cond = threading.Condition()
+        self._seen_ids = _BoundedSet(dedupe_size)
+        self._clicked = _BoundedSet(dedupe_size)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self.stats = {"accepted": 0, "applied": 0, "duplicate": 0, "dropped": 0, "batches": 0}
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def offer(self, events: List[Dict[str, Any]]) -> bool:
+        """Enfileira todos os eventos ou nenhum (False se não cabem)."""
+        self._ensure_thread()
+        received_at = time.time()
+        with self._cond:
+            if len(self._events) + len(events) > self.max_size:
+                return False
+            for event in events:
+                event.setdefault("received_at", received_at)
+            self._events.extend(events)
+            self.stats["accepted"] += len(events)
+            self._cond.notify()
+        return True
+
+    def _ensure_thread(self) -> None:
+        # Uma thread por processo (criada depois do fork do gunicorn)
+        pid = os.getpid()
+        with self._cond:
+            if self._thread_pid == pid:
+                return
+            self._thread_pid = pid
+            self._thread = threading.Thread(target=self._run, name="flowbiz-webhooks", daemon=True)
+        self._thread.start()
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            while not self._events:
+                self._cond.wait()
+        # Junta o que chegar até `flush_seconds` (ou até encher o lote)
+        deadline = time.monotonic() + self.flush_seconds
+        with self._cond:
+            while len(self._events) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [self._events.popleft() for _ in range(min(self.batch_size, len(self._events)))]
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            try:
+                self.apply(batch)
+            except Exception as exc:
+                if self.logger:
+                    self.logger.exception("Erro aplicando lote de webhooks: %s", exc)
+
+    def deltas_for(self, batch: List[Dict[str, Any]], result: str = "applied") -> Dict[str, Dict[str, int]]:
+        """Somas por campanha de um lote, sem repetidos (`EventID`); `result` vai para a métrica."""
+        deltas: Dict[str, Dict[str, int]] = {}
+        for event in batch:
+            if event["event_id"] and not self._seen_ids.add(event["event_id"]):
+                self.stats["duplicate"] += 1
+                metrics.WEBHOOK_EVENTS.inc(event=event["type"], result="duplicate")
+                continue
+            if result == "dropped":
+                self.stats["dropped"] += 1
+                metrics.WEBHOOK_EVENTS.inc(event=event["type"], result="dropped")
+                continue
+            changes = deltas.setdefault(event["key"], {})
+            count = event["count"]
+            if event["type"] == "open":
+                changes["opens"] = changes.get("opens", 0) + count
+            elif event["type"] == "sent":
+                changes["sent"] = changes.get("sent", 0) + count
+            else:
+                changes["total_clicks"] = changes.get("total_clicks", 0) + count
+                unique = event["unique"]
+                if unique is None:
+                    # Sem a marcação do Flowbiz: primeiro clique do contato nesta campanha
+                    unique = bool(event["subscriber"]) and self._clicked.add((event["key"], event["subscriber"]))
+                if unique:
+                    changes["clicks"] = changes.get("clicks", 0) + 1
+            metrics.WEBHOOK_EVENTS.inc(event=event["type"], result=result)
+        return deltas
+
+    def apply(self, batch: List[Dict[str, Any]]) -> int:
+        # O lote vale como recebido no evento mais antigo: se algum chegou durante uma
+        # busca, o lote não é reaplicado sobre o resultado dela (ver `CampaignStore.publish`)
+        received_at = min((event.get("received_at") or time.time() for event in batch), default=None)
+        result = "applied" if self.store.accepts_deltas() else "dropped"
+        with metrics.timer(metrics.WEBHOOK_BATCH_SECONDS):
+            deltas = self.deltas_for(batch, result)
+            applied = self.store.apply_deltas(deltas, received_at=received_at)
+        self.stats["batches"] += 1
+        self.stats["applied"] += applied
+        if self.logger:
+            self.logger.debug("Webhooks: lote de %d eventos, %d somas aplicadas", len(batch), applied)
+        return applied
+
+    def status(self) -> Dict[str, Any]:
+        return dict(self.stats, queued=len(self._events), max_size=self.max_size)
+
+
+def parse_events(payload: Any, default_origin: Optional[str]) -> Tuple[List[Dict[str, Any]], int]:
+    """(eventos normalizados, quantos foram recusados) de um corpo de webhook."""
+    events, rejected = [], 0
+    for raw in events_from_payload(payload):
+        event = normalize_event(raw, default_origin)
+        if event is None:
+            rejected += 1
+            metrics.WEBHOOK_EVENTS.inc(event="unknown", result="rejected")
+        else:
+            events.append(event)
+    return events, rejected
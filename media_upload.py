@@ -0,0 +1,184 @@
+"""Upload de mídia em streaming: multipart do navegador -> `Media.Upload` do Flowbiz.
+
+A API Flowbiz recebe o arquivo em base64 no campo `MediaData` de um POST de
+formulário. Em vez de montar esse base64 num JSON (um terço maior e com o arquivo
+inteiro em memória várias vezes), `MediaUpload` lê o corpo multipart da
+requisição aos pedaços (`request.stream`), codifica cada pedaço em base64 e o
+repassa já no formato `application/x-www-form-urlencoded` para o Flowbiz.
+
+`MediaSize` só é conhecido no fim do arquivo; como a ordem dos campos do
+formulário não importa para a API, ele vai depois de `MediaData`.
+
+Modos: `stream` envia o corpo com `Transfer-Encoding: chunked` à medida que o
+arquivo chega; `spool` grava o corpo codificado num temporário em disco e envia com
+`Content-Length`, para servidores que não aceitam corpo chunked.
+
+Problemas do lado do cliente (multipart malformado ou truncado, conexão caída,
+arquivo grande demais) levantam `UploadError` e ficam em `MediaUpload.error`: no
+modo `stream` eles acontecem dentro do envio ao Flowbiz, e o chamador precisa
+distingui-los de uma falha do próprio Flowbiz.
+"""
+import base64
+import tempfile
+import time
+from typing import Any, Dict, Iterator, Optional
+from urllib.parse import quote_plus
+
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+COMMAND = "Media.Upload"
+READ_SIZE = 64 * 1024
+_MAX_FIELD_BYTES = 4096
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _form_value(value: Any) -> bytes:
+    return quote_plus(str(value)).encode("ascii")
+
+
+def _quote_base64(chunk: bytes) -> bytes:
+    # Só "+", "/" e "=" do alfabeto base64 precisam de escape no formulário
+    return chunk.replace(b"+", b"%2B").replace(b"/", b"%2F").replace(b"=", b"%3D")
+
+
+class MediaUpload:
+    """Um upload em andamento; `body()` gera o formulário para o Flowbiz."""
+
+    def __init__(self, stream, content_type: str, max_bytes: int, read_size: int = READ_SIZE):
+        mimetype, options = parse_options_header(content_type or "")
+        if mimetype != "multipart/form-data" or not options.get("boundary"):
+            raise UploadError("Expected multipart/form-data with a file part")
+        self._stream = stream
+        self._read_size = read_size
+        # Sem max_form_memory_size: ele limita o buffer de cada leitura, não o campo
+        # (o tamanho dos campos de texto é conferido em `_read_field`)
+        self._decoder = MultipartDecoder(options["boundary"].encode("latin-1"))
+        self.max_bytes = max_bytes
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_type: Optional[str] = None
+        self.received = 0  # bytes do arquivo
+        self.sent = 0  # bytes do corpo repassado ao Flowbiz
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.too_large = False
+        self.error: Optional[UploadError] = None  # falha do lado do cliente, se houve
+
+    def _fail(self, message: str, status: int = 400) -> UploadError:
+        self.error = UploadError(message, status)
+        return self.error
+
+    def _next_event(self):
+        while True:
+            try:
+                event = self._decoder.next_event()
+            except ValueError as exc:
+                # Inclui o corpo que acabou antes do fim do multipart
+                raise self._fail(f"Malformed or incomplete multipart body: {exc}") from exc
+            if not isinstance(event, NeedData):
+                return event
+            try:
+                chunk = self._stream.read(self._read_size)
+            except (ClientDisconnected, OSError) as exc:
+                raise self._fail("Client disconnected during upload") from exc
+            self._decoder.receive_data(chunk or None)
+
+    def _read_field(self, name: str) -> None:
+        value = b""
+        while True:
+            event = self._next_event()
+            if not isinstance(event, Data):
+                raise self._fail("Malformed multipart body")
+            value += event.data
+            if len(value) > _MAX_FIELD_BYTES:
+                raise self._fail(f"Field {name} too large")
+            if not event.more_data:
+                break
+        self.fields[name] = value.decode("utf-8", "replace")
+
+    def read_until_file(self) -> None:
+        """Lê os campos antes do arquivo; levanta `UploadError` se não houver arquivo."""
+        while True:
+            event = self._next_event()
+            if isinstance(event, Field):
+                self._read_field(event.name)
+            elif isinstance(event, File):
+                self.filename = event.filename or "upload"
+                self.file_type = event.headers.get("Content-Type") or "application/octet-stream"
+                return
+            elif isinstance(event, Epilogue):
+                raise self._fail("No file part in upload")
+
+    def _file_chunks(self) -> Iterator[bytes]:
+        while True:
+            event = self._next_event()
+            if not isinstance(event, Data):
+                raise self._fail("Malformed multipart body")
+            if event.data:
+                self.received += len(event.data)
+                if self.received > self.max_bytes:
+                    self.too_large = True
+                    raise self._fail(f"File exceeds {self.max_bytes} bytes", status=413)
+                yield event.data
+            if not event.more_data:
+                return
+
+    def body(self, params: Dict[str, Any]) -> Iterator[bytes]:
+        """Formulário urlencoded: `params`, campos do usuário, `MediaData` em base64 e `MediaSize`."""
+        self.started = time.perf_counter()
+        form = dict(params)
+        form["MediaName"] = self.fields.get("MediaName") or self.filename
+        form["MediaType"] = self.fields.get("MediaType") or self.file_type
+        head = b"&".join(_form_value(k) + b"=" + _form_value(v) for k, v in form.items())
+        yield self._count(head + b"&MediaData=")
+        carry = b""
+        for chunk in self._file_chunks():
+            data = carry + chunk
+            cut = len(data) - len(data) % 3  # base64 sem padding no meio do arquivo
+            carry = data[cut:]
+            if cut:
+                yield self._count(_quote_base64(base64.b64encode(data[:cut])))
+        if carry:
+            yield self._count(_quote_base64(base64.b64encode(carry)))
+        yield self._count(b"&MediaSize=" + str(self.received).encode("ascii"))
+        # Consumir o resto do multipart (epílogo); um segundo arquivo é erro
+        while True:
+            event = self._next_event()
+            if isinstance(event, Epilogue):
+                break
+            if isinstance(event, File):
+                raise self._fail("Only one file per upload")
+            if isinstance(event, Field):
+                self._read_field(event.name)
+        self.finished = time.perf_counter()
+
+    def _count(self, chunk: bytes) -> bytes:
+        self.sent += len(chunk)
+        return chunk
+
+    def spooled_body(self, params: Dict[str, Any]):
+        """Corpo completo num temporário (modo `spool`), posicionado no início."""
+        spool = tempfile.TemporaryFile()
+        for chunk in self.body(params):
+            spool.write(chunk)
+        spool.seek(0)
+        return spool
+
+    def stats(self, upstream_seconds: float) -> Dict[str, Any]:
+        """Tamanhos e vazão do upload (arquivo recebido do cliente até a resposta do Flowbiz)."""
+        elapsed = max(upstream_seconds, 1e-9)
+        return {
+            "FileName": self.filename,
+            "MediaType": self.fields.get("MediaType") or self.file_type,
+            "Bytes": self.received,
+            "EncodedBytes": self.sent,
+            "Seconds": round(upstream_seconds, 4),
+            "MBps": round(self.received / elapsed / (1024 * 1024), 3),
+        }
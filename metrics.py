@@ -0,0 +1,256 @@
+"""Métricas no formato texto do Prometheus, sem dependências externas.
+
+Os instrumentos (contadores e histogramas) ficam definidos aqui para que `app.py`
+e `dashboard_app.py` registrem nos mesmos nomes. A coleta só fica ativa depois
+do primeiro scrape em `/metrics` (ou com METRICS_ENABLED=1); até lá `timer()`
+devolve um objeto nulo e `inc()` retorna na primeira linha, de modo que o custo
+sem scraper é praticamente zero. METRICS_ENABLED=0 desativa de vez.
+
+Com vários workers (gunicorn), o primeiro scrape grava um arquivo-marcador
+(`METRICS_MARKER`; padrão no diretório temporário, um por processo mestre) e
+cada worker liga a coleta na próxima requisição que atender (`sync()`), sem
+esperar o scraper chegar até ele. O primeiro scrape ainda sai sem observações;
+para medir desde o início, use METRICS_ENABLED=1.
+"""
+import bisect
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+_mode = os.getenv("METRICS_ENABLED", "auto").strip().lower()
+_enabled = _mode in {"1", "true", "yes"}
+# Workers do mesmo gunicorn têm o mesmo processo pai
+_marker = os.getenv("METRICS_MARKER", "").strip() or os.path.join(
+    tempfile.gettempdir(), f"acompanhamento-disparos-metrics-{os.getppid()}.on")
+_MARKER_CHECK_SECONDS = 5.0
+_marker_checked = 0.0
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable() -> None:
+    """Liga a coleta (chamado no primeiro scrape, salvo METRICS_ENABLED=0) e avisa os outros workers."""
+    global _enabled
+    if _mode in {"0", "false", "no"}:
+        return
+    if not _enabled and _mode == "auto":
+        try:
+            with open(_marker, "a"):
+                pass
+        except OSError:
+            pass
+    _enabled = True
+
+
+def sync() -> bool:
+    """No modo auto, liga a coleta se outro worker já foi raspado (checa o marcador a cada 5s)."""
+    global _enabled, _marker_checked
+    if _enabled or _mode != "auto":
+        return _enabled
+    now = time.monotonic()
+    if now - _marker_checked >= _MARKER_CHECK_SECONDS:
+        _marker_checked = now
+        if os.path.exists(_marker):
+            _enabled = True
+    return _enabled
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not _enabled:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v:g}" for k, v in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # {labels: [contagens por bucket..., +Inf], soma}
+        self._series: Dict[Tuple, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        if not _enabled:
+            return
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][idx] += 1
+            series[1] += value
+
+    def time(self, **labels) -> "_Timer":
+        return timer(self, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._series.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                le_label = 'le="' + le + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total:g}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+# Recebe (histograma, rótulos, início, duração) de cada `timer()` enquanto houver um
+# perfil de requisição em andamento (`request_profile`); None no caso normal
+_timer_observer = None
+
+
+def set_timer_observer(observer) -> None:
+    global _timer_observer
+    _timer_observer = observer
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        elapsed = time.perf_counter() - self.started
+        self.histogram.observe(elapsed, **self.labels)
+        observer = _timer_observer
+        if observer is not None:
+            observer(self.histogram.name, self.labels, self.started, elapsed)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullTimer":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(histogram: Histogram, **labels):
+    """Context manager que observa a duração do bloco em `histogram`."""
+    if not _enabled and _timer_observer is None:
+        return _NULL_TIMER
+    return _Timer(histogram, labels)
+
+
+_registry: List = []
+
+
+def _register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render() -> str:
+    """Exposição completa no formato texto 0.0.4 do Prometheus."""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def cache_result(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+HTTP_REQUEST_SECONDS = _register(Histogram(
+    "http_request_duration_seconds", "Duração das requisições HTTP atendidas pelo Flask.",
+    ("endpoint", "method", "status")))
+FLOWBIZ_REQUEST_SECONDS = _register(Histogram(
+    "flowbiz_request_duration_seconds", "Latência das chamadas à API Flowbiz por comando e conta.",
+    ("command", "account")))
+FLOWBIZ_ERRORS = _register(Counter(
+    "flowbiz_request_errors_total", "Falhas nas chamadas à API Flowbiz por comando e conta.",
+    ("command", "account")))
+FLOWBIZ_RATE_LIMITED = _register(Counter(
+    "flowbiz_rate_limited_total", "Respostas 429/503 da API Flowbiz (a conta é pausada e a chamada repetida).",
+    ("command", "account")))
+WEBHOOK_EVENTS = _register(Counter(
+    "flowbiz_webhook_events_total", "Eventos recebidos por webhook, por tipo e destino (applied/duplicate/dropped/rejected).",
+    ("event", "result")))
+WEBHOOK_BATCH_SECONDS = _register(Histogram(
+    "flowbiz_webhook_batch_seconds", "Tempo para aplicar um lote de eventos de webhook ao snapshot."))
+DB_QUERY_SECONDS = _register(Histogram(
+    "db_query_duration_seconds", "Duração das consultas ao PostgreSQL (schema autobot).",
+    ("query",)))
+DB_ERRORS = _register(Counter(
+    "db_query_errors_total", "Falhas nas consultas ao PostgreSQL.", ("query",)))
+DB_TIMEOUTS = _register(Counter(
+    "db_query_timeouts_total", "Consultas canceladas por statement_timeout (contam também em db_query_errors_total).",
+    ("query",)))
+DATAFRAME_BUILD_SECONDS = _register(Histogram(
+    "dashboard_dataframe_build_seconds", "Tempo de campaigns_to_df no painel Dash."))
+FIGURE_RENDER_SECONDS = _register(Histogram(
+    "dashboard_figure_render_seconds", "Tempo de montagem das figuras plotly por callback.",
+    ("callback",)))
+JSON_ENCODE_SECONDS = _register(Histogram(
+    "json_encode_duration_seconds", "Tempo de serialização JSON das respostas.", ("endpoint",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)))
+CACHE_REQUESTS = _register(Counter(
+    "cache_requests_total", "Consultas a caches internos por resultado (hit/miss; fresh = o cache não foi necessário).",
+    ("cache", "result")))
+RESPONSE_BYTES = _register(Histogram(
+    "http_response_size_bytes", "Tamanho do corpo das respostas por endpoint e codificação.",
+    ("endpoint", "encoding"),
+    buckets=(512, 2048, 8192, 32768, 131072, 524288, 2097152, 8388608, 33554432)))
+COMPRESS_SECONDS = _register(Histogram(
+    "http_response_compress_seconds", "Tempo de compressão das respostas (gzip/brotli).", ("encoding",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)))
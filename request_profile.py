@@ -0,0 +1,353 @@
+"""Perfil opcional por requisição: tempo por fase, amostras de pilha e `Server-Timing`.
+
+Só com `PROFILE_TOKEN` definido e a requisição trazendo o mesmo token (cabeçalho
+`X-Profile-Token`, `?_profile=` ou o cookie `_profile`, gravado por
+`/api/profiles/enable` para perfilar os callbacks do Dash pelo navegador).
+
+As fases vêm dos `metrics.timer()` já espalhados pelo código (Flowbiz, banco,
+DataFrame, figuras, JSON, compressão) e de `phase()` nos trechos sem histograma
+(snapshot, ordenação, filtros). Enquanto nenhum perfil está em andamento,
+`phase()` devolve um objeto nulo e `metrics` não tem observador instalado, então
+o custo para as demais requisições é o de uma comparação.
+
+Com `X-Profile-Stack: 1` (ou `?_profile_stack=1` / cookie `_profile_stack`), uma
+thread amostra a pilha da requisição a cada `PROFILE_SAMPLE_MS` e o resultado
+sai no formato "folded" (flamegraph.pl, speedscope). Os perfis recentes ficam em
+memória (e em `PROFILE_DIR`, se definido, para qualquer worker servir) e são
+baixados por `/api/profiles/<id>`.
+
+Só a thread da requisição é observada: trabalho em pools (contas do Flowbiz em
+paralelo) aparece dentro da fase que o envolve.
+"""
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlencode
+
+from flask import Flask, g, request
+
+import metrics
+
+TOKEN_HEADER = "X-Profile-Token"
+STACK_HEADER = "X-Profile-Stack"
+TOKEN_PARAM = "_profile"
+STACK_PARAM = "_profile_stack"
+# Histogramas de `metrics` -> nome da fase
+PHASE_NAMES = {
+    metrics.FLOWBIZ_REQUEST_SECONDS.name: "flowbiz",
+    metrics.DB_QUERY_SECONDS.name: "db",
+    metrics.DATAFRAME_BUILD_SECONDS.name: "dataframe",
+    metrics.FIGURE_RENDER_SECONDS.name: "figures",
+    metrics.JSON_ENCODE_SECONDS.name: "json",
+    metrics.COMPRESS_SECONDS.name: "compress",
+}
+_MAX_STACK_DEPTH = 64
+_MAX_SAMPLES = 20000
+
+_current: ContextVar[Optional["RequestProfile"]] = ContextVar("request_profile", default=None)
+_active = 0  # perfis em andamento em todas as threads
+_active_lock = threading.Lock()
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, sample_interval: Optional[float] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.endpoint: Optional[str] = None
+        self.status: Optional[int] = None
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.total: Optional[float] = None
+        # (fase, detalhe, início relativo, duração, profundidade)
+        self.spans: List[tuple] = []
+        self._depth = 0
+        self.sample_interval = sample_interval
+        self.samples: Counter = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def add(self, name: str, detail: str, started: float, elapsed: float) -> None:
+        self.spans.append((name, detail, started - self._t0, elapsed, self._depth))
+
+    def start_sampler(self) -> None:
+        self._sampler = threading.Thread(target=self._sample, name=f"profile-{self.id}", daemon=True)
+        self._sampler.start()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                return
+            names = []
+            while frame is not None and len(names) < _MAX_STACK_DEPTH:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.samples[";".join(reversed(names))] += 1
+            if sum(self.samples.values()) >= _MAX_SAMPLES:
+                return
+
+    def finish(self) -> None:
+        self.total = time.perf_counter() - self._t0
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def phases(self) -> Dict[str, Dict[str, Any]]:
+        """Tempo e número de ocorrências por fase."""
+        out: Dict[str, Dict[str, Any]] = OrderedDict()
+        for name, _, _, elapsed, _ in self.spans:
+            row = out.setdefault(name, {"ms": 0.0, "count": 0})
+            row["ms"] += elapsed * 1000
+            row["count"] += 1
+        for row in out.values():
+            row["ms"] = round(row["ms"], 3)
+        return out
+
+    def other_ms(self) -> float:
+        """Tempo fora de qualquer fase de primeiro nível."""
+        covered = sum(elapsed for _, _, _, elapsed, depth in self.spans if depth == 0)
+        return max(0.0, ((self.total or 0.0) - covered) * 1000)
+
+    def server_timing(self) -> str:
+        parts = []
+        for name, row in self.phases().items():
+            part = f"{name};dur={row['ms']:.1f}"
+            if row["count"] > 1:
+                part += f';desc="{row["count"]}x"'
+            parts.append(part)
+        parts.append(f"other;dur={self.other_ms():.1f}")
+        parts.append(f"total;dur={(self.total or 0.0) * 1000:.1f}")
+        return ", ".join(parts)
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "Id": self.id,
+            "Method": self.method,
+            "Path": self.path,
+            "Endpoint": self.endpoint,
+            "Status": self.status,
+            "StartedAt": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(timespec="milliseconds"),
+            "TotalMs": round((self.total or 0.0) * 1000, 3),
+            "Phases": self.phases(),
+            "OtherMs": round(self.other_ms(), 3),
+            "Samples": sum(self.samples.values()),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        body = self.summary()
+        body["Spans"] = [
+            {"phase": name, "detail": detail, "start_ms": round(start * 1000, 3),
+             "ms": round(elapsed * 1000, 3), "depth": depth}
+            for name, detail, start, elapsed, depth in sorted(self.spans, key=lambda s: s[2])
+        ]
+        if self.sample_interval:
+            body["Stack"] = {
+                "IntervalMs": round(self.sample_interval * 1000, 3),
+                "Top": [[stack, count] for stack, count in self.samples.most_common(30)],
+            }
+        return body
+
+
+class _Phase:
+    __slots__ = ("profile", "name", "detail", "started")
+
+    def __init__(self, profile: RequestProfile, name: str, detail: str):
+        self.profile = profile
+        self.name = name
+        self.detail = detail
+        self.started = 0.0
+
+    def __enter__(self) -> "_Phase":
+        self.started = time.perf_counter()
+        self.profile._depth += 1
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.profile._depth -= 1
+        self.profile.add(self.name, self.detail, self.started, time.perf_counter() - self.started)
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullPhase":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+
+_NULL_PHASE = _NullPhase()
+
+
+def phase(name: str, detail: str = ""):
+    """Context manager que registra o bloco como fase do perfil da requisição atual (se houver)."""
+    if not _active:
+        return _NULL_PHASE
+    profile = _current.get()
+    if profile is None:
+        return _NULL_PHASE
+    return _Phase(profile, name, detail)
+
+
+def _observe_timer(histogram_name: str, labels: Dict[str, Any], started: float, elapsed: float) -> None:
+    profile = _current.get()
+    if profile is not None:
+        profile.add(PHASE_NAMES.get(histogram_name, histogram_name),
+                    ",".join(str(v) for v in labels.values()), started, elapsed)
+
+
+def _activate(profile: RequestProfile):
+    global _active
+    with _active_lock:
+        _active += 1
+        if _active == 1:
+            metrics.set_timer_observer(_observe_timer)
+    return _current.set(profile)
+
+
+def _deactivate(token) -> None:
+    global _active
+    _current.reset(token)
+    with _active_lock:
+        _active -= 1
+        if _active == 0:
+            metrics.set_timer_observer(None)
+
+
+class ProfileStore:
+    """Perfis mais recentes (em memória e, com `directory`, em arquivos JSON)."""
+
+    def __init__(self, keep: int = 50, directory: Optional[str] = None):
+        self.keep = keep
+        self.directory = directory
+        self._items: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def add(self, profile: RequestProfile) -> None:
+        record = dict(profile.to_dict(), Folded=profile.folded())
+        with self._lock:
+            self._items[profile.id] = record
+            while len(self._items) > self.keep:
+                self._items.popitem(last=False)
+        if self.directory:
+            path = os.path.join(self.directory, f"{profile.id}.json")
+            with open(path + ".tmp", "w", encoding="utf-8") as fh:
+                json.dump(record, fh, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+            self._prune()
+
+    def _files(self) -> List[str]:
+        names = [n for n in os.listdir(self.directory) if n.endswith(".json")]
+        return sorted(names, key=lambda n: os.path.getmtime(os.path.join(self.directory, n)), reverse=True)
+
+    def _prune(self) -> None:
+        for name in self._files()[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            found = self._items.get(profile_id)
+        if found is not None or not self.directory or not profile_id.isalnum():
+            return found
+        try:
+            with open(os.path.join(self.directory, f"{profile_id}.json"), encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def recent(self) -> List[Dict[str, Any]]:
+        """Resumos, do mais novo para o mais antigo."""
+        if self.directory:
+            records = [self.get(name[:-5]) for name in self._files()]
+        else:
+            with self._lock:
+                records = list(reversed(self._items.values()))
+        drop = ("Spans", "Stack", "Folded")
+        return [{k: v for k, v in r.items() if k not in drop} for r in records if r]
+
+
+def is_admin(app: Flask) -> bool:
+    """A requisição traz o `PROFILE_TOKEN` (cabeçalho, query ou cookie)?"""
+    expected = app.config.get("PROFILE_TOKEN")
+    if not expected:
+        return False
+    given = (request.headers.get(TOKEN_HEADER) or request.args.get(TOKEN_PARAM)
+             or request.cookies.get(TOKEN_PARAM))
+    return bool(given) and hmac.compare_digest(expected.encode("utf-8"), given.encode("utf-8"))
+
+
+def _wants_stack() -> bool:
+    value = (request.headers.get(STACK_HEADER) or request.args.get(STACK_PARAM)
+             or request.cookies.get(STACK_PARAM) or "")
+    return value.strip().lower() in ("1", "true", "yes")
+
+
+def _profile_path() -> str:
+    """Caminho e query da requisição sem os parâmetros de perfil (o token não vai para os perfis)."""
+    args = [(k, v) for k, v in request.args.items(multi=True) if k not in (TOKEN_PARAM, STACK_PARAM)]
+    return f"{request.path}?{urlencode(args)}" if args else request.path
+
+
+def init_profiling(app: Flask) -> None:
+    """Registra os ganchos de perfil; sem `PROFILE_TOKEN`, não registra nada.
+
+    Chamar antes dos demais `after_request` (métricas, compressão): o Flask os roda
+    na ordem inversa, e o perfil precisa fechar por último.
+    """
+    if not app.config.get("PROFILE_TOKEN"):
+        return
+    store = app.extensions["request_profiles"]
+    sample_interval = app.config.get("PROFILE_SAMPLE_MS", 5.0) / 1000.0
+
+    @app.before_request
+    def _profile_start() -> None:
+        if request.path.startswith("/api/profiles") or not is_admin(app):
+            return
+        profile = RequestProfile(request.method, _profile_path(),
+                                 sample_interval if _wants_stack() else None)
+        g.request_profile = (profile, _activate(profile))
+        if profile.sample_interval:
+            profile.start_sampler()
+
+    @app.after_request
+    def _profile_finish(response):
+        started = g.pop("request_profile", None)
+        if started is None:
+            return response
+        profile, token = started
+        profile.endpoint = request.endpoint
+        profile.status = response.status_code
+        profile.finish()
+        _deactivate(token)
+        store.add(profile)
+        response.headers["Server-Timing"] = profile.server_timing()
+        response.headers["X-Profile-Id"] = profile.id
+        return response
+
+    @app.teardown_request
+    def _profile_abort(exc) -> None:
+        # Exceção sem resposta: liberar o perfil sem guardar
+        started = g.pop("request_profile", None)
+        if started is not None:
+            started[0].finish()
+            _deactivate(started[1])
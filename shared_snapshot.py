@@ -0,0 +1,169 @@
+"""Snapshot do catálogo compartilhado entre workers (arquivo mapeado em memória).
+
+Com vários workers (gunicorn), só um deles — o que segura o `flock` do arquivo
+`<caminho>.lock` — busca o Flowbiz/Postgres e grava o snapshot. Os demais leem o
+arquivo com `mmap`: as colunas numéricas do `CampaignTable` apontam direto para
+as páginas do arquivo (compartilhadas pelo kernel entre os processos), sem cópia.
+
+O arquivo é sempre regravado por inteiro num temporário e trocado com
+`os.replace`, então um leitor nunca vê uma gravação pela metade; mapas antigos
+continuam válidos até serem descartados. Se o líder morrer, o lock é liberado e
+o próximo worker que tentar assume a renovação.
+
+Somas de contadores recebidas por workers que não são o líder (webhooks) vão
+para `<caminho>.deltas`, uma linha JSON por lote; o líder as aplica e grava o
+snapshot.
+
+Formato: `CSNAP001`, versão (u64), tamanho do cabeçalho (u64), cabeçalho JSON
+(alinhado em 8 bytes) e as colunas gravadas por `CampaignTable.dump()`.
+"""
+import io
+import json
+import mmap
+import os
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+from campaign_records import CampaignTable
+from campaign_store import CampaignSnapshot
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAGIC = b"CSNAP001"
+_PREFIX = struct.Struct("<8sQQ")
+
+
+class SharedSnapshot:
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._lock_path = self.path + ".lock"
+        self._deltas_path = self.path + ".deltas"
+        self._lock_fh = None
+        self._lock_pid: Optional[int] = None
+        self._seen: Optional[Tuple[int, int, int]] = None
+
+    @property
+    def is_leader(self) -> bool:
+        # O lock herdado num fork não vale para o filho
+        return self._lock_fh is not None and self._lock_pid == os.getpid()
+
+    def try_lead(self) -> bool:
+        """Tenta virar o renovador (não bloqueia). Sem `fcntl`, cada processo renova o seu."""
+        if self.is_leader:
+            return True
+        if fcntl is None:
+            return False
+        fh = open(self._lock_path, "a+")
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        fh.seek(0)
+        fh.truncate()
+        fh.write(str(os.getpid()))
+        fh.flush()
+        self._lock_fh, self._lock_pid = fh, os.getpid()
+        return True
+
+    @property
+    def electable(self) -> bool:
+        return fcntl is not None
+
+    def write(self, snap: CampaignSnapshot) -> None:
+        data = io.BytesIO()
+        layout = snap.table.dump(data)
+        header = json.dumps({
+            "version": snap.version,
+            "built_at": snap.built_at,
+            "changed_at": snap.changed_at,
+            "partial": snap.partial,
+            "accounts": snap.accounts,
+            "fingerprint": snap.fingerprint,
+            "kpis": snap.kpis,
+            "parent_version": snap.parent_version,
+            "changed_keys": snap.changed_keys,
+            "table": layout,
+            "writer_pid": os.getpid(),
+        }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        header += b" " * ((-len(header)) % 8)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(_PREFIX.pack(MAGIC, snap.version, len(header)))
+            fh.write(header)
+            fh.write(data.getbuffer())
+        os.replace(tmp, self.path)
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def changed(self) -> bool:
+        """True se há um arquivo diferente do último carregado."""
+        current = self._stat()
+        return current is not None and current != self._seen
+
+    def load(self) -> Optional[CampaignSnapshot]:
+        """Mapeia o arquivo atual e devolve o snapshot (None se ainda não existe ou é inválido)."""
+        try:
+            with open(self.path, "rb") as fh:
+                st = os.fstat(fh.fileno())
+                mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        magic, version, header_len = _PREFIX.unpack_from(mm, 0)
+        if magic != MAGIC:
+            return None
+        start = _PREFIX.size
+        header: Dict[str, Any] = json.loads(bytes(mm[start:start + header_len]))
+        table = CampaignTable.from_buffer(memoryview(mm)[start + header_len:], header["table"])
+        snap = CampaignSnapshot(version, table, header["accounts"], header["partial"], header["fingerprint"],
+                                kpis=header["kpis"])
+        snap.built_at = header["built_at"]
+        snap.changed_at = header["changed_at"]
+        snap.parent_version = header.get("parent_version")
+        snap.changed_keys = header.get("changed_keys")
+        self._seen = (st.st_ino, st.st_mtime_ns, st.st_size)
+        return snap
+
+    def append_deltas(self, deltas: Dict[str, Dict[str, int]], received_at: Optional[float] = None) -> None:
+        """Registra um lote de somas (e quando os eventos chegaram) para o líder aplicar."""
+        record = {"received_at": received_at, "deltas": deltas}
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with open(self._deltas_path, "ab") as fh:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            fh.write(line)
+
+    def take_deltas(self) -> List[Tuple[Optional[float], Dict[str, Dict[str, int]]]]:
+        """Lê e esvazia o arquivo de somas (usado pelo líder): [(recebidas em, deltas)]."""
+        try:
+            fh = open(self._deltas_path, "r+b")
+        except FileNotFoundError:
+            return []
+        with fh:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+            raw = fh.read()
+            if not raw:
+                return []
+            fh.seek(0)
+            fh.truncate()
+        batches = []
+        for line in raw.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "deltas" in record:
+                batches.append((record.get("received_at"), record["deltas"]))
+            else:
+                # Linha sem o instante de chegada (formato anterior)
+                batches.append((None, record))
+        return batches
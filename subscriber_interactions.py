@@ -0,0 +1,336 @@
+"""Interações de muitos contatos de uma vez (`Subscriber.Interactions` em lote).
+
+A API Flowbiz só devolve as interações de um contato por chamada. `InteractionBatch`
+recebe uma lista de contatos (IDs ou e-mails) ou um `ListID` — paginado com
+`Subscribers.Get` — e faz as chamadas em paralelo, devolvendo cada resultado
+assim que chega (NDJSON, uma linha por evento).
+
+Cada conta tem um `AccountLimiter` comum a todos os lotes do processo: limita as
+chamadas simultâneas e, quando a API responde 429/503, pausa a conta inteira pelo
+`Retry-After` (ou backoff exponencial) e reduz o paralelismo antes de tentar de novo.
+
+Retomada: de tempos em tempos sai uma linha `checkpoint` com `cursor` (quantos
+itens, na ordem de entrada, já foram concluídos sem lacunas) e `resume`, um token
+opaco. Reenviar o mesmo pedido com `resume` continua do cursor; itens concluídos
+depois do cursor podem ser entregues de novo (pelo menos uma vez).
+"""
+import base64
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+import metrics
+
+COMMAND = "Subscriber.Interactions"
+RATE_LIMIT_STATUSES = (429, 503)
+
+
+class RateLimited(Exception):
+    def __init__(self, status: int, retry_after: Optional[float]):
+        super().__init__(f"HTTP {status}")
+        self.retry_after = retry_after
+
+
+class AccountLimiter:
+    """Chamadas simultâneas por conta, intervalo mínimo entre elas e pausa comum após 429.
+
+    O limite efetivo se adapta: cai pela metade a cada 429 e volta a subir de um
+    em um conforme as chamadas passam, até `concurrency`. Acima do último limite
+    que levou a um 429 ele sobe bem mais devagar, para não pagar uma pausa a cada
+    poucas chamadas.
+    """
+
+    # Sucessos seguidos (por unidade de limite) para passar do último teto
+    PROBE_FACTOR = 50
+
+    def __init__(self, concurrency: int, min_interval: float = 0.0):
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.limit = concurrency
+        self._ceiling = concurrency
+        self._active = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+        self._paused_until = 0.0
+        self._next_start = 0.0
+
+    def throttled(self, seconds: float) -> None:
+        """Resposta 429/503: pausa a conta e reduz o limite (uma vez por pausa)."""
+        with self._cond:
+            now = time.monotonic()
+            if now >= self._paused_until:
+                self._ceiling = max(1, self.limit - 1)
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            self._paused_until = max(self._paused_until, now + seconds)
+
+    def succeeded(self) -> None:
+        with self._cond:
+            self._successes += 1
+            needed = self.limit if self.limit < self._ceiling else self.limit * self.PROBE_FACTOR
+            if self.limit < self.concurrency and self._successes >= needed:
+                self.limit += 1
+                self._successes = 0
+                self._cond.notify()
+
+    @property
+    def paused_for(self) -> float:
+        return max(0.0, self._paused_until - time.monotonic())
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                start = max(now, self._paused_until, self._next_start)
+                if self._active < self.limit and start <= now:
+                    break
+                self._cond.wait(timeout=min(start - now, 1.0) if start > now else 1.0)
+            self._active += 1
+            self._next_start = now + self.min_interval
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify()
+
+
+_limiters: Dict[str, AccountLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(account: str, concurrency: int, min_interval: float = 0.0) -> AccountLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(account)
+        if limiter is None or limiter.concurrency != concurrency or limiter.min_interval != min_interval:
+            limiter = _limiters[account] = AccountLimiter(concurrency, min_interval)
+        return limiter
+
+
+def _retry_after(response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+
+def subscriber_params(item: Any) -> Dict[str, str]:
+    """Parâmetros de um contato: dict com SubscriberID/EmailAddress, e-mail ou ID."""
+    if isinstance(item, dict):
+        return {k: str(item[k]) for k in ("SubscriberID", "EmailAddress") if item.get(k) not in (None, "")}
+    text = str(item).strip()
+    if "@" in text:
+        return {"EmailAddress": text}
+    return {"SubscriberID": text} if text else {}
+
+
+class InteractionBatch:
+    """Um lote de `Subscriber.Interactions` para uma conta; `stream()` gera os eventos."""
+
+    def __init__(self, endpoint: str, account: str, api_key: str, timeout: float, limiter: AccountLimiter,
+                 subscribers: Optional[List[Any]] = None, list_id: Optional[str] = None,
+                 concurrency: Optional[int] = None, cursor: int = 0, checkpoint_every: int = 100, page_size: int = 500,
+                 attempts: int = 3, max_rate_waits: int = 8, segment: str = "Active", logger=None):
+        self.endpoint = endpoint
+        self.account = account
+        self.api_key = api_key
+        self.timeout = timeout
+        self.limiter = limiter
+        # Chamadas deste lote em paralelo (nunca acima do limite da conta)
+        self.concurrency = min(concurrency or limiter.concurrency, limiter.concurrency)
+        self.subscribers = subscribers
+        self.list_id = str(list_id) if list_id not in (None, "") else None
+        self.cursor = cursor
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.page_size = page_size
+        self.attempts = attempts
+        self.max_rate_waits = max_rate_waits
+        self.segment = segment
+        self.logger = logger
+        self.rate_limited = 0
+        self._http = requests.Session()
+        pool_size = max(10, self.concurrency)
+        self._http.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+        self._http.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=pool_size))
+
+    # --- Retomada ------------------------------------------------------------------
+
+    @property
+    def source_id(self) -> str:
+        """Identifica a entrada, para um token de retomada não ser aplicado a outro lote."""
+        if self.subscribers is not None:
+            raw = json.dumps(self.subscribers, sort_keys=True, ensure_ascii=False)
+        else:
+            raw = f"list:{self.list_id}"
+        return hashlib.sha1(f"{self.account}|{raw}".encode("utf-8")).hexdigest()[:16]
+
+    def resume_token(self, cursor: int) -> str:
+        raw = json.dumps({"source": self.source_id, "cursor": cursor}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def cursor_from_token(self, token: str) -> int:
+        """Cursor de um token de `resume_token`; ValueError se inválido ou de outro lote."""
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+            cursor = int(data["cursor"])
+        except (ValueError, KeyError, TypeError) as exc:
+            raise ValueError("Invalid resume token") from exc
+        if data.get("source") != self.source_id or cursor < 0:
+            raise ValueError("Resume token belongs to a different batch")
+        return cursor
+
+    # --- Chamadas à API ------------------------------------------------------------
+
+    def _post(self, command: str, params: Dict[str, str]) -> Dict[str, Any]:
+        payload = {"APIKey": self.api_key, "Command": command, "ResponseFormat": "JSON"}
+        payload.update(params)
+        rate_waits = 0
+        backoff = 1.0
+        attempt = 0
+        while True:
+            try:
+                with self.limiter.slot():
+                    with metrics.timer(metrics.FLOWBIZ_REQUEST_SECONDS, command=command, account=self.account):
+                        res = self._http.post(self.endpoint, data=payload, timeout=self.timeout)
+                if res.status_code in RATE_LIMIT_STATUSES:
+                    raise RateLimited(res.status_code, _retry_after(res))
+                if res.status_code != 200:
+                    raise RuntimeError(f"HTTP {res.status_code}")
+                self.limiter.succeeded()
+                return res.json()
+            except RateLimited as exc:
+                # Não conta como tentativa: a conta inteira espera e tenta de novo
+                metrics.FLOWBIZ_RATE_LIMITED.inc(command=command, account=self.account)
+                self.rate_limited += 1
+                rate_waits += 1
+                if rate_waits > self.max_rate_waits:
+                    raise
+                self.limiter.throttled(exc.retry_after if exc.retry_after is not None else backoff)
+                backoff = min(backoff * 2, 60.0)
+            except Exception as exc:
+                metrics.FLOWBIZ_ERRORS.inc(command=command, account=self.account)
+                attempt += 1
+                if attempt >= self.attempts:
+                    raise
+                if self.logger:
+                    self.logger.warning("Erro em %s (%s, tentativa %d): %s", command, self.account, attempt, exc)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+
+    def _fetch_one(self, index: int, item: Any) -> Dict[str, Any]:
+        params = subscriber_params(item)
+        started = time.perf_counter()
+        if not params:
+            return {"type": "error", "index": index, "subscriber": item, "error": "Empty subscriber"}
+        if self.list_id:
+            params["ListID"] = self.list_id
+        try:
+            data = self._post(COMMAND, params)
+        except Exception as exc:
+            return {"type": "error", "index": index, "subscriber": item, "error": str(exc),
+                    "ms": round((time.perf_counter() - started) * 1000, 1)}
+        event = {"type": "result", "index": index, "subscriber": item,
+                 "ms": round((time.perf_counter() - started) * 1000, 1)}
+        if isinstance(data, dict) and data.get("Success") is False:
+            event.update(type="error", error=data.get("ErrorText") or f"ErrorCode {data.get('ErrorCode')}")
+        else:
+            event["data"] = data
+        return event
+
+    def _items(self) -> Iterator[Tuple[int, Any]]:
+        """(índice, contato) a partir do cursor; a lista do Flowbiz é paginada sob demanda."""
+        if self.subscribers is not None:
+            for index in range(self.cursor, len(self.subscribers)):
+                yield index, self.subscribers[index]
+            return
+        start = self.cursor
+        while True:
+            data = self._post("Subscribers.Get", {
+                "SubscriberListID": self.list_id,
+                "SubscriberSegment": self.segment,
+                "RecordsFrom": str(start),
+                "RecordsPerRequest": str(self.page_size),
+                # Ordem estável: o cursor precisa apontar sempre para o mesmo contato
+                "OrderField": "SubscriberID",
+                "OrderType": "ASC",
+            })
+            if isinstance(data, dict) and data.get("Success") is False:
+                raise RuntimeError(data.get("ErrorText") or f"ErrorCode {data.get('ErrorCode')}")
+            page = (data.get("Subscribers") if isinstance(data, dict) else None) or []
+            for offset, sub in enumerate(page):
+                yield start + offset, {k: sub.get(k) for k in ("SubscriberID", "EmailAddress") if sub.get(k)}
+            if len(page) < self.page_size:
+                return
+            start += len(page)
+
+    def total(self) -> Optional[int]:
+        return len(self.subscribers) if self.subscribers is not None else None
+
+    # --- Stream --------------------------------------------------------------------
+
+    def stream(self) -> Iterator[Dict[str, Any]]:
+        started = time.perf_counter()
+        yield {"type": "start", "account": self.account, "list_id": self.list_id, "total": self.total(),
+               "cursor": self.cursor, "concurrency": self.concurrency}
+        done: set = set()
+        cursor = self.cursor
+        last_checkpoint = cursor
+        processed = errors = 0
+        source_error = None
+        items = self._items()
+        exhausted = False
+        window = self.concurrency * 4
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="subscriber-batch")
+        pending: set = set()
+        try:
+            while True:
+                while not exhausted and len(pending) < window:
+                    try:
+                        index, item = next(items)
+                    except StopIteration:
+                        exhausted = True
+                    except Exception as exc:
+                        exhausted = True
+                        source_error = str(exc)
+                    else:
+                        pending.add(pool.submit(self._fetch_one, index, item))
+                if not pending:
+                    break
+                finished, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    event = future.result()
+                    processed += 1
+                    errors += event["type"] == "error"
+                    done.add(event["index"])
+                    yield event
+                while cursor in done:
+                    done.discard(cursor)
+                    cursor += 1
+                if cursor - last_checkpoint >= self.checkpoint_every:
+                    last_checkpoint = cursor
+                    yield {"type": "checkpoint", "cursor": cursor, "resume": self.resume_token(cursor)}
+        finally:
+            # Cliente desconectou ou terminou: nada mais na fila
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=False)
+            self._http.close()
+        end = {"type": "end", "processed": processed, "errors": errors, "rate_limited": self.rate_limited,
+               "cursor": cursor, "resume": self.resume_token(cursor),
+               "elapsed_s": round(time.perf_counter() - started, 3)}
+        if source_error:
+            end["source_error"] = source_error
+        yield end
+
+
+def ndjson(events: Iterator[Dict[str, Any]]) -> Iterator[str]:
+    for event in events:
+        yield json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"